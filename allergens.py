@@ -0,0 +1,110 @@
+#contains the rule based allergen/diet classifier for ingredient names
+import re
+from bisect import bisect_right
+from ingredient_matching import normalize_name
+
+# Terms are written the way normalize_name() leaves them (lower case, singular)
+MEAT_TERMS = [
+    "meat", "beef", "steak", "veal", "pork", "bacon", "ham", "prosciutto", "pancetta", "sausage",
+    "chorizo", "salami", "pepperoni", "lamb", "mutton", "venison", "chicken", "turkey", "duck",
+    "goose", "quail", "meatball", "hot dog", "gelatin", "lard", "fish", "anchovy", "salmon", "tuna",
+    "cod", "tilapia", "trout", "halibut", "sardine", "mackerel", "shrimp", "prawn", "crab", "lobster",
+    "scallop", "clam", "mussel", "oyster", "squid", "calamari", "octopus", "worcestershire"
+]
+GLUTEN_TERMS = [
+    "wheat", "flour", "bread", "breadcrumb", "panko", "pasta", "spaghetti", "penne", "macaroni",
+    "linguine", "fettuccine", "lasagna", "noodle", "couscous", "bulgur", "farro", "semolina", "spelt",
+    "barley", "rye", "malt", "seitan", "cracker", "tortilla", "pita", "bagel", "croissant", "biscuit",
+    "cake", "cookie", "pastry", "pie crust", "dough", "bun", "beer", "soy sauce", "teriyaki", "orzo",
+    "udon", "ramen", "gnocchi", "dumpling", "wonton", "graham", "cereal", "pancake", "waffle",
+    "pizza", "muffin", "pretzel", "crouton"
+]
+NUT_TERMS = [
+    "nut", "almond", "walnut", "pecan", "cashew", "pistachio", "hazelnut", "macadamia", "peanut",
+    "chestnut", "praline", "marzipan", "nutella", "pesto"
+]
+
+# Phrases that contain a term above without containing the allergen
+MEAT_EXCEPTIONS = ["oyster mushroom"]
+GLUTEN_EXCEPTIONS = [
+    "rice flour", "almond flour", "coconut flour", "corn flour", "chickpea flour", "tapioca flour",
+    "potato flour", "oat flour", "rice noodle", "glass noodle", "corn tortilla", "tamari", "rice cake"
+]
+NUT_EXCEPTIONS = ["water chestnut"]
+
+# Words that mark the whole ingredient as free of the allergen ("vegan sausage")
+NOT_MEAT = ["vegan", "vegetarian", "veggie", "meatless", "plant based"]
+NOT_GLUTEN = ["gluten free"]
+NOT_NUTS = ["nut free"]
+
+
+def _pattern(terms):
+    terms = sorted({normalize_name(term) for term in terms}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")\b")
+
+
+# flag -> (terms, exceptions removed before matching, words that clear the flag)
+_RULES = {
+    "contains_nuts": (_pattern(NUT_TERMS), _pattern(NUT_EXCEPTIONS), _pattern(NOT_NUTS)),
+    "contains_gluten": (_pattern(GLUTEN_TERMS), _pattern(GLUTEN_EXCEPTIONS), _pattern(NOT_GLUTEN)),
+    "contains_meat": (_pattern(MEAT_TERMS), _pattern(MEAT_EXCEPTIONS), _pattern(NOT_MEAT))
+}
+
+
+def classify(name):
+    """
+    Return {"contains_nuts", "contains_gluten", "contains_meat"} for one ingredient name.
+    An exception phrase is removed before the terms are matched, so "rice flour"
+    is not gluten but "rice and wheat flour" still is.
+    """
+    text = normalize_name(name)
+    flags = {}
+    for flag, (terms, exceptions, free_of) in _RULES.items():
+        if free_of.search(text):
+            flags[flag] = False
+        else:
+            flags[flag] = terms.search(exceptions.sub(" ", text)) is not None
+    return flags
+
+
+def classify_many(names):
+    """
+    classify() for each name, in order.
+    The normalized names are joined one per line and each pattern runs once
+    over the whole batch; normalized names never contain a newline, and \b
+    treats it like the start or end of a name, so the result is the same.
+    """
+    texts = [normalize_name(name) for name in names]
+    classified = [{} for _ in texts]
+    if not texts:
+        return classified
+    joined = "\n".join(texts)
+    for flag, (terms, exceptions, free_of) in _RULES.items():
+        cleared = _lines_matched(free_of, joined)
+        # Replacing exception phrases with a space keeps every name on its own line
+        found = _lines_matched(terms, exceptions.sub(" ", joined))
+        for i, flags in enumerate(classified):
+            flags[flag] = i in found and i not in cleared
+    return classified
+
+
+def _lines_matched(pattern, text):
+    """Indexes of the lines of text that pattern matches somewhere in"""
+    starts = [0] + [match.end() for match in re.finditer("\n", text)]
+    return {bisect_right(starts, match.start()) - 1 for match in pattern.finditer(text)}
+
+
+def recipe_flags(ingredient_names, is_vegetarian, is_gluten_free, is_nut_free):
+    """
+    Combine the diet flags claimed for a recipe with what its ingredients contain.
+    A flag can only be cleared here, never set: the recipe may use ingredients
+    (e.g. ones the user is missing) that are not in the list.
+    Returns:
+        tuple: (is_vegetarian, is_gluten_free, is_nut_free)
+    """
+    classified = classify_many(ingredient_names)
+    return (
+        bool(is_vegetarian) and not any(flags["contains_meat"] for flags in classified),
+        bool(is_gluten_free) and not any(flags["contains_gluten"] for flags in classified),
+        bool(is_nut_free) and not any(flags["contains_nuts"] for flags in classified)
+    )
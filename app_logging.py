@@ -0,0 +1,150 @@
+#contains the structured logging setup: JSON lines written by a background thread, request ids and debug sampling
+#
+# Every module logs through logging.getLogger(__name__). setup_logging() routes all
+# records through a queue, so a request thread only pays for putting the record on
+# the queue; a listener thread formats and writes them.
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from flask import g, has_app_context, request
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# Per-logger levels, e.g. "recipe=DEBUG,openai_client=WARNING"
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+# Keep 1 in every LOG_DEBUG_SAMPLE DEBUG records per log call site (1 keeps all)
+LOG_DEBUG_SAMPLE = int(os.environ.get("LOG_DEBUG_SAMPLE", 100))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+# Attributes every LogRecord has; anything else was passed with extra= and is logged as a field
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime", "request_id"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request_id, extra= fields and the traceback"""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None)
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Tags each record with the id of the request being served (None outside a request)"""
+
+    def filter(self, record):
+        record.request_id = g.get("request_id") if has_app_context() else None
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """
+    Lets through 1 in every `every` DEBUG records per call site (logger and
+    message template), starting with the first. Other levels always pass.
+    """
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(every, 1)
+        self._lock = threading.Lock()
+        self._seen = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        return seen % self.every == 0
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for an in-process queue: the message is rendered here (its
+    arguments may change after the call returns), but the traceback is left
+    for the listener thread to format.
+    """
+
+    def prepare(self, record):
+        message = record.getMessage()
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.args = message, None
+        return record
+
+
+def setup_logging(stream=None):
+    """Install the queue handler on the root logger and start the writer thread (once per process)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+        records = queue.SimpleQueue()
+        handler = _QueueHandler(records)
+        handler.addFilter(RequestIdFilter())
+        handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL.upper())
+        for name, level in _parse_levels(LOG_LEVELS):
+            logging.getLogger(name).setLevel(level)
+
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def init_app(app):
+    """Give every request an id (the client's X-Request-ID if it sent one) and echo it on the response"""
+
+    @app.before_request
+    def assign_request_id():
+        sent = request.headers.get(REQUEST_ID_HEADER, "")
+        g.request_id = sent if 0 < len(sent) <= 64 and sent.isprintable() else uuid.uuid4().hex
+
+    @app.after_request
+    def echo_request_id(response):
+        request_id = g.get("request_id")
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+
+def _parse_levels(spec):
+    levels = []
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels.append((name.strip(), level.strip().upper()))
+    return levels
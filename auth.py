@@ -0,0 +1,95 @@
+#contains helpers for issuing JWTs and resolving the signed-in user from them
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask_jwt_extended import create_access_token
+from flask_jwt_extended import get_jwt
+from flask_jwt_extended import get_jwt_identity
+import repository
+
+# Name of the JWT claim that carries users.user_id
+USER_ID_CLAIM = "uid"
+
+
+class TTLCache:
+    """Small bounded, thread-safe cache whose entries expire after ttl seconds"""
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+# Only used for tokens issued before the user id claim existed
+_user_ids_by_email = TTLCache(
+    max_size=int(os.environ.get("AUTH_USER_CACHE_SIZE", 10000)),
+    ttl=int(os.environ.get("AUTH_USER_CACHE_TTL", 300))
+)
+
+
+def create_user_token(user):
+    """Issue an access token for a users row, carrying the numeric id as a claim"""
+    return create_access_token(identity=user["email"], additional_claims={USER_ID_CLAIM: user["user_id"]})
+
+
+def current_user_id():
+    """
+    Return the user_id of the signed-in user, or None if the user does not exist.
+    Tokens from /login carry the id, so this normally costs no database round trip
+    and no pooled connection. Older email-only tokens are resolved through a
+    session of their own and cached for a few minutes.
+    """
+    user_id = get_jwt().get(USER_ID_CLAIM)
+    if user_id is not None:
+        return user_id
+
+    email = get_jwt_identity()
+    user_id = _user_ids_by_email.get(email)
+    if user_id is None:
+        with repository.session() as repo:
+            user = repo.find_user_by_email(email)
+        if not user:
+            return None
+        user_id = user["user_id"]
+        _user_ids_by_email.put(email, user_id)
+    return user_id
+
+
+def forget_user(email):
+    """Drop a cached email -> user_id entry, e.g. when the user is deleted"""
+    _user_ids_by_email.pop(email)
+
+
+def user_cache_stats():
+    return _user_ids_by_email.stats()
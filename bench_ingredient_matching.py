@@ -0,0 +1,95 @@
+#contains a benchmark and self-check for the pantry matcher on large pantries
+#
+# Usage:
+#   python bench_ingredient_matching.py --pantry 5000 --missing 30
+# Exits with status 1 if any of the known cases is matched wrongly.
+import argparse
+import random
+import sys
+import time
+from ingredient_matching import PantryMatcher, normalize_name
+
+# (pantry, ingredient, expected pantry match or None)
+CASES = [
+    (["oil"], "boiled eggs", None),
+    (["boiled eggs"], "eggs", "boiled eggs"),
+    (["eggs"], "Boiled Egg", None),
+    (["tomatoes (3.0 unit)"], "tomato", "tomatoes (3.0 unit)"),
+    (["berries"], "fresh berry", "berries"),
+    (["olive oil"], "oil", "olive oil"),
+    (["garlic"], "garlic powder", None),
+    (["garlic powder"], "garlic", "garlic powder"),
+    (["rice"], "licorice", None),
+    (["pea"], "peanut butter", None),
+    (["butter"], "peanut butter", None),
+    (["chicken"], "chicken stock", None),
+    (["chicken breast", "chicken"], "chicken thighs", None),
+    (["chicken thighs", "chicken"], "chicken", "chicken"),
+    (["ground beef"], "beef", "ground beef"),
+    (["salt"], "", None)
+]
+
+WORDS = ["red", "green", "sweet", "smoked", "wild", "baby", "dried", "spicy", "white", "black",
+         "onion", "pepper", "bean", "apple", "carrot", "potato", "squash", "cheese", "mushroom", "lentil",
+         "flour", "sugar", "butter", "yogurt", "tofu", "salmon", "pork", "noodle", "vinegar", "basil"]
+
+
+def check_cases():
+    failures = 0
+    for pantry, ingredient, expected in CASES:
+        got = PantryMatcher(pantry).match(ingredient)
+        if got != expected:
+            failures += 1
+            print(f"WRONG: {ingredient!r} against {pantry} -> {got!r}, expected {expected!r}")
+    print(f"{len(CASES) - failures}/{len(CASES)} known cases matched correctly")
+    return failures == 0
+
+
+def substring_missing(pantry_lower, missing):
+    """The matching /recipe/generate used before, for comparison"""
+    return [m for m in missing if not any(p in m.lower() or m.lower() in p for p in pantry_lower)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the indexed pantry matcher with pairwise substring matching")
+    parser.add_argument("--pantry", type=int, default=5000, help="pantry items")
+    parser.add_argument("--missing", type=int, default=30, help="missing ingredients per recipe")
+    parser.add_argument("--recipes", type=int, default=300, help="recipes to reconcile")
+    args = parser.parse_args()
+
+    ok = check_cases()
+
+    rng = random.Random(42)
+    pantry = [" ".join(rng.sample(WORDS, 2)) + f" {i}s" for i in range(args.pantry)]
+    recipes = [[" ".join(rng.sample(WORDS, 2)) + f" {rng.randrange(args.pantry * 2)}" for _ in range(args.missing)]
+               for _ in range(args.recipes)]
+
+    started = time.perf_counter()
+    matcher = PantryMatcher(pantry)
+    built = time.perf_counter() - started
+    indexed = [matcher.missing(missing) for missing in recipes]
+    indexed_time = time.perf_counter() - started
+
+    # The pairwise version is slow enough that a slice is plenty to compare against
+    sample = recipes[:max(1, args.recipes // 20)]
+    pantry_lower = [name.lower() for name in pantry]
+    started = time.perf_counter()
+    for missing in sample:
+        substring_missing(pantry_lower, missing)
+    substring_time = (time.perf_counter() - started) * len(recipes) / len(sample)
+
+    # Deterministic: a second matcher over the same pantry gives the same answers
+    again = PantryMatcher(pantry)
+    if [again.missing(missing) for missing in recipes] != indexed:
+        ok = False
+        print("WRONG: results differ between two matchers over the same pantry")
+
+    lookups = args.recipes * args.missing
+    print(f"pantry={args.pantry} recipes={args.recipes} missing/recipe={args.missing} (normalized e.g. {normalize_name(pantry[0])!r})")
+    print(f"indexed:   {indexed_time * 1000:.1f} ms total ({built * 1000:.1f} ms to build), {indexed_time / lookups * 1e6:.1f} us/lookup")
+    print(f"substring: ~{substring_time * 1000:.1f} ms total (extrapolated), {substring_time / lookups * 1e6:.1f} us/lookup")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#contains a benchmark of JSON serialization and response compression on favorites and pantry payloads
+#
+# Usage:
+#   python bench_json.py --recipes 200 --pantry 500
+# Prints encode time per response for Flask's stdlib provider and FastJSONProvider,
+# and the bytes sent with no compression, gzip and (if installed) brotli.
+# Exits with status 1 if the two providers produce different JSON.
+import argparse
+import decimal
+import gzip
+import json
+import random
+import sys
+import time
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import responses
+from responses import FastJSONProvider
+
+WORDS = ["chop", "the", "onion", "and", "garlic", "then", "sear", "chicken", "in", "a", "hot", "pan", "with",
+         "olive", "oil", "until", "golden", "add", "tomatoes", "simmer", "for", "minutes", "season", "to", "taste"]
+
+
+def favorites_payload(rng, recipes):
+    """Shaped like /get_favorites: full recipes with their steps arrays"""
+    favorites = []
+    for recipe_id in range(recipes, 0, -1):
+        favorites.append({
+            "id": recipe_id,
+            "recipeName": f"Recipe {recipe_id}",
+            "name": f"Recipe {recipe_id}",
+            "description": " ".join(rng.choices(WORDS, k=25)),
+            "steps": [" ".join(rng.choices(WORDS, k=rng.randint(12, 30))) for _ in range(rng.randint(5, 12))],
+            "ingredients": ", ".join(rng.choices(WORDS, k=10)),
+            "allergyFlags": {
+                "containsVegetarian": rng.random() < 0.5,
+                "containsGluten": rng.random() < 0.5,
+                "containsNuts": rng.random() < 0.2,
+                "containsMeat": rng.random() < 0.5
+            }
+        })
+    return {"favorites": favorites, "next_cursor": None}
+
+
+def pantry_payload(rng, items):
+    """Shaped like /get_pantry before formatting: Decimal quantities straight from MySQL"""
+    pantry = []
+    for ingredient_id in range(1, items + 1):
+        pantry.append({
+            "ingredientId": ingredient_id,
+            "userId": 1,
+            "quantity": decimal.Decimal(f"{rng.randint(1, 999)}.{rng.randint(0, 99):02d}"),
+            "unit": rng.choice(["g", "ml", "unit", "cup"]),
+            "ingredient": {"name": " ".join(rng.choices(WORDS, k=2))}
+        })
+    return {"pantry": pantry, "next_cursor": None}
+
+
+def time_per_call(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def bench(name, payload, app, repeat):
+    stdlib, fast = DefaultJSONProvider(app), FastJSONProvider(app)
+    stdlib_ms, stdlib_body = time_per_call(lambda: stdlib.response(payload).get_data(), repeat)
+    fast_ms, fast_body = time_per_call(lambda: fast.response(payload).get_data(), repeat)
+    same = json.loads(stdlib_body) == json.loads(fast_body)
+
+    print(f"{name}: stdlib {stdlib_ms:.2f} ms, fast {fast_ms:.2f} ms ({stdlib_ms / fast_ms:.1f}x)"
+          f"{'' if same else '  OUTPUT DIFFERS'}")
+    gzip_ms, gzipped = time_per_call(
+        lambda: gzip.compress(fast_body, compresslevel=responses.COMPRESS_GZIP_LEVEL, mtime=0), repeat
+    )
+    print(f"  bytes: {len(fast_body)} raw, {len(gzipped)} gzip ({gzip_ms:.2f} ms)", end="")
+    if responses.brotli is not None:
+        brotli_ms, compressed = time_per_call(
+            lambda: responses.brotli.compress(fast_body, quality=responses.COMPRESS_BROTLI_QUALITY), repeat
+        )
+        print(f", {len(compressed)} brotli ({brotli_ms:.2f} ms)")
+    else:
+        print(", brotli not installed")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON providers and compression on representative payloads")
+    parser.add_argument("--recipes", type=int, default=200, help="favorites in the favorites payload")
+    parser.add_argument("--pantry", type=int, default=500, help="items in the pantry payload")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    if responses.orjson is None:
+        print("orjson is not installed, FastJSONProvider falls back to the stdlib encoder")
+
+    app = Flask(__name__)
+    rng = random.Random(42)
+    with app.app_context():
+        ok = bench(f"favorites ({args.recipes} recipes)", favorites_payload(rng, args.recipes), app, args.repeat)
+        ok &= bench(f"pantry ({args.pantry} items)", pantry_payload(rng, args.pantry), app, args.repeat)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
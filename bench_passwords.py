@@ -0,0 +1,57 @@
+#contains a micro-benchmark for password verification throughput (logins per second)
+#
+# Usage:
+#   python bench_passwords.py --rounds 12 --workers 4 --logins 200
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from passwords import PasswordHasher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bcrypt logins/sec through the password worker pool")
+    parser.add_argument("--rounds", type=int, default=int(os.environ.get("BCRYPT_LOG_ROUNDS", 12)), help="bcrypt cost factor")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="password worker processes")
+    parser.add_argument("--logins", type=int, default=100, help="verifications to run")
+    parser.add_argument("--callers", type=int, default=32, help="concurrent request threads")
+    args = parser.parse_args()
+
+    hasher = PasswordHasher(
+        rounds=args.rounds,
+        workers=args.workers,
+        max_queue=max(args.callers, args.workers),
+        queue_wait=60,
+        timeout=60
+    )
+    try:
+        hashed = hasher.hash("correct horse battery staple")
+        # Warm every worker process before timing
+        with ThreadPoolExecutor(max_workers=args.workers) as warmup:
+            list(warmup.map(lambda _: hasher.verify("warmup", hashed), range(args.workers)))
+
+        latencies = []
+
+        def login(_):
+            started = time.perf_counter()
+            ok = hasher.verify("correct horse battery staple", hashed)
+            latencies.append(time.perf_counter() - started)
+            return ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.callers) as callers:
+            results = list(callers.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - started
+    finally:
+        hasher.shutdown()
+
+    assert all(results), "a verification failed"
+    latencies.sort()
+    per_second = args.logins / elapsed
+    print(f"rounds={args.rounds} workers={args.workers} callers={args.callers} logins={args.logins}")
+    print(f"total {elapsed:.2f}s, {per_second:.1f} logins/sec, {per_second / args.workers:.1f} logins/sec per core")
+    print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
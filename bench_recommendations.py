@@ -0,0 +1,110 @@
+#contains a benchmark and self-check for the co-favorite recommendation index
+#
+# Usage:
+#   python bench_recommendations.py --favorites 10000000 --users 1000000 --recipes 200000
+# Exits with status 1 if the index disagrees with a brute force count on a small table,
+# or if incremental updates do not match a rebuild.
+import argparse
+import itertools
+import sys
+import time
+from collections import Counter, defaultdict
+import numpy as np
+from recommendations import CoFavoriteIndex
+
+
+def synthetic_favorites(rng, favorites, users, recipes):
+    """Unique (user_id, recipe_id) rows in primary key order; popular recipes are saved more often"""
+    user_ids = rng.integers(1, users + 1, favorites)
+    recipe_ids = np.minimum(rng.zipf(1.3, favorites), recipes)
+    keys = np.unique(user_ids * (recipes + 1) + recipe_ids)
+    return keys // (recipes + 1), keys % (recipes + 1)
+
+
+def brute_force(rows):
+    by_user = defaultdict(list)
+    for user_id, recipe_id in rows:
+        by_user[user_id].append(recipe_id)
+    savers, together = Counter(), Counter()
+    for saved in by_user.values():
+        savers.update(saved)
+        for a, b in itertools.combinations(saved, 2):
+            together[a, b] += 1
+            together[b, a] += 1
+    return savers, together, by_user
+
+
+def check_small(rng):
+    users, recipes = synthetic_favorites(rng, 20000, 2000, 300)
+    rows = list(zip(users.tolist(), recipes.tolist()))
+    savers, together, by_user = brute_force(rows)
+
+    index = CoFavoriteIndex(neighbors=1000, batch_pairs=5000)
+    index.build(users, recipes)
+    ok = True
+    for recipe_id in (1, 2, 10, 150):
+        expected = sorted(
+            ((b, together[a, b] / (savers[a] * savers[b]) ** 0.5) for a, b in together if a == recipe_id),
+            key=lambda item: (-item[1], -item[0])
+        )[:10]
+        got = index.similar(recipe_id, 10)
+        if [other for other, _, _ in got] != [other for other, _ in expected]:
+            ok = False
+            print(f"WRONG: neighbors of {recipe_id}: {got[:3]}..., expected {expected[:3]}...")
+
+    # Remove one favorite incrementally and compare with a rebuild without it
+    user_id, removed = rows[0]
+    still_saved = [recipe_id for recipe_id in by_user[user_id] if recipe_id != removed]
+    index.remove_favorite(removed, still_saved)
+    rebuilt = CoFavoriteIndex(neighbors=1000)
+    rebuilt.build(users[1:], recipes[1:])
+    for recipe_id in [removed] + still_saved[:5]:
+        if index.similar(recipe_id, 50) != rebuilt.similar(recipe_id, 50):
+            ok = False
+            print(f"WRONG: incremental removal differs from a rebuild for recipe {recipe_id}")
+
+    print("small table matches brute force and rebuild" if ok else "small table check FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the co-favorite index build and queries on synthetic favorites")
+    parser.add_argument("--favorites", type=int, default=1000000, help="favorite rows to generate")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--recipes", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    ok = check_small(rng)
+
+    users, recipes = synthetic_favorites(rng, args.favorites, args.users, args.recipes)
+    index = CoFavoriteIndex()
+    started = time.perf_counter()
+    index.build(users, recipes)
+    print(f"build: {len(users)} favorites in {time.perf_counter() - started:.2f}s, {index.stats()}")
+
+    starts = np.flatnonzero(np.concatenate(([True], users[1:] != users[:-1])))
+    ends = np.append(starts[1:], len(users))
+    timings = {"similar": [], "recommend": []}
+    for _ in range(args.queries):
+        user = rng.integers(len(starts))
+        saved = recipes[starts[user]:ends[user]].tolist()
+
+        started = time.perf_counter()
+        index.similar(saved[0], 10)
+        timings["similar"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        index.recommend(saved[-index.max_user_favorites:], 20)
+        timings["recommend"].append(time.perf_counter() - started)
+
+    for name, values in timings.items():
+        values = np.array(values) * 1000
+        print(f"{name}: p50 {np.percentile(values, 50):.3f} ms, p95 {np.percentile(values, 95):.3f} ms, max {values.max():.3f} ms")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
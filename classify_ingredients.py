@@ -0,0 +1,83 @@
+#contains the batch allergen classification of the ingredient table and the recipe diet flag recompute
+#
+# Usage (configured with the usual DB_* variables):
+#   python classify_ingredients.py --dry-run     # report what would change
+#   python classify_ingredients.py               # classify ingredients, then recompute recipe flags
+#   python classify_ingredients.py --overwrite   # also clear flags the rules do not confirm
+# New ingredients are classified when they are inserted; run this after changing
+# the rules in allergens.py or to backfill older rows.
+import argparse
+import sys
+import repository
+from allergens import classify_many
+
+FLAGS = ("contains_nuts", "contains_gluten", "contains_meat")
+
+
+def classify_ingredients(repo, batch_size, overwrite=False, dry_run=False):
+    """
+    Walk the ingredient table in primary key order, classify each batch of names
+    and write back the rows whose flags change. Without overwrite a flag that is
+    already set (e.g. by hand) is kept even if the rules do not find the allergen.
+    Returns:
+        tuple: (ingredients checked, ingredients changed)
+    """
+    checked = changed = 0
+    after_id = 0
+    while True:
+        rows = repo.get_ingredients_page(after_id, batch_size)
+        if not rows:
+            break
+
+        updates = []
+        for row, flags in zip(rows, classify_many([row["name"] for row in rows])):
+            current = tuple(bool(row[flag]) for flag in FLAGS)
+            new = tuple(flags[flag] if overwrite else flags[flag] or current[i] for i, flag in enumerate(FLAGS))
+            if new != current:
+                updates.append((row["ingredient_id"],) + new)
+
+        if updates and not dry_run:
+            repo.set_ingredient_flags(updates)
+            # Short transactions, the table stays writable for the API
+            repo.commit()
+
+        checked += len(rows)
+        changed += len(updates)
+        after_id = rows[-1]["ingredient_id"]
+        print(f"ingredients: {checked} checked, {changed} {'to change' if dry_run else 'changed'}")
+    return checked, changed
+
+
+def recompute_recipe_flags(repo, batch_size):
+    """Clear recipe diet flags contradicted by their ingredients, one recipe_id range per transaction"""
+    first_id, last_id = repo.get_recipe_id_range()
+    if first_id is None:
+        return 0
+
+    changed = 0
+    for start in range(first_id, last_id + 1, batch_size):
+        changed += repo.derive_recipe_diet_flags(start, min(start + batch_size - 1, last_id))
+        repo.commit()
+    print(f"recipes: {changed} had diet flags cleared")
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify every ingredient for nuts/gluten/meat and derive recipe diet flags")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per query and transaction")
+    parser.add_argument("--overwrite", action="store_true", help="clear flags the rules do not confirm")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing")
+    parser.add_argument("--skip-recipes", action="store_true", help="only classify ingredients")
+    args = parser.parse_args()
+
+    with repository.session() as repo:
+        classify_ingredients(repo, args.batch_size, args.overwrite, args.dry_run)
+        if args.dry_run:
+            repo.rollback()
+        elif not args.skip_recipes:
+            recompute_recipe_flags(repo, args.batch_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#contains the in-memory recipe index behind /recipe/cook_now: ranks saved recipes by pantry coverage
+import os
+import threading
+import time
+import numpy as np
+from ingredient_matching import normalize_name
+
+# Diet preference -> recipe flag column, in the order the flags are stored
+DIET_FLAGS = ("is_vegetarian", "is_gluten_free", "is_nut_free")
+
+
+class CookNowIndex:
+    """
+    Inverted index from ingredient to the recipes that use it, with per-recipe
+    ingredient counts and diet flags held in numpy arrays. Scoring one pantry is
+    a bincount over the postings of its ingredients, so it touches only the
+    recipes that share an ingredient with the pantry.
+    Ingredients are matched on their normalized name ("Tomatoes" == "tomato").
+    Recipes are added incrementally as they are saved; refresh() picks up rows
+    written by other processes.
+    Args:
+        refresh_interval (int): Seconds between checks for recipes saved elsewhere
+        page_size (int): Recipes loaded per query while refreshing
+    """
+
+    def __init__(self, refresh_interval=60, page_size=2000):
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._terms = {}          # normalized ingredient name -> term number
+        self._postings = []       # term number -> [array of recipe rows, used length]
+        self._rows = {}           # recipe_id -> row
+        self._size = 0
+        # Column arrays grow by doubling, queries use views of the first _size rows
+        self._recipe_ids = np.zeros(1024, dtype=np.int64)
+        self._counts = np.zeros(1024, dtype=np.float64)
+        self._flags = np.zeros((1024, len(DIET_FLAGS)), dtype=bool)
+        # Highest recipe_id read from the database; recipes added by this process
+        # do not move it, so rows other processes saved in between are still read
+        self._loaded_through = 0
+        self._loaded_at = None
+
+    def add_recipe(self, recipe_id, ingredient_names, is_vegetarian, is_gluten_free, is_nut_free):
+        """Index one recipe (a recipe already indexed is left alone)"""
+        terms = {normalize_name(name) for name in ingredient_names} - {""}
+        with self._lock:
+            if recipe_id in self._rows:
+                return
+            row = self._size
+            if row == len(self._recipe_ids):
+                self._recipe_ids = _grow(self._recipe_ids)
+                self._counts = _grow(self._counts)
+                self._flags = _grow(self._flags)
+            self._recipe_ids[row] = recipe_id
+            self._counts[row] = len(terms)
+            self._flags[row] = (bool(is_vegetarian), bool(is_gluten_free), bool(is_nut_free))
+            self._rows[recipe_id] = row
+            self._size += 1
+
+            for name in terms:
+                term = self._terms.get(name)
+                if term is None:
+                    term = self._terms[name] = len(self._postings)
+                    self._postings.append([np.zeros(8, dtype=np.int64), 0])
+                posting = self._postings[term]
+                if posting[1] == len(posting[0]):
+                    posting[0] = _grow(posting[0])
+                posting[0][posting[1]] = row
+                posting[1] += 1
+
+    def top(self, pantry_names, k=20, require=(), min_coverage=0.0):
+        """
+        Rank recipes by the share of their ingredients found in the pantry.
+        Args:
+            pantry_names (list): Ingredient names in the user's pantry
+            k (int): Recipes to return
+            require (tuple): Names from DIET_FLAGS a recipe must have set
+            min_coverage (float): Drop recipes covered less than this (0-1)
+        Returns:
+            list: (recipe_id, coverage, matched, total) tuples, best first
+        """
+        # Views taken under the lock stay valid: later adds only write past them
+        with self._lock:
+            postings = []
+            for name in {normalize_name(name) for name in pantry_names}:
+                term = self._terms.get(name)
+                if term is not None:
+                    array, length = self._postings[term]
+                    postings.append(array[:length])
+            size = self._size
+            recipe_ids, counts, flags = self._recipe_ids[:size], self._counts[:size], self._flags[:size]
+
+        if not postings or not len(recipe_ids):
+            return []
+
+        matched = np.bincount(np.concatenate(postings), minlength=len(recipe_ids))
+        coverage = np.divide(matched, counts, out=np.zeros(len(counts)), where=counts > 0)
+
+        keep = matched > 0
+        if min_coverage > 0:
+            keep &= coverage >= min_coverage
+        for flag in require:
+            keep &= flags[:, DIET_FLAGS.index(flag)]
+
+        candidates = np.flatnonzero(keep)
+        if len(candidates) > k:
+            # Only the best k need sorting: partition first, O(n)
+            candidates = candidates[np.argpartition(-coverage[candidates], k - 1)[:k]]
+        # Best coverage first, then more matched ingredients, then newest recipe
+        order = np.lexsort((-recipe_ids[candidates], -matched[candidates], -coverage[candidates]))
+        best = candidates[order]
+        return [
+            (int(recipe_ids[row]), round(float(coverage[row]), 4), int(matched[row]), int(counts[row]))
+            for row in best
+        ]
+
+    def refresh(self, repo, force=False):
+        """Load recipes saved since the last refresh (by any process), at most every refresh_interval seconds"""
+        if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        # One refresher at a time, other requests score with what is already loaded
+        if not self._refresh_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            after_id = self._loaded_through
+            while True:
+                rows = repo.get_recipes_page(after_id, self.page_size)
+                if not rows:
+                    break
+                names = repo.get_recipe_ingredient_names([row["recipe_id"] for row in rows])
+                for row in rows:
+                    self.add_recipe(
+                        row["recipe_id"],
+                        names[row["recipe_id"]],
+                        row["is_vegetarian"],
+                        row["is_gluten_free"],
+                        row["is_nut_free"]
+                    )
+                after_id = self._loaded_through = rows[-1]["recipe_id"]
+                if len(rows) < self.page_size:
+                    break
+            self._loaded_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "recipes": self._size,
+                "ingredients": len(self._terms),
+                "postings": int(self._counts[:self._size].sum()),
+                "loaded_through_recipe_id": self._loaded_through,
+                "refresh_interval": self.refresh_interval
+            }
+
+
+def _grow(array):
+    grown = np.zeros((len(array) * 2,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+cook_now_index = CookNowIndex(
+    refresh_interval=int(os.environ.get("COOK_NOW_REFRESH_INTERVAL", 60)),
+    page_size=int(os.environ.get("COOK_NOW_PAGE_SIZE", 2000))
+)
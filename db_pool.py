@@ -0,0 +1,240 @@
+#contains the shared MySQL connection pool used by every endpoint
+import os
+import threading
+import time
+import mysql.connector
+from mysql.connector.errors import PoolError
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()  # The pool is built at import time, so make sure .env has been read
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection became free before the checkout timeout"""
+
+
+class _PoolEntry:
+    """A raw connection owned by the pool plus the bookkeeping we need for it"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.statements = {}  # prepared cursors keyed by statement name, see repository.py
+
+
+class PooledConnection:
+    """
+    Handle given out by ConnectionPool.connect().
+    Behaves like a mysql.connector connection, except that close() hands the
+    underlying connection back to the pool instead of closing the socket.
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def close(self):
+        # Calling close() twice is harmless, the second call does nothing
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry)
+
+    @property
+    def statement_cache(self):
+        """Prepared statements that live as long as the underlying connection"""
+        if self._entry is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return self._entry.statements
+
+    def __getattr__(self, name):
+        if self._entry is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return getattr(self._entry.raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of mysql.connector connections.
+    Args:
+        pool_size (int): Connections kept open between requests
+        max_overflow (int): Extra connections allowed under load, closed when returned
+        recycle (int): Seconds after which a connection is closed and replaced
+        timeout (float): Seconds to wait for a free connection before raising PoolTimeout
+        ping_after (int): Idle seconds after which a connection is pinged before reuse
+        connect_args (dict): Keyword arguments passed to mysql.connector.connect()
+    """
+
+    def __init__(self, pool_size=5, max_overflow=10, recycle=3600, timeout=30.0, ping_after=30, **connect_args):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.recycle = recycle
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.connect_args = connect_args
+
+        self._idle = []  # used as a stack so the warmest connection is reused first
+        self._total = 0
+        self._checked_out = 0
+        self._cond = threading.Condition()
+        self._counters = {
+            "created": 0,
+            "recycled": 0,
+            "failed_health_checks": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+        }
+        self._wait_seconds = 0.0
+
+    def connect(self):
+        """Check out a connection, creating one if the pool has room"""
+        deadline = None
+        waited_since = None
+        started = time.perf_counter()
+
+        while True:
+            entry = None
+            with self._cond:
+                while not self._idle and self._total >= self.pool_size + self.max_overflow:
+                    if deadline is None:
+                        deadline = time.monotonic() + self.timeout
+                        waited_since = time.monotonic()
+                        self._counters["waits"] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout} seconds")
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    # Reserve the slot now, the handshake happens outside the lock
+                    self._total += 1
+                self._checked_out += 1
+
+            if entry is None:
+                try:
+                    entry = _PoolEntry(self._create())
+                except Exception:
+                    self._forget()
+                    raise
+            elif not self._is_usable(entry):
+                self._close_quietly(entry)
+                self._forget()
+                continue
+
+            with self._cond:
+                self._counters["checkouts"] += 1
+                if waited_since is not None:
+                    self._wait_seconds += time.monotonic() - waited_since
+            metrics.DB_ACQUIRE.observe(time.perf_counter() - started)
+            return PooledConnection(self, entry)
+
+    def stats(self):
+        """Return a snapshot of the pool counters"""
+        with self._cond:
+            stats = {
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "recycle": self.recycle,
+                "total": self._total,
+                "idle": len(self._idle),
+                "checked_out": self._checked_out,
+                "wait_seconds": round(self._wait_seconds, 6),
+            }
+            stats.update(self._counters)
+        return stats
+
+    def dispose(self):
+        """Close every idle connection (e.g. after a fork or on shutdown)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_quietly(entry)
+
+    def _create(self):
+        raw = mysql.connector.connect(**self.connect_args)
+        with self._cond:
+            self._counters["created"] += 1
+        return raw
+
+    def _is_usable(self, entry):
+        now = time.monotonic()
+        if self.recycle is not None and self.recycle >= 0 and now - entry.created_at > self.recycle:
+            with self._cond:
+                self._counters["recycled"] += 1
+            return False
+
+        # Only pay for a round trip when the connection sat idle long enough
+        # for the server (or a firewall) to have dropped it
+        if now - entry.last_used > self.ping_after:
+            try:
+                entry.raw.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._counters["failed_health_checks"] += 1
+                return False
+        return True
+
+    def _release(self, entry):
+        # Never hand the next request a half finished transaction
+        try:
+            if entry.raw.in_transaction:
+                entry.raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._checked_out -= 1
+            if healthy and len(self._idle) < self.pool_size:
+                self._idle.append(entry)
+                self._cond.notify()
+                return
+            self._total -= 1
+            self._cond.notify()
+        self._close_quietly(entry)
+
+    def _forget(self):
+        with self._cond:
+            self._total -= 1
+            self._checked_out -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(entry):
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+
+
+pool = ConnectionPool(
+    pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+    max_overflow=int(os.environ.get("DB_POOL_MAX_OVERFLOW", 10)),
+    recycle=int(os.environ.get("DB_POOL_RECYCLE", 3600)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+    ping_after=int(os.environ.get("DB_POOL_PING_AFTER", 30)),
+    host=os.environ.get("DB_HOST"),
+    user=os.environ.get("DB_USER"),
+    password=os.environ.get("DB_PASS"),
+    database=os.environ.get("DB_NAME"),
+    autocommit=False  # We'll handle commits explicitly
+)
+
+
+def get_db_connection():
+    """Check out a pooled connection, close() returns it to the pool"""
+    return pool.connect()
@@ -0,0 +1,236 @@
+#contains the query plan regression check: EXPLAINs every SQL statement the API runs
+#
+# Usage (against a local scratch database, configured with the usual DB_* variables):
+#   python explain_check.py --seed    # load synthetic rows first, then check
+#   python explain_check.py           # check only
+# Exits with status 1 if any statement falls back to a full table scan.
+import argparse
+import sys
+import repository
+from db_pool import get_db_connection
+
+
+SEED_USERS = 2000
+SEED_INGREDIENTS = 5000
+SEED_RECIPES = 5000
+SEED_ROWS_PER_USER = 10
+
+
+class _RecordingCursor:
+    """Stands in for a mysql.connector cursor and only records what would run"""
+
+    rowcount = 0
+    lastrowid = 0
+
+    def __init__(self, log):
+        self._log = log
+
+    def execute(self, sql, params=()):
+        self._log.append((sql, tuple(params)))
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class _RecordingConnection:
+    def __init__(self):
+        self.log = []
+        self.statement_cache = {}
+
+    def cursor(self, **kwargs):
+        return _RecordingCursor(self.log)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+# One call per Repository method that touches the database, with arguments
+# that match the seeded rows. Keep this list in step with repository.py -
+# the check fails if a named statement is never exercised.
+def _exercise_repository(repo):
+    email = "seed-user-1@example.com"
+    names = [f"seed ingredient {i}" for i in range(1, 6)]
+
+    repo.find_user_by_email(email)
+    repo.find_user(1)
+    repo.create_user("Seed", "User", "seed-new@example.com", "not-a-hash")
+    repo.update_preferences(1, True, False, False)
+    repo.update_password(1, "not-a-hash")
+    repo.get_data_version(1)
+    repo.bump_data_version(1)
+    repo.delete_user(SEED_USERS)
+
+    repo.get_pantry(1)
+    repo.get_pantry_page(1, None, 51)
+    repo.get_pantry_page(1, 100, 51)
+    repo.get_pantry_names_for_email(email)
+    repo.pantry_item_exists(1, 1)
+    repo.add_pantry_item(1, 1, 1.0, "unit")
+    repo.update_pantry_item(1, 1, 2.0, "unit")
+    repo.remove_pantry_item(1, 1)
+    repo.get_pantry_items_by_name(1, names)
+    repo.upsert_pantry_items(1, [(1, 1.0, "unit"), (2, 2.0, "unit")])
+    repo.remove_pantry_items(1, [1, 2, 3])
+
+    repo.find_ingredient_ids(names)
+    repo.create_ingredients(["seed ingredient new"])
+    repo.get_ingredients_page(0, 1000)
+    repo.set_ingredient_flags([(1, False, False, False), (2, True, False, False)])
+
+    repo.create_recipe("seed recipe new", "", "[]", True, True, True, ["seed ingredient 1"])
+    repo.search_recipes("seed recipe")
+    repo.search_recipes("seed ingredient", ("is_vegetarian", "is_nut_free"), (1.5, SEED_RECIPES), 21)
+    repo.add_recipe_ingredients(1, [1, 2, 3], 1.0, "unit")
+    repo.get_recipe_id_range()
+    repo.derive_recipe_diet_flags(1, 1000)
+    repo.get_recipes_page(0, 2000)
+    repo.get_recipes([1, 2, 3, 4, 5])
+    repo.get_recipe_ingredient_names([1, 2, 3, 4, 5])
+
+    repo.get_review(1, 1)
+    repo.create_review(1, 2000, 4, "seed review")
+    repo.update_review(1, 1, 5, "seed review")
+    repo.get_reviews_page(1, None, 51)
+    repo.get_reviews_page(1, ("2026-01-01 00:00:00", 100), 51)
+    repo.get_rating_summary(1)
+    repo.get_top_rated(3, 20)
+    # The recording cursor returns no rows, so update_review() stops at its
+    # lookup; run what it would run for an existing review directly
+    repo.write("update_review", (5, "seed review", 1, 1))
+    repo._change_rating(1, 4, 5)
+    repo._change_rating(1, 4, None)
+
+    repo.get_favorites_page(1, None, 51)
+    repo.get_favorites_page(1, SEED_RECIPES, 51)
+    repo.find_favorite_by_recipe_name(1, "seed recipe 1")
+    repo.favorite_exists(1, 1)
+    repo.get_favorite_ids(1, 200)
+    repo.get_favorites_after(0, 0, 10000)
+    repo.get_favorites_after(100, 500, 10000)
+    repo.add_favorite(1, 1)
+    repo.remove_favorite(1, 1)
+
+
+def collect_statements():
+    """Return every (sql, params) the repository runs, plus the named statements never exercised"""
+    conn = _RecordingConnection()
+    _exercise_repository(repository.Repository(conn))
+
+    seen_sql = {sql for sql, _ in conn.log}
+    uncovered = [name for name, sql in repository.STATEMENTS.items() if sql not in seen_sql]
+
+    unique = {}
+    for sql, params in conn.log:
+        unique.setdefault((sql, params), None)
+    return list(unique), uncovered
+
+
+def seed(conn):
+    """Load enough synthetic rows that the optimizer stops preferring table scans"""
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO users (first_name, last_name, email, password) VALUES (%s, %s, %s, %s)",
+        [("Seed", str(i), f"seed-user-{i}@example.com", "not-a-hash") for i in range(1, SEED_USERS + 1)]
+    )
+    cursor.executemany(
+        "INSERT INTO ingredient (name, contains_nuts, contains_gluten, contains_meat) VALUES (%s, %s, %s, %s)",
+        [(f"seed ingredient {i}", False, False, False) for i in range(1, SEED_INGREDIENTS + 1)]
+    )
+    cursor.executemany(
+        "INSERT INTO recipe (name, description, steps, is_vegetarian, is_gluten_free, is_nut_free, ingredient_names) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        [(f"seed recipe {i}", "", "[]", i % 2 == 0, i % 3 == 0, i % 5 == 0, f"seed ingredient {i}") for i in range(1, SEED_RECIPES + 1)]
+    )
+
+    cursor.execute("SELECT MIN(user_id), MAX(user_id) FROM users WHERE email LIKE 'seed-user-%'")
+    first_user, last_user = cursor.fetchone()
+    cursor.execute("SELECT MIN(ingredient_id) FROM ingredient WHERE name LIKE 'seed ingredient %'")
+    first_ingredient = cursor.fetchone()[0]
+    cursor.execute("SELECT MIN(recipe_id) FROM recipe WHERE name LIKE 'seed recipe %'")
+    first_recipe = cursor.fetchone()[0]
+
+    pantry, favorites, recipe_ingredients, reviews = [], [], [], []
+    for offset, user_id in enumerate(range(first_user, last_user + 1)):
+        for j in range(SEED_ROWS_PER_USER):
+            pantry.append((user_id, first_ingredient + (offset * 7 + j) % SEED_INGREDIENTS, 1, "unit"))
+            favorites.append((user_id, first_recipe + (offset * 11 + j) % SEED_RECIPES))
+            reviews.append((first_recipe + (offset * 17 + j) % SEED_RECIPES, user_id, 1 + (offset + j) % 5, ""))
+    for i in range(SEED_RECIPES):
+        for j in range(6):
+            recipe_ingredients.append((first_recipe + i, first_ingredient + (i * 13 + j) % SEED_INGREDIENTS, 1, "unit"))
+
+    cursor.executemany("INSERT IGNORE INTO pantry_ingredient (user_id, ingredient_id, quantity, unit) VALUES (%s, %s, %s, %s)", pantry)
+    cursor.executemany("INSERT IGNORE INTO user_favorite_recipes (user_id, recipe_id) VALUES (%s, %s)", favorites)
+    cursor.executemany("INSERT IGNORE INTO recipe_ingredient (recipe_id, ingredient_id, quantity, unit) VALUES (%s, %s, %s, %s)", recipe_ingredients)
+    cursor.executemany("INSERT IGNORE INTO reviews (recipe_id, user_id, rating, review_text) VALUES (%s, %s, %s, %s)", reviews)
+    cursor.execute(
+        "REPLACE INTO recipe_rating_summary (recipe_id, review_count, rating_sum, rating_avg, rating_1, rating_2, rating_3, rating_4, rating_5) "
+        "SELECT recipe_id, COUNT(*), SUM(rating), SUM(rating) / COUNT(*), SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5) "
+        "FROM reviews GROUP BY recipe_id"
+    )
+    conn.commit()
+
+    for table in ("users", "ingredient", "recipe", "pantry_ingredient", "user_favorite_recipes", "recipe_ingredient",
+                  "reviews", "recipe_rating_summary"):
+        cursor.execute(f"ANALYZE TABLE {table}")
+        cursor.fetchall()
+    cursor.close()
+
+
+def explain(conn, sql, params):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("EXPLAIN " + sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def check(conn):
+    statements, uncovered = collect_statements()
+    failures = []
+
+    for sql, params in statements:
+        flat_sql = " ".join(sql.split())
+        # Plain INSERT ... VALUES never reads a table, nothing to plan
+        if flat_sql.upper().startswith("INSERT") and " SELECT " not in flat_sql.upper():
+            continue
+
+        for row in explain(conn, sql, params):
+            table = row.get("table") or ""
+            if row.get("type") == "ALL" and not table.startswith("<"):
+                failures.append((flat_sql, table, row.get("rows")))
+                print(f"FULL SCAN  {table} (~{row.get('rows')} rows): {flat_sql[:140]}")
+            elif row.get("type") == "index":
+                print(f"index scan {table} (~{row.get('rows')} rows): {flat_sql[:140]}")
+
+    conn.rollback()
+
+    for name in uncovered:
+        print(f"NOT CHECKED: statement '{name}' is not exercised by explain_check.py")
+
+    print(f"Checked {len(statements)} statements, {len(failures)} full table scans, {len(uncovered)} unchecked")
+    return not failures and not uncovered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN every SQL statement the API runs and fail on full table scans")
+    parser.add_argument("--seed", action="store_true", help="load synthetic rows into the (scratch!) database first")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        if args.seed:
+            seed(conn)
+        return 0 if check(conn) else 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
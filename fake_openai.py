@@ -0,0 +1,149 @@
+#contains a local stand-in for the OpenAI chat completions endpoint, for load tests without API spend
+#
+# Usage:
+#   python fake_openai.py --port 8001 --latency 0.5 --tokens-per-second 200 --error-rate 0.02
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=fake flask --app main run
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+settings = {
+    "latency": 0.5,
+    "tokens_per_second": 200.0,
+    "error_rate": 0.0,
+    "rate_limit_share": 0.5
+}
+
+_PANTRY_LINE = re.compile(r"ingredients in my pantry:\s*\n(.*)")
+_QUANTITY = re.compile(r"\([^)]*\)")
+_FALLBACK_PANTRY = ["rice", "onion", "garlic", "eggs"]
+
+
+def _pantry_from_prompt(messages):
+    """Pick the pantry back out of the prompt recipe.py builds, so recipes use it"""
+    for message in messages:
+        match = _PANTRY_LINE.search(message.get("content") or "")
+        if match:
+            items = [_QUANTITY.sub("", item).strip() for item in match.group(1).split(",")]
+            items = [item for item in items if item]
+            if items:
+                return items
+    return _FALLBACK_PANTRY
+
+
+def _recipes(pantry):
+    recipes = []
+    for n, style in enumerate(["Skillet", "Bake", "Soup"], start=1):
+        used = random.sample(pantry, min(len(pantry), 3 + n % 2))
+        recipes.append({
+            "recipeName": f"{used[0].title()} {style}",
+            "description": f"A simple {style.lower()} built around {', '.join(used)}.",
+            "steps": [
+                f"Prepare the {', '.join(used)}.",
+                "Heat a pan over medium heat with a little oil.",
+                f"Cook everything together for {10 * n} minutes, stirring occasionally.",
+                "Season with salt and pepper and serve."
+            ],
+            "ingredients": ", ".join(used),
+            "missingIngredients": random.choice(["", "olive oil", "fresh parsley, lemon"]),
+            "prepTime": f"{15 * n} min",
+            "allergyFlags": {
+                "containsVegetarian": n != 2,
+                "containsGluten": n == 2,
+                "containsNuts": False,
+                "containsMeat": n == 2
+            }
+        })
+    return {"recipes": recipes}
+
+
+def _tokens(text):
+    # Roughly four characters per token, close enough for pacing
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def _injected_error():
+    if random.random() >= settings["error_rate"]:
+        return None
+    if random.random() < settings["rate_limit_share"]:
+        response = jsonify({"error": {"message": "Rate limit reached (injected)", "type": "rate_limit_error"}})
+        response.headers["Retry-After"] = "1"
+        return response, 429
+    return jsonify({"error": {"message": "Internal error (injected)", "type": "server_error"}}), 500
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    data = request.json or {}
+    model = data.get("model", "gpt-4.1-nano")
+
+    time.sleep(settings["latency"])
+    error = _injected_error()
+    if error is not None:
+        return error
+
+    content = json.dumps(_recipes(_pantry_from_prompt(data.get("messages", []))))
+    tokens = _tokens(content)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    per_token = 1.0 / settings["tokens_per_second"] if settings["tokens_per_second"] > 0 else 0.0
+
+    if not data.get("stream"):
+        time.sleep(per_token * len(tokens))
+        return jsonify({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+        })
+
+    def chunk(delta, finish_reason=None):
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def events():
+        yield chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            time.sleep(per_token)
+            yield chunk({"content": token})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return Response(events(), mimetype="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat completions server returning recipe JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=settings["latency"], help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=settings["tokens_per_second"], help="0 sends everything at once")
+    parser.add_argument("--error-rate", type=float, default=settings["error_rate"], help="share of requests answered 429/500")
+    parser.add_argument("--rate-limit-share", type=float, default=settings["rate_limit_share"], help="share of injected errors that are 429s")
+    args = parser.parse_args()
+
+    settings.update(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_share=args.rate_limit_share
+    )
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
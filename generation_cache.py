@@ -0,0 +1,159 @@
+#contains the persistent cache of OpenAI recipe generations
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_ingredients(ingredients):
+    """Turn the comma separated pantry string into a sorted, de-duplicated list of lower case items"""
+    items = set()
+    for item in (ingredients or "").split(","):
+        item = " ".join(item.split()).lower()
+        if item:
+            items.add(item)
+    return sorted(items)
+
+
+def normalize_query(user_query):
+    return " ".join((user_query or "").split()).lower()
+
+
+def make_key(user_query, ingredients, model):
+    """Cache key: hash of the normalized pantry, the normalized query and the model name"""
+    payload = json.dumps(
+        {"ingredients": normalize_ingredients(ingredients), "query": normalize_query(user_query), "model": model},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    SQLite backed cache with TTL expiry and LRU eviction.
+    The file is shared by every worker process on the host (WAL mode lets them
+    read concurrently), so a generation cached by one worker is a hit for all.
+    Args:
+        path (str): SQLite file location
+        ttl (int): Seconds an entry stays valid
+        max_entries (int): Entries kept before the least recently used are evicted
+    """
+
+    def __init__(self, path, ttl=86400, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key):
+        """Return the cached value, or None on a miss (or if the cache file is unusable)"""
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created_at FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._count("misses")
+                return None
+            conn.execute("UPDATE generations SET last_access = ? WHERE key = ?", (now, key))
+            self._count("hits")
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            self._count("errors")
+            logger.warning("Generation cache read failed", exc_info=True)
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO generations (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            self._count("errors")
+            logger.warning("Generation cache write failed", exc_info=True)
+
+    def stats(self):
+        with self._lock:
+            local = {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+        lookups = local["hits"] + local["misses"]
+        local["hit_rate"] = round(local["hits"] / lookups, 4) if lookups else None
+
+        stats = {"process": local, "ttl": self.ttl, "max_entries": self.max_entries}
+        try:
+            conn = self._connection()
+            stats["entries"] = conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+            shared = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            shared_lookups = shared.get("hits", 0) + shared.get("misses", 0)
+            shared["hit_rate"] = round(shared.get("hits", 0) / shared_lookups, 4) if shared_lookups else None
+            stats["all_processes"] = shared
+        except sqlite3.Error:
+            pass
+        return stats
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM generations WHERE created_at < ?", (now - self.ttl,))
+        count = conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM generations WHERE key IN (SELECT key FROM generations ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        # Shared counters so the hit rate covers every worker process
+        try:
+            self._connection().execute(
+                "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,)
+            )
+        except sqlite3.Error:
+            pass
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads, so each thread gets its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS generations (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_last_access ON generations (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+
+generation_cache = None
+if os.environ.get("GENERATION_CACHE_ENABLED", "1") != "0":
+    generation_cache = GenerationCache(
+        path=os.environ.get("GENERATION_CACHE_PATH", "generation_cache.sqlite3"),
+        ttl=int(os.environ.get("GENERATION_CACHE_TTL", 86400)),
+        max_entries=int(os.environ.get("GENERATION_CACHE_MAX_ENTRIES", 10000))
+    )
@@ -0,0 +1,64 @@
+#contains the in-process cache of ingredient name -> ingredient_id
+import os
+import threading
+from collections import OrderedDict
+
+
+class IngredientCache:
+    """
+    Bounded, thread-safe LRU cache of ingredient ids keyed by repository.ingredient_key(name).
+    Ingredient rows are never renamed or deleted by the API, so entries never go stale;
+    the bound only keeps memory in check if the catalogue grows very large.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys):
+        """Return ({key: ingredient_id} for cached keys, [keys that were not cached])"""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                ingredient_id = self._entries.get(key)
+                if ingredient_id is None:
+                    missing.append(key)
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = ingredient_id
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, mapping):
+        with self._lock:
+            for key, ingredient_id in mapping.items():
+                self._entries[key] = ingredient_id
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+ingredient_cache = IngredientCache(int(os.environ.get("INGREDIENT_CACHE_SIZE", 10000)))
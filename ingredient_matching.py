@@ -0,0 +1,105 @@
+#contains ingredient name normalization and pantry matching shared by recipe.py and main.py
+import re
+
+# "(2.0 kg)" style quantities appended to pantry names
+_QUANTITY = re.compile(r"\([^)]*\)")
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Preparation words and fillers that do not change which ingredient is meant
+STOP_WORDS = frozenset({
+    "a", "an", "and", "of", "or", "the", "to", "for", "with", "some", "taste", "optional",
+    "fresh", "freshly", "chopped", "diced", "sliced", "minced", "grated", "shredded", "crushed",
+    "ground", "whole", "large", "small", "medium", "raw", "cooked", "peeled", "cup", "cups"
+})
+
+_IRREGULAR = {
+    "leaves": "leaf",
+    "loaves": "loaf",
+    "halves": "half",
+    "knives": "knife",
+    "geese": "goose",
+    "mice": "mouse",
+    "teeth": "tooth"
+}
+
+# Words ending in "s" that are not plurals
+_KEEP_S = frozenset({"asparagus", "couscous", "hummus", "molasses", "swiss", "citrus"})
+
+
+def singular(word):
+    """Fold a plural to its singular form: tomatoes -> tomato, berries -> berry, eggs -> egg"""
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if word in _KEEP_S or len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes") or word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokens(name):
+    """Return the significant, singular, lower case words of an ingredient name"""
+    name = _QUANTITY.sub(" ", (name or "").lower())
+    return tuple(singular(word) for word in _WORD.findall(name) if word not in STOP_WORDS)
+
+
+def normalize_name(name):
+    """Canonical form of an ingredient name: "Fresh Tomatoes (2.0 unit)" -> "tomato" """
+    return " ".join(tokens(name))
+
+
+class PantryMatcher:
+    """
+    Token inverted index over one pantry, built once per request.
+    An ingredient matches a pantry item when the pantry item's words include all
+    of the ingredient's words, after plurals are folded: "boiled eggs" in the pantry
+    covers "egg", but "chicken" does not cover "chicken stock" and "butter" does not
+    cover "peanut butter".
+    A lookup only visits pantry items sharing a word with the ingredient, so
+    checking m ingredients costs about O(m) rather than O(pantry x m).
+    Args:
+        names (list): Pantry ingredient names
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._exact = {}
+        self._postings = {}
+        for i, name in enumerate(self.names):
+            words = set(tokens(name))
+            self._exact.setdefault(" ".join(sorted(words)), i)
+            for word in words:
+                self._postings.setdefault(word, []).append(i)
+
+    def match(self, name):
+        """Return the first pantry name (in pantry order) matching name, or None"""
+        words = set(tokens(name))
+        if not words:
+            return None
+
+        exact = self._exact.get(" ".join(sorted(words)))
+        if exact is not None:
+            return self.names[exact]
+
+        shared = {}
+        for word in words:
+            for i in self._postings.get(word, ()):
+                shared[i] = shared.get(i, 0) + 1
+
+        best = None
+        for i, count in shared.items():
+            # Every word of name is in the pantry item (the pantry item may be more specific)
+            if count == len(words) and (best is None or i < best):
+                best = i
+        return self.names[best] if best is not None else None
+
+    def contains(self, name):
+        return self.match(name) is not None
+
+    def missing(self, names):
+        """Return the names that have no match in the pantry, in their original order"""
+        return [name for name in names if not self.contains(name)]
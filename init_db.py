@@ -1,12 +1,19 @@
 from config import app, db
 from models import User, Ingredient, PantryIngredient, Recipe, RecipeIngredient, Review, UserFavoriteRecipe
 import os
+import logging
 import pymysql
+import app_logging
 
-# Print environment variables for debugging
-print(f"DB_USER: {os.environ.get('DB_USER')}")
-print(f"DB_HOST: {os.environ.get('DB_HOST')}")
-print(f"DB_NAME: {os.environ.get('DB_NAME')}")
+app_logging.setup_logging()
+logger = logging.getLogger("init_db")
+
+# Log the connection settings for debugging
+logger.info("Database settings", extra={
+    "db_user": os.environ.get("DB_USER"),
+    "db_host": os.environ.get("DB_HOST"),
+    "db_name": os.environ.get("DB_NAME")
+})
 
 # Create the database if it doesn't exist
 db_user = os.environ.get("DB_USER")
@@ -25,14 +32,14 @@ try:
     with connection.cursor() as cursor:
         # Create the database
         cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
-        print(f"Database '{db_name}' created or already exists")
+        logger.info("Database created or already exists", extra={"db_name": db_name})
     
     connection.close()
 except Exception as e:
-    print(f"Error creating database: {e}")
+    logger.exception("Error creating database")
 
 # Now create the tables
 with app.app_context():
     # Create all tables from scratch
     db.create_all()
-    print("Database tables created successfully!")
\ No newline at end of file
+    logger.info("Database tables created successfully!")
\ No newline at end of file
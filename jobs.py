@@ -0,0 +1,289 @@
+#contains the background job runner used for asynchronous recipe generation
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobStoreFull(Exception):
+    """Raised when every slot in the job store holds a job that has not finished yet"""
+
+
+class Job:
+    def __init__(self, user_id, dedupe_key):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.dedupe_key = dedupe_key
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout):
+        """Block until the job finishes or timeout seconds pass, return whether it finished"""
+        return self._finished.wait(timeout)
+
+    def to_dict(self):
+        job = {"job_id": self.id, "status": self.status, "created_at": self.created_at, "finished_at": self.finished_at}
+        if self.status == "done":
+            job["result"] = self.result
+        elif self.status == "failed":
+            job["error"] = self.error
+        return job
+
+
+class StoredJob(Job):
+    """A job read back from the JobTable, queued or running in another worker process"""
+
+    # Seconds between re-reads of the table while waiting for the job to finish
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, table, row):
+        self._table = table
+        self._update(row)
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.finished:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(self.POLL_INTERVAL, remaining))
+            row = self._table.load(self.id)
+            if row is None:
+                break
+            self._update(row)
+        return self.finished
+
+    def _update(self, row):
+        self.id = row["job_id"]
+        self.user_id = row["user_id"]
+        self.dedupe_key = row["dedupe_key"]
+        self.status = row["status"]
+        self.result = json.loads(row["result"]) if row["result"] is not None else None
+        self.error = row["error"]
+        self.created_at = row["created_at"]
+        self.finished_at = row["finished_at"]
+
+
+class JobTable:
+    """
+    SQLite file every job's state is copied to, so a poll that lands on another
+    worker process than the one running the job still finds it. Like the
+    generation cache it is shared by the worker processes of one host.
+    Args:
+        path (str): SQLite file location
+        ttl (int): Seconds a finished job is kept
+    """
+
+    def __init__(self, path, ttl=600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def save(self, job):
+        try:
+            conn = self._connection()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO jobs (job_id, user_id, dedupe_key, status, result, error, created_at, finished_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job.id, job.user_id, job.dedupe_key, job.status,
+                    json.dumps(job.result) if job.result is not None else None,
+                    job.error, job.created_at, job.finished_at
+                )
+            )
+            if job.finished_at is not None:
+                conn.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl,))
+        except (sqlite3.Error, TypeError, ValueError):
+            logger.warning("Job table write failed", exc_info=True, extra={"job_id": job.id})
+
+    def load(self, job_id):
+        """Return the job's row as a dict, or None if it is unknown, expired or the table is unusable"""
+        try:
+            row = self._connection().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        except sqlite3.Error:
+            logger.warning("Job table read failed", exc_info=True, extra={"job_id": job_id})
+            return None
+        if row is None or (row["finished_at"] is not None and row["finished_at"] < time.time() - self.ttl):
+            return None
+        return dict(row)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads, so each thread gets its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    dedupe_key TEXT,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at)")
+            self._local.conn = conn
+        return conn
+
+
+class JobRunner:
+    """
+    Runs jobs on a local thread pool and keeps their results in a bounded store.
+    Finished jobs are dropped after ttl seconds (or sooner, oldest first, when the
+    store is full). Submitting the same dedupe_key for the same user while an
+    earlier job is queued, running or still stored returns that job instead.
+    With a JobTable every state change is also written there, and get() falls
+    back to it for jobs submitted to another worker process.
+    Args:
+        workers (int): Jobs run at the same time
+        max_jobs (int): Jobs kept in the store, finished or not
+        ttl (int): Seconds a finished job's result is kept
+        table (JobTable): Shared copy of the job states, None to keep them in this process only
+    """
+
+    def __init__(self, workers=4, max_jobs=1000, ttl=600, table=None):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.table = table
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recipe-job")
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._lock = threading.Lock()
+        self.deduplicated = 0
+        self.rejected = 0
+
+    def submit(self, user_id, dedupe_key, fn, *args):
+        """
+        Queue fn(*args) for user_id.
+        Returns:
+            tuple: (job, created) - created is False when an existing job was reused
+        """
+        with self._lock:
+            self._purge()
+            existing = self._jobs.get(self._by_key.get((user_id, dedupe_key)))
+            # A failed job is not reused, the user is asking again for a reason
+            if existing is not None and existing.status != "failed":
+                self.deduplicated += 1
+                return existing, False
+
+            if len(self._jobs) >= self.max_jobs and not self._evict_one():
+                self.rejected += 1
+                raise JobStoreFull("Too many recipe jobs in progress")
+
+            job = Job(user_id, dedupe_key)
+            self._jobs[job.id] = job
+            self._by_key[(user_id, dedupe_key)] = job.id
+
+        self._save(job)
+        self._executor.submit(self._run, job, fn, args)
+        return job, True
+
+    def get(self, job_id, user_id):
+        """Return the job if it exists and belongs to user_id, otherwise None"""
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(job_id)
+        if job is None and self.table is not None:
+            row = self.table.load(job_id)
+            job = StoredJob(self.table, row) if row is not None else None
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def stats(self):
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "workers": self.workers,
+                "max_jobs": self.max_jobs,
+                "ttl": self.ttl,
+                "shared_table": self.table.path if self.table is not None else None,
+                "jobs": statuses,
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected
+            }
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        self._save(job)
+        try:
+            job.result = fn(*args)
+            job.status = "done"
+        except Exception as e:
+            logger.exception("Error in recipe job", extra={"job_id": job.id})
+            job.error = f"Server error: {str(e)}"
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            # Written before the event is set, so a poller on any process sees the result
+            self._save(job)
+            job._finished.set()
+
+    def _save(self, job):
+        if self.table is not None:
+            self.table.save(job)
+
+    def _purge(self):
+        # Jobs are stored in submission order and nothing created after the cutoff
+        # can have finished before it, so the scan stops there
+        cutoff = time.time() - self.ttl
+        for job in list(self._jobs.values()):
+            if job.finished and job.finished_at < cutoff:
+                self._remove(job)
+            elif job.created_at >= cutoff:
+                break
+
+    def _evict_one(self):
+        for job in self._jobs.values():
+            if job.finished:
+                self._remove(job)
+                return True
+        return False
+
+    def _remove(self, job):
+        del self._jobs[job.id]
+        if self._by_key.get((job.user_id, job.dedupe_key)) == job.id:
+            del self._by_key[(job.user_id, job.dedupe_key)]
+
+
+RECIPE_JOB_TTL = int(os.environ.get("RECIPE_JOB_TTL", 600))
+RECIPE_JOB_TABLE_PATH = os.environ.get("RECIPE_JOB_TABLE_PATH", "recipe_jobs.sqlite3")
+
+recipe_jobs = JobRunner(
+    workers=int(os.environ.get("RECIPE_JOB_WORKERS", 4)),
+    max_jobs=int(os.environ.get("RECIPE_JOB_MAX", 1000)),
+    ttl=RECIPE_JOB_TTL,
+    table=JobTable(RECIPE_JOB_TABLE_PATH, RECIPE_JOB_TTL) if RECIPE_JOB_TABLE_PATH else None
+)
@@ -0,0 +1,126 @@
+#contains an end-to-end load test for the recipe generation endpoints
+#
+# Usage (API running against fake_openai.py, see README):
+#   python loadtest.py --email test@example.com --password secret --concurrency 32 --requests 500
+#   python loadtest.py --token <jwt> --mode stream --duration 60
+# --unique-queries makes every request a generation cache miss.
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def login(base_url, email, password):
+    body = json.dumps({"email": email, "password": password}).encode("utf-8")
+    req = urllib.request.Request(f"{base_url}/login", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=30) as response:
+        return json.loads(response.read())["access_token"]
+
+
+def generate(base_url, token, mode, query, timeout):
+    """
+    Run one generation.
+    Returns:
+        tuple: (status, seconds to first recipe or None)
+    """
+    path = "/recipe/generate/stream" if mode == "stream" else "/recipe/generate"
+    req = urllib.request.Request(
+        f"{base_url}{path}",
+        data=json.dumps({"user_query": query}).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        if mode != "stream":
+            json.loads(response.read())
+            return response.status, None
+
+        first_recipe = None
+        for line in response:
+            line = line.decode("utf-8").strip()
+            if line == "event: recipe" and first_recipe is None:
+                first_recipe = time.perf_counter() - started
+            elif line == "event: error":
+                return "stream error", first_recipe
+        return response.status, first_recipe
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive /recipe/generate at a fixed concurrency and report latency")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="API base URL")
+    parser.add_argument("--token", help="JWT to use (otherwise --email/--password log in first)")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--mode", choices=["generate", "stream"], default="generate")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="run for this many seconds instead of a fixed count")
+    parser.add_argument("--query", default="something quick for dinner")
+    parser.add_argument("--unique-queries", action="store_true", help="vary the query so the generation cache never hits")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    token = args.token or login(args.url, args.email, args.password)
+
+    latencies, first_recipes = [], []
+    outcomes = Counter()
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def worker():
+        while True:
+            with lock:
+                n = next(counter)
+            if deadline is None and n >= args.requests:
+                return
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+
+            query = f"{args.query} #{n}" if args.unique_queries else args.query
+            started = time.perf_counter()
+            try:
+                status, first_recipe = generate(args.url, token, args.mode, query, args.timeout)
+            except urllib.error.HTTPError as e:
+                status, first_recipe = e.code, None
+            except Exception as e:
+                status, first_recipe = type(e).__name__, None
+            elapsed = time.perf_counter() - started
+
+            with lock:
+                outcomes[status] += 1
+                if status == 200:
+                    latencies.append(elapsed)
+                    if first_recipe is not None:
+                        first_recipes.append(first_recipe)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    total = sum(outcomes.values())
+    errors = total - outcomes[200]
+    print(f"mode={args.mode} concurrency={args.concurrency} requests={total} in {elapsed:.1f}s")
+    print(f"throughput {outcomes[200] / elapsed:.2f} successful req/s, errors {errors} ({100 * errors / max(total, 1):.1f}%)")
+    print(f"latency p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, p99 {percentile(latencies, 99) * 1000:.0f} ms")
+    if first_recipes:
+        print(f"time to first recipe p50 {percentile(first_recipes, 50) * 1000:.0f} ms, p95 {percentile(first_recipes, 95) * 1000:.0f} ms")
+    for status, count in sorted(outcomes.items(), key=lambda item: str(item[0])):
+        print(f"  {status}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,74 @@
 #contains main endpoints CREATE READ UPDATE DELETE
 # main.py: Updated with new models and config
-from flask import request, jsonify
+from flask import Response, request, jsonify, stream_with_context
 from config import app, db
-from models import User, Ingredient, PantryIngredient, Recipe, RecipeIngredient, Review, UserFavoriteRecipe
+import models  # registers the tables with Flask-Migrate
 from flask_migrate import Migrate
 import os
-from flask_bcrypt import Bcrypt
-import mysql.connector
-from flask_jwt_extended import create_access_token
-from flask_jwt_extended import get_jwt_identity
+import hashlib
+from decimal import Decimal, InvalidOperation
+from passwords import PasswordHasherBusy, hasher
+from db_pool import pool
+import repository
+from ingredient_cache import ingredient_cache
+from generation_cache import generation_cache, make_key
+from jobs import JobStoreFull, recipe_jobs
+from openai_client import UpstreamBusy, chat_client
+from prompt_builder import prompt_stats
+from pagination import (
+    TIMESTAMP_FORMAT, InvalidPageRequest, decode_int_cursor, decode_ranked_cursor, decode_timestamp_cursor, page_of,
+    parse_limit
+)
+from auth import create_user_token, current_user_id, forget_user, user_cache_stats
 from flask_jwt_extended import jwt_required
 from flask_jwt_extended import JWTManager
 from flask_jwt_extended import unset_jwt_cookies
-from recipe import generate_recipes_from_ingredients
+from recipe import MODEL, generate_recipes_from_ingredients, stream_recipes_from_ingredients
 from recipe import getListOfIngredients
+from ingredient_matching import PantryMatcher
+from cook_now import DIET_FLAGS, cook_now_index
+from allergens import recipe_flags
+from responses import FastJSONProvider, compress_response, matching_etag
+import app_logging
+import logging
+from recommendations import co_favorites
+import metrics
 from flask_cors import CORS
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError
 import json
 
 
+# Flask-SQLAlchemy's db is only used for migrations, every endpoint talks to
+# MySQL through repository.session()
+migrate = Migrate(app, db)
 
-db = mysql.connector.connect(
-    host= os.environ.get("DB_HOST"),
-    user= os.environ.get("DB_USER"),
-    password= os.environ.get("DB_PASS"),
-    database= os.environ.get("DB_NAME")
-) 
-cursor = db.cursor()
+# Longest a GET /recipe/jobs/<job_id>?wait= request may block
+RECIPE_JOB_MAX_WAIT = float(os.environ.get("RECIPE_JOB_MAX_WAIT", 30))
+# Column limits of ingredient.name, pantry_ingredient.quantity (DECIMAL(10, 2)) and pantry_ingredient.unit
+INGREDIENT_NAME_MAX_LENGTH = 255
+PANTRY_QUANTITY_LIMIT = Decimal("100000000")
+PANTRY_UNIT_MAX_LENGTH = 50
 
-def get_db_connection():
-    """Create a new database connection for each request"""
-    return mysql.connector.connect(
-        host=os.environ.get("DB_HOST"),
-        user=os.environ.get("DB_USER"),
-        password=os.environ.get("DB_PASS"),
-        database=os.environ.get("DB_NAME"),
-        autocommit=False  # We'll handle commits explicitly
-    )
+# Default ?min_reviews= for /recipe/top_rated, keeps one 5 star review from topping the list
+TOP_RATED_MIN_REVIEWS = int(os.environ.get("TOP_RATED_MIN_REVIEWS", 3))
 
-migrate = Migrate(app, db)
 app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_Secret")
-bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
+# Structured logs written off the request thread, tagged with the request id
+app_logging.setup_logging()
+app_logging.init_app(app)
+logger = logging.getLogger(__name__)
+
+# Per-route request counts and latency for /metrics, registered before compress_response
+# so the recorded latency includes compression
+metrics.init_app(app)
+
+# orjson for every jsonify()/request.json, and gzip/brotli for large bodies
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
+
 @app.route("/register", methods=["POST"])
 def register():
     data = request.json
@@ -50,41 +77,47 @@ def register():
     email = data.get("email")
     password = data.get("password")
 
-    hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
-    
-    cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-    existing_user = cursor.fetchone()
-    if existing_user:
-        return jsonify({"message": "User already exists"}), 400
+    # bcrypt runs in the password worker processes, not on this thread
+    try:
+        hashed_password = hasher.hash(password)
+    except PasswordHasherBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503
+
+    with repository.session() as repo:
+        if repo.find_user_by_email(email):
+            return jsonify({"message": "User already exists"}), 400
 
-    cursor.execute("INSERT INTO users (first_name, last_name, email, password) VALUES (%s, %s, %s, %s)", (fName, lName, email, hashed_password))
-    db.commit()
+        repo.create_user(fName, lName, email, hashed_password)
 
     return jsonify({"message": "User registered successfully"}), 201
 
 
 # Create a route to authenticate your users and return JWTs. The
-# create_access_token() function is used to actually generate the JWT.
+# create_user_token() helper in auth.py is used to actually generate the JWT.
 @app.route("/login", methods=["POST"])
 def login():
     data = request.json
     email = data.get("email")
     password = data.get("password")
-    
-    db = get_db_connection()
+
+    with repository.session() as repo:
+        user = repo.find_user_by_email(email)
+
     try:
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("SELECT email, password, user_id FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        cursor.close()
-        
-        if not user or not bcrypt.check_password_hash(user["password"], password):
+        if not user or not hasher.verify(password, user["password"]):
             return jsonify({"message": "Invalid credentials"}), 401
-        
-        access_token = create_access_token(identity=user["email"])
-        return jsonify({"access_token": access_token})
-    finally:
-        db.close()
+
+        # Upgrade hashes made with an older cost factor while we have the plain password
+        if hasher.needs_rehash(user["password"]):
+            new_hash = hasher.hash(password)
+            with repository.session() as repo:
+                repo.update_password(user["user_id"], new_hash)
+    except PasswordHasherBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503
+
+    # The user id travels in the token so later requests need not look it up
+    access_token = create_user_token(user)
+    return jsonify({"access_token": access_token})
 
 @app.route("/logout", methods=["POST"])
 @jwt_required()
@@ -99,28 +132,27 @@ def logout():
 @jwt_required()
 def get_pantry(uid):
     try:
-        # Create a new connection
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Query to join pantry_ingredient with ingredient to get names
-        query = """
-        SELECT p.ingredient_id, p.user_id, p.quantity, p.unit, i.name
-        FROM pantry_ingredient p
-        JOIN ingredient i ON p.ingredient_id = i.ingredient_id
-        WHERE p.user_id = %s
-        """
-        
-        cursor.execute(query, (uid,))
-        pantry_items = cursor.fetchall()
-        
-        # Close resources properly
-        cursor.close()
-        conn.close()
-        
-        if not pantry_items:
-            return jsonify({"message": "No pantry items found for this user.", "pantry": []}), 200
-        
+        limit = parse_limit(request.args.get("limit"))
+        after_ingredient_id = decode_int_cursor(request.args.get("cursor"))
+    except InvalidPageRequest as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        # Join pantry_ingredient with ingredient to get names, one page at a time.
+        # One extra row is fetched to know whether there is a next page.
+        with repository.session() as repo:
+            # A client that already has this version of the page gets a 304
+            # before the pantry is read
+            etag = _data_etag("pantry", uid, repo.get_data_version(uid))
+            matched = matching_etag(etag) if etag is not None else None
+            if matched is not None:
+                return _not_modified(matched)
+            pantry_items = repo.get_pantry_page(uid, after_ingredient_id, limit + 1)
+        pantry_items, next_cursor = page_of(pantry_items, limit, lambda item: item["ingredient_id"])
+
+        if not pantry_items and after_ingredient_id is None:
+            return _with_etag(jsonify({"message": "No pantry items found for this user.", "pantry": [], "next_cursor": None}), etag)
+
         result = []
         for item in pantry_items:
             result.append({
@@ -130,193 +162,155 @@ def get_pantry(uid):
                 "unit": item["unit"],
                 "ingredient": {"name": item["name"]}
             })
-        
-        return jsonify({"pantry": result})
-        
+
+        return _with_etag(jsonify({"pantry": result, "next_cursor": next_cursor}), etag)
+
     except Exception as e:
-        print(f"Error in get_pantry: {str(e)}")
+        logger.exception("Error in get_pantry")
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
 # Update for the backend - in main.py
 # Replace update_pantry function with this improved version
 
+def _parse_pantry_item(ingredient):
+    """
+    Unpack one [name, quantity, unit] entry from the update_pantry payload.
+    Everything the pantry_ingredient columns would reject is caught here, so one bad
+    entry is reported and skipped instead of failing the batch's transaction.
+    """
+    ingredient_name = ingredient[0]
+    if not isinstance(ingredient_name, str) or not ingredient_name.strip():
+        raise ValueError("Ingredient name must be a non-empty string")
+    if len(ingredient_name) > INGREDIENT_NAME_MAX_LENGTH:
+        raise ValueError(f"Ingredient name must be at most {INGREDIENT_NAME_MAX_LENGTH} characters")
+
+    quantity = ingredient[1] if ingredient[1] != "" else None
+    if quantity is not None:
+        # Numbers or numeric strings; bool is an int subclass but not a quantity
+        if isinstance(quantity, bool) or not isinstance(quantity, (int, float, str)):
+            raise ValueError("Quantity must be a number")
+        try:
+            quantity = Decimal(str(quantity).strip())
+        except InvalidOperation:
+            raise ValueError("Quantity must be a number")
+        # pantry_ingredient.quantity is DECIMAL(10, 2)
+        if not quantity.is_finite() or abs(quantity) >= PANTRY_QUANTITY_LIMIT:
+            raise ValueError(f"Quantity must be below {PANTRY_QUANTITY_LIMIT}")
+
+    unit = ingredient[2] if ingredient[2] is not None else ""
+    if not isinstance(unit, str):
+        raise ValueError("Unit must be a string")
+    if len(unit) > PANTRY_UNIT_MAX_LENGTH:
+        raise ValueError(f"Unit must be at most {PANTRY_UNIT_MAX_LENGTH} characters")
+    return ingredient_name, quantity, unit
+
 @app.route("/update_pantry/<int:uid>", methods=["PATCH"])
 @jwt_required()
 def update_pantry(uid):
     try:
         data = request.json
-        print(f"Received update_pantry request with data: {data}")
-        
+
         added_ingredients = data.get("addedIngredients", [])
         updated_ingredients = data.get("updatedIngredients", [])
         deleted_ingredients = data.get("deletedIngredients", [])
 
-        print(f"Processing {len(added_ingredients)} added, {len(updated_ingredients)} updated, and {len(deleted_ingredients)} deleted ingredients")
-        
-        # Process added ingredients
-        for ingredient in added_ingredients:
-            try:
-                ingredient_name = ingredient[0]
-                quantity = ingredient[1] if ingredient[1] != "" else None
-                unit = ingredient[2] if ingredient[2] != "" else ""
-                
-                print(f"Adding ingredient: {ingredient_name}, {quantity}, {unit}")
-                
-                # Get a fresh connection for this operation
-                conn = get_db_connection()
-                cursor = conn.cursor(dictionary=True)
-                
-                try:
-                    # Check if ingredient already exists in database
-                    cursor.execute("SELECT ingredient_id FROM ingredient WHERE name = %s", (ingredient_name,))
-                    ingredient_obj = cursor.fetchone()
-                    
-                    if not ingredient_obj:
-                        # Create new ingredient
-                        cursor.execute(
-                            "INSERT INTO ingredient (name, contains_nuts, contains_gluten, contains_meat) VALUES (%s, %s, %s, %s)",
-                            (ingredient_name, False, False, False)
-                        )
-                        conn.commit()
-                        ingredient_id = cursor.lastrowid
-                        print(f"Created new ingredient with ID: {ingredient_id}")
-                    else:
-                        ingredient_id = ingredient_obj["ingredient_id"]
-                    
-                    # Check if ingredient already exists in pantry - use a parameterized query
-                    cursor.execute(
-                        "SELECT * FROM pantry_ingredient WHERE user_id = %s AND ingredient_id = %s",
-                        (uid, ingredient_id)
-                    )
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        # Update existing entry
-                        cursor.execute(
-                            "UPDATE pantry_ingredient SET quantity = %s, unit = %s WHERE user_id = %s AND ingredient_id = %s",
-                            (quantity, unit, uid, ingredient_id)
-                        )
-                        print(f"Updated existing pantry item for {ingredient_name}")
-                    else:
-                        # Add new entry
-                        cursor.execute(
-                            "INSERT INTO pantry_ingredient (user_id, ingredient_id, quantity, unit) VALUES (%s, %s, %s, %s)",
-                            (uid, ingredient_id, quantity, unit)
-                        )
-                        print(f"Added new pantry item for {ingredient_name}")
-                    
-                    conn.commit()
-                    
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error processing ingredient {ingredient_name}: {str(e)}")
-                    # Continue to next ingredient instead of failing the entire request
-                finally:
-                    cursor.close()
-                    conn.close()
-                    
-            except Exception as e:
-                print(f"Error processing added ingredient {ingredient}: {str(e)}")
-                # Continue to next ingredient
-        
-        # Process updated ingredients
-        for ingredient in updated_ingredients:
-            try:
-                ingredient_name = ingredient[0]
-                quantity = ingredient[1] if ingredient[1] != "" else None
-                unit = ingredient[2] if ingredient[2] != "" else ""
-                
-                print(f"Updating ingredient: {ingredient_name}, {quantity}, {unit}")
-                
-                # Get a fresh connection for this operation
-                conn = get_db_connection()
-                cursor = conn.cursor(dictionary=True)
-                
+        logger.debug("Updating pantry", extra={
+            "user_id": uid,
+            "added": len(added_ingredients),
+            "updated": len(updated_ingredients),
+            "deleted": len(deleted_ingredients)
+        })
+
+        # Per item outcomes, in the same order as the request payload
+        results = {"added": [], "updated": [], "deleted": []}
+
+        # Validate every entry up front, malformed entries are reported and skipped
+        added, updated, deleted = [], [], []
+        for section, entries, parsed in (("added", added_ingredients, added), ("updated", updated_ingredients, updated)):
+            for ingredient in entries:
+                outcome = {"name": ingredient[0] if isinstance(ingredient, list) and ingredient else ingredient}
+                results[section].append(outcome)
                 try:
-                    # Find the ingredient
-                    cursor.execute("SELECT ingredient_id FROM ingredient WHERE name = %s", (ingredient_name,))
-                    ingredient_obj = cursor.fetchone()
-                    
-                    if not ingredient_obj:
-                        print(f"Ingredient not found: {ingredient_name}")
-                        # Skip this ingredient instead of failing the entire request
-                        continue
-                    
-                    ingredient_id = ingredient_obj["ingredient_id"]
-                    
-                    # Check if ingredient exists in pantry
-                    cursor.execute(
-                        "SELECT * FROM pantry_ingredient WHERE user_id = %s AND ingredient_id = %s",
-                        (uid, ingredient_id)
-                    )
-                    existing = cursor.fetchone()
-                    
-                    if not existing:
-                        print(f"Ingredient not in pantry: {ingredient_name}")
-                        # Skip this ingredient instead of failing
-                        continue
-                    
-                    # Update the entry
-                    cursor.execute(
-                        "UPDATE pantry_ingredient SET quantity = %s, unit = %s WHERE user_id = %s AND ingredient_id = %s",
-                        (quantity, unit, uid, ingredient_id)
-                    )
-                    
-                    conn.commit()
-                    
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error updating ingredient {ingredient_name}: {str(e)}")
-                    # Continue to next ingredient
-                finally:
-                    cursor.close()
-                    conn.close()
-                
-            except Exception as e:
-                print(f"Error processing updated ingredient {ingredient}: {str(e)}")
-                # Continue to next ingredient
-        
-        # Process deleted ingredients - one at a time with separate connections
+                    parsed.append((outcome, *_parse_pantry_item(ingredient)))
+                except (TypeError, IndexError, ValueError) as e:
+                    outcome.update(status="error", message=f"Invalid ingredient entry: {str(e)}")
         for ingredient_name in deleted_ingredients:
-            try:
-                print(f"Deleting ingredient: {ingredient_name}")
-                
-                # Get a fresh connection for this operation
-                conn = get_db_connection()
-                cursor = conn.cursor(dictionary=True)
-                
-                try:
-                    # Use a JOIN to make sure we only delete the right ingredient
-                    delete_query = """
-                    DELETE p FROM pantry_ingredient p
-                    JOIN ingredient i ON p.ingredient_id = i.ingredient_id
-                    WHERE p.user_id = %s AND i.name = %s
-                    """
-                    
-                    cursor.execute(delete_query, (uid, ingredient_name))
-                    
-                    if cursor.rowcount > 0:
-                        print(f"Successfully deleted {ingredient_name}")
+            outcome = {"name": ingredient_name}
+            results["deleted"].append(outcome)
+            if isinstance(ingredient_name, str):
+                deleted.append((outcome, ingredient_name))
+            else:
+                outcome.update(status="error", message="Ingredient name must be a string")
+
+        try:
+            # The whole payload is applied in one transaction with a handful of
+            # set based statements, however many ingredients it contains
+            with repository.session() as repo:
+                # Resolve every name through the ingredient cache (one IN (...)
+                # lookup for the names it has not seen), then create the missing
+                # added ingredients with one multi-row INSERT
+                all_names = [item[1] for item in added + updated] + [item[1] for item in deleted]
+                ingredient_ids = repo.find_ingredient_ids(all_names)
+                new_names = [item[1] for item in added if repository.ingredient_key(item[1]) not in ingredient_ids]
+                ingredient_ids.update(repo.create_ingredients(new_names))
+
+                # Which of those ingredients are already in this user's pantry
+                in_pantry = repo.get_pantry_items_by_name(uid, list({item[1] for item in added + updated + deleted}))
+
+                # Added ingredients are inserted, or overwrite the existing row
+                pantry_rows = {}
+                for outcome, ingredient_name, quantity, unit in added:
+                    ingredient_id = ingredient_ids.get(repository.ingredient_key(ingredient_name))
+                    if ingredient_id is None:
+                        raise LookupError(f"Could not resolve ingredient: {ingredient_name}")
+                    outcome["status"] = "updated" if ingredient_id in in_pantry or ingredient_id in pantry_rows else "added"
+                    pantry_rows[ingredient_id] = (ingredient_id, quantity, unit)
+
+                # Updated ingredients must already exist in the pantry (or have just been added)
+                for outcome, ingredient_name, quantity, unit in updated:
+                    ingredient_id = ingredient_ids.get(repository.ingredient_key(ingredient_name))
+                    if ingredient_id is None:
+                        outcome["status"] = "not_found"
+                    elif ingredient_id not in in_pantry and ingredient_id not in pantry_rows:
+                        outcome["status"] = "not_in_pantry"
                     else:
-                        print(f"No matching pantry item found for {ingredient_name}")
-                    
-                    conn.commit()
-                    
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error deleting ingredient {ingredient_name}: {str(e)}")
-                finally:
-                    cursor.close()
-                    conn.close()
-                
-            except Exception as e:
-                print(f"Error processing deleted ingredient {ingredient_name}: {str(e)}")
-                # Continue to next ingredient
-        
-        return jsonify({"message": "Successfully updated pantry."})
-        
+                        outcome["status"] = "updated"
+                        pantry_rows[ingredient_id] = (ingredient_id, quantity, unit)
+
+                repo.upsert_pantry_items(uid, list(pantry_rows.values()))
+
+                # Deleted ingredients are removed last, like the old per item loop did,
+                # so deleting something added in the same payload still removes it
+                pantry_ids_by_name = {}
+                for ingredient_id, name in in_pantry.items():
+                    pantry_ids_by_name.setdefault(repository.ingredient_key(name), set()).add(ingredient_id)
+
+                deleted_ids = set()
+                for outcome, ingredient_name in deleted:
+                    key = repository.ingredient_key(ingredient_name)
+                    matches = set(pantry_ids_by_name.get(key, ()))
+                    ingredient_id = ingredient_ids.get(key)
+                    if ingredient_id in in_pantry or ingredient_id in pantry_rows:
+                        matches.add(ingredient_id)
+                    outcome["status"] = "deleted" if matches else "not_found"
+                    deleted_ids.update(matches)
+
+                repo.remove_pantry_items(uid, list(deleted_ids))
+                repo.bump_data_version(uid)
+
+        except Exception as e:
+            # The transaction was rolled back, so nothing that was pending got applied
+            logger.exception("Error applying pantry update", extra={"user_id": uid})
+            for section in results.values():
+                for outcome in section:
+                    if outcome.get("status") != "error":
+                        outcome.update(status="error", message=str(e))
+            return jsonify({"message": f"Server error: {str(e)}", "results": results}), 500
+
+        return jsonify({"message": "Successfully updated pantry.", "results": results})
+
     except Exception as e:
-        print(f"Error in update_pantry: {str(e)}")
+        logger.exception("Error in update_pantry")
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
 
@@ -325,99 +319,88 @@ def update_pantry(uid):
 def save_recipe(uid):
     data = request.json
     recipe_data = data.get("recipe")
-    
+
     if not recipe_data:
         return jsonify({"message": "No recipe data provided"}), 400
-    
-    # Create the recipe
-    new_recipe = Recipe(
-        name=recipe_data.get("recipeName"),
-        description=recipe_data.get("description"),
-        steps=json.dumps(recipe_data.get("steps")),
-        is_vegetarian=recipe_data.get("allergyFlags", {}).get("containsVegetarian", False),
-        is_gluten_free=not recipe_data.get("allergyFlags", {}).get("containsGluten", False),
-        is_nut_free=not recipe_data.get("allergyFlags", {}).get("containsNuts", False)
-    )
-    
-    db.session.add(new_recipe)
-    db.session.commit()
-    
-    # Add ingredients
-    ingredients_list = recipe_data.get("ingredients", "").split(", ")
-    for ingredient_name in ingredients_list:
-        # Check if ingredient exists
-        ingredient = Ingredient.query.filter_by(name=ingredient_name).first()
-        if not ingredient:
-            # Create new ingredient
-            ingredient = Ingredient(
-                name=ingredient_name,
-                contains_nuts=False,  # Default values, can be updated later
-                contains_gluten=False,
-                contains_meat=False
-            )
-            db.session.add(ingredient)
-            db.session.commit()
-        
-        # Create recipe ingredient relationship
-        recipe_ingredient = RecipeIngredient(
-            recipe_id=new_recipe.recipe_id,
-            ingredient_id=ingredient.ingredient_id,
-            quantity=1.0,  # Default values, can be updated later
-            unit="unit"
+
+    with repository.session() as repo:
+        # Resolve the ingredients first (known names come from the cache),
+        # creating the ones that do not exist yet
+        ingredients_list = [name.strip() for name in recipe_data.get("ingredients", "").split(", ") if name.strip()]
+        ingredient_ids = repo.get_or_create_ingredients(ingredients_list)
+
+        # The model's diet flags, cleared where an ingredient says otherwise
+        allergy_flags = recipe_data.get("allergyFlags", {})
+        is_vegetarian, is_gluten_free, is_nut_free = recipe_flags(
+            ingredients_list,
+            allergy_flags.get("containsVegetarian", False),
+            not allergy_flags.get("containsGluten", False),
+            not allergy_flags.get("containsNuts", False)
         )
-        db.session.add(recipe_ingredient)
-    
-    db.session.commit()
-    
-    # Add to user favorites
-    user_favorite = UserFavoriteRecipe(
-        user_id=uid,
-        recipe_id=new_recipe.recipe_id
-    )
-    db.session.add(user_favorite)
-    db.session.commit()
-    
-    return jsonify({"message": "Recipe saved successfully", "recipe_id": new_recipe.recipe_id}), 201
+
+        # Create the recipe
+        recipe_id = repo.create_recipe(
+            recipe_data.get("recipeName"),
+            recipe_data.get("description"),
+            json.dumps(recipe_data.get("steps")),
+            is_vegetarian,
+            is_gluten_free,
+            is_nut_free,
+            ingredients_list
+        )
+
+        # Create recipe ingredient relationships
+        repo.add_recipe_ingredients(
+            recipe_id,
+            ingredient_ids,
+            1.0,  # Default values, can be updated later
+            "unit"
+        )
+
+        # Add to user favorites
+        saved_before = repo.get_favorite_ids(uid, co_favorites.max_user_favorites)
+        repo.add_favorite(uid, recipe_id)
+        repo.bump_data_version(uid)
+
+    cook_now_index.add_recipe(recipe_id, ingredients_list, is_vegetarian, is_gluten_free, is_nut_free)
+    co_favorites.add_favorite(recipe_id, saved_before)
+
+    return jsonify({"message": "Recipe saved successfully", "recipe_id": recipe_id}), 201
 
 ##### Account Page Endpoints #####
 @app.route("/update_preferences/<int:uid>", methods=["PATCH"])
 @jwt_required()
 def update_preferences(uid):
-    user = User.query.get(uid)
-    if not user:
-        return jsonify({"message": "User not found."}), 404
-    
-    data = request.json
-    user.is_vegetarian = data.get("isVegetarian", user.is_vegetarian)
-    user.is_nut_free = data.get("isNutFree", user.is_nut_free)
-    user.is_gluten_free = data.get("isGlutenFree", user.is_gluten_free)
+    with repository.session() as repo:
+        user = repo.find_user(uid)
+        if not user:
+            return jsonify({"message": "User not found."}), 404
+
+        data = request.json
+        repo.update_preferences(
+            uid,
+            data.get("isVegetarian", user["is_vegetarian"]),
+            data.get("isNutFree", user["is_nut_free"]),
+            data.get("isGlutenFree", user["is_gluten_free"])
+        )
 
-    db.session.commit()
     return jsonify({"message": "User updated successfully."})
 
 @app.route("/delete_user/<int:uid>", methods=["POST"])
 @jwt_required()
 def delete_user(uid):
-    user = User.query.get(uid)
-
-    if user is None:
-        return jsonify({"message": "A user could not be found with the given user_id"})
-    
-    # delete the user's pantry ingredients
-    ingredients = PantryIngredient.query.filter_by(user_id=uid)
-    for item in ingredients:
-        db.session.delete(item)
+    with repository.session() as repo:
+        user = repo.find_user(uid)
 
-    # delete the recipes saved by the user (?)
-    # recipes = Recipe.query.filter_by(user_id=uid)
-    # for item in recipes:
-    #    db.session.delete(item)
+        if user is None:
+            return jsonify({"message": "A user could not be found with the given user_id"})
 
-    # delete the user
-    db.session.delete(user)
-
-    db.session.commit()
+        # delete the user's reviews, favorites and pantry ingredients, then the user
+        # (recipes saved by the user are kept, their ratings leave the recipe summaries)
+        repo.bump_data_version(uid)
+        repo.delete_user(uid)
 
+    forget_user(user["email"])
     return jsonify({"message": "User successfully deleted."})
 
 @app.route("/recipe/generate", methods=["POST"])
@@ -425,81 +408,167 @@ def delete_user(uid):
 def generate():
     data = request.json
     user_query = data.get("user_query")
-    current_user_email = get_jwt_identity()
-    
-    # Get the user from the database using the JWT identity (email)
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
+
     try:
-        # Find the user ID from the email
-        cursor.execute("SELECT user_id FROM users WHERE email = %s", (current_user_email,))
-        user = cursor.fetchone()
-        
-        if not user:
+        # The user ID comes from the JWT, no lookup by email needed
+        user_id = current_user_id()
+        if user_id is None:
             return jsonify({"message": "User not found"}), 404
-        
-        user_id = user["user_id"]
-        
-        # Get the pantry ingredients for this user using the existing query
-        query = """
-        SELECT p.ingredient_id, p.user_id, p.quantity, p.unit, i.name
-        FROM pantry_ingredient p
-        JOIN ingredient i ON p.ingredient_id = i.ingredient_id
-        WHERE p.user_id = %s
-        """
-        
-        cursor.execute(query, (user_id,))
-        pantry_items = cursor.fetchall()
-        
-        # Format ingredients for the AI with consistent formatting
-        ingredients_list = []
-        for item in pantry_items:
-            # Format quantity if it exists
-            if item['quantity'] is not None and item['unit']:
-                ingredients_list.append(f"{item['name']} ({float(item['quantity'])} {item['unit']})")
-            elif item['quantity'] is not None:
-                ingredients_list.append(f"{item['name']} ({float(item['quantity'])})")
-            else:
-                ingredients_list.append(item['name'])
-        
-        # Join ingredients into a comma-separated string
-        ingredients = ", ".join(ingredients_list) if ingredients_list else ""
-        
-        print(f"User query: {user_query}")
-        print(f"Ingredients from pantry: {ingredients}")
-        
-        # Generate recipes using the ingredients and user query
-        result = generate_recipes_from_ingredients(user_query, ingredients)
-        
-        # Additional verification of results to ensure matching with pantry
-        if 'recipes' in result:
-            pantry_items_lower = [item['name'].lower() for item in pantry_items]
-            
-            for recipe in result['recipes']:
-                if 'missingIngredients' in recipe and recipe['missingIngredients']:
-                    # Clean up and verify missing ingredients
-                    missing_ingredients = []
-                    for missing in recipe['missingIngredients'].split(','):
-                        missing_item = missing.strip().lower()
-                        # Only keep as missing if truly not in pantry
-                        if not any(pantry_item in missing_item or missing_item in pantry_item 
-                                  for pantry_item in pantry_items_lower):
-                            missing_ingredients.append(missing.strip())
-                    
-                    # Update missing ingredients list
-                    recipe['missingIngredients'] = ", ".join(missing_ingredients)
-        
+
+        with repository.session() as repo:
+            # Get the pantry ingredients for this user
+            pantry_items = repo.get_pantry(user_id)
+
+        # The connection is back in the pool before the (slow) LLM call starts
+        result = _generate_for_pantry(user_query, pantry_items)
+
         return jsonify(result)
-        
+
+    except UpstreamBusy:
+        return jsonify({"message": "Too many recipe generations in progress, please try again shortly"}), 503
+    except Exception as e:
+        logger.exception("Error in recipe generation")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+
+@app.route("/recipe/generate/stream", methods=["POST"])
+@jwt_required()
+def generate_stream():
+    """
+    Streaming variant of /recipe/generate. Responds with Server-Sent Events:
+    one "recipe" event per recipe as soon as the model has finished it, then a
+    "done" event (or an "error" event if generation fails part way).
+    """
+    data = request.json
+    user_query = data.get("user_query")
+
+    try:
+        user_id = current_user_id()
+        if user_id is None:
+            return jsonify({"message": "User not found"}), 404
+
+        # Read the pantry up front so no connection is held while the model streams
+        with repository.session() as repo:
+            pantry_items = repo.get_pantry(user_id)
+
     except Exception as e:
-        print(f"Error in recipe generation: {str(e)}")
+        logger.exception("Error in recipe generation")
         return jsonify({"message": f"Server error: {str(e)}"}), 500
-    
-    finally:
-        cursor.close()
-        conn.close()
 
+    ingredients = _format_pantry(pantry_items)
+    matcher = PantryMatcher(item['name'] for item in pantry_items)
+
+    def events():
+        count = 0
+        try:
+            for recipe in stream_recipes_from_ingredients(user_query, ingredients):
+                _reconcile_missing_ingredients(recipe, matcher)
+                count += 1
+                yield _sse("recipe", recipe)
+            yield _sse("done", {"count": count})
+        except Exception as e:
+            logger.exception("Error in streaming recipe generation")
+            yield _sse("error", {"message": f"Server error: {str(e)}"})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/recipe/jobs", methods=["POST"])
+@jwt_required()
+def submit_generate_job():
+    """
+    Asynchronous variant of /recipe/generate. Answers 202 with a job_id straight
+    away; poll GET /recipe/jobs/<job_id> for the result. Submitting the same
+    query with an unchanged pantry while a job is pending returns that job.
+    """
+    data = request.json
+    user_query = data.get("user_query")
+
+    try:
+        user_id = current_user_id()
+        if user_id is None:
+            return jsonify({"message": "User not found"}), 404
+
+        with repository.session() as repo:
+            pantry_items = repo.get_pantry(user_id)
+
+        dedupe_key = make_key(user_query, _format_pantry(pantry_items), MODEL)
+        job, created = recipe_jobs.submit(user_id, dedupe_key, _generate_for_pantry, user_query, pantry_items)
+
+    except JobStoreFull:
+        return jsonify({"message": "Too many recipe generations in progress, please try again shortly"}), 503
+    except Exception as e:
+        logger.exception("Error in recipe job submission")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+    response = jsonify(job.to_dict())
+    response.headers["Location"] = f"/recipe/jobs/{job.id}"
+    return response, 202 if created else 200
+
+@app.route("/recipe/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def get_generate_job(job_id):
+    """Optional ?wait=<seconds> long-polls until the job finishes (capped at RECIPE_JOB_MAX_WAIT)"""
+    try:
+        wait = min(float(request.args.get("wait", 0)), RECIPE_JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"message": "wait must be a number of seconds"}), 400
+
+    user_id = current_user_id()
+    job = recipe_jobs.get(job_id, user_id) if user_id is not None else None
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+
+    if wait > 0:
+        job.wait(wait)
+    return jsonify(job.to_dict())
+
+def _generate_for_pantry(user_query, pantry_items):
+    """Run the LLM for a pantry and drop 'missing' ingredients that are actually in it"""
+    ingredients = _format_pantry(pantry_items)
+
+    logger.debug("Generating recipes", extra={"user_query": user_query, "pantry_items": len(pantry_items)})
+
+    # Generate recipes using the ingredients and user query
+    result = generate_recipes_from_ingredients(user_query, ingredients)
+
+    # Additional verification of results to ensure matching with pantry
+    if 'recipes' in result:
+        matcher = PantryMatcher(item['name'] for item in pantry_items)
+        for recipe in result['recipes']:
+            _reconcile_missing_ingredients(recipe, matcher)
+    return result
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _format_pantry(pantry_items):
+    """Format pantry rows for the prompt as "name (quantity unit), ..." """
+    ingredients_list = []
+    for item in pantry_items:
+        # Format quantity if it exists
+        if item['quantity'] is not None and item['unit']:
+            ingredients_list.append(f"{item['name']} ({float(item['quantity'])} {item['unit']})")
+        elif item['quantity'] is not None:
+            ingredients_list.append(f"{item['name']} ({float(item['quantity'])})")
+        else:
+            ingredients_list.append(item['name'])
+
+    # Join ingredients into a comma-separated string
+    return ", ".join(ingredients_list) if ingredients_list else ""
+
+def _reconcile_missing_ingredients(recipe, matcher):
+    """Drop entries from recipe['missingIngredients'] that the pantry (a PantryMatcher) already has"""
+    if 'missingIngredients' in recipe and recipe['missingIngredients']:
+        # Only keep as missing if truly not in pantry
+        missing = [item.strip() for item in recipe['missingIngredients'].split(',') if item.strip()]
+        missing_ingredients = matcher.missing(missing)
+
+        # Update missing ingredients list
+        recipe['missingIngredients'] = ", ".join(missing_ingredients)
 
 ##### Additional Helper Functions #####
 
@@ -507,333 +576,607 @@ def add_pantry_ingredient(uid, ingredient_id, quantity, unit):
     if not ingredient_id or quantity is None or not unit:
         return False
 
-    new_item = PantryIngredient(user_id=uid, ingredient_id=ingredient_id, quantity=quantity, unit=unit)
     try:
-        db.session.add(new_item)
-        db.session.commit()
+        with repository.session() as repo:
+            repo.add_pantry_item(uid, ingredient_id, quantity, unit)
+            repo.bump_data_version(uid)
         return True
     except Exception as e:
-        db.session.rollback()
         return False
 
 def update_pantry_ingredient(uid, ingredient_id, quantity, unit):
     if not ingredient_id or quantity is None or not unit:
         return False
 
-    pantry_item = PantryIngredient.query.filter_by(user_id=uid, ingredient_id=ingredient_id).first()
-    if not pantry_item:
-        return False
+    with repository.session() as repo:
+        if not repo.pantry_item_exists(uid, ingredient_id):
+            return False
 
-    pantry_item.quantity = quantity
-    pantry_item.unit = unit
-    db.session.commit()
+        repo.update_pantry_item(uid, ingredient_id, quantity, unit)
+        repo.bump_data_version(uid)
     return True
 
 def remove_pantry_ingredient(uid, ingredient_id):
     if not ingredient_id:
         return True # ingredient is not in db, so return true
 
-    pantry_item = PantryIngredient.query.filter_by(user_id=uid, ingredient_id=ingredient_id).first()
-    if not pantry_item:
-        return True # again, ingredient is not in db, so return true
-
-    db.session.delete(pantry_item)
-    db.session.commit()
+    with repository.session() as repo:
+        # if the ingredient is not in the pantry there is nothing to delete, so still return true
+        repo.remove_pantry_item(uid, ingredient_id)
+        repo.bump_data_version(uid)
     return True
 
 
+@app.route("/recipe/cook_now", methods=["GET"])
+@jwt_required()
+def cook_now():
+    """
+    Saved recipes ranked by how much of their ingredient list the user's pantry
+    covers, filtered by the user's dietary preferences. No LLM call.
+    Optional query parameters: ?limit=20&min_coverage=0.5
+    """
+    try:
+        limit = parse_limit(request.args.get("limit"), default=20)
+    except InvalidPageRequest as e:
+        return jsonify({"message": str(e)}), 400
+    try:
+        min_coverage = float(request.args.get("min_coverage", 0))
+    except ValueError:
+        return jsonify({"message": "min_coverage must be a number between 0 and 1"}), 400
+
+    try:
+        user_id = current_user_id()
+        with repository.session() as repo:
+            user = repo.find_user(user_id) if user_id is not None else None
+
+            if user is None:
+                return jsonify({"message": "User not found"}), 404
+
+            pantry_items = repo.get_pantry(user_id)
+            cook_now_index.refresh(repo)
+
+            require = tuple(flag for flag in DIET_FLAGS if user[flag])
+            # The index keeps the flags a recipe had when it was indexed, classify_ingredients.py
+            # may have cleared some since. Over-fetch and check the flags on the current rows.
+            ranked = cook_now_index.top([item["name"] for item in pantry_items], limit * 3, require, min_coverage)
+
+            recipes = repo.get_recipes([recipe_id for recipe_id, _, _, _ in ranked])
+            ranked = [
+                entry for entry in ranked
+                if entry[0] in recipes and all(recipes[entry[0]][flag] for flag in require)
+            ][:limit]
+            ingredients_by_recipe = repo.get_recipe_ingredient_names([recipe_id for recipe_id, _, _, _ in ranked])
+
+        results = []
+        for recipe_id, coverage, matched, total in ranked:
+            recipe = _format_recipe(recipes[recipe_id], ingredients_by_recipe[recipe_id])
+            recipe.update({"coverage": coverage, "matchedIngredients": matched, "totalIngredients": total})
+            results.append(recipe)
+
+        return jsonify({"recipes": results})
+
+    except Exception as e:
+        logger.exception("Error in cook_now")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+@app.route("/recipe/search", methods=["GET"])
+@jwt_required()
+def search_recipes():
+    """
+    Full-text search over saved recipes (name, description, steps and ingredients),
+    best match first.
+    Query parameters: ?q=spicy chicken&vegetarian=1&gluten_free=1&nut_free=1&limit=20&cursor=...
+    """
+    text = request.args.get("q", "").strip()
+    if not text:
+        return jsonify({"message": "q is required"}), 400
+    try:
+        limit = parse_limit(request.args.get("limit"), default=20)
+        after = decode_ranked_cursor(request.args.get("cursor"))
+    except InvalidPageRequest as e:
+        return jsonify({"message": str(e)}), 400
+
+    # ?vegetarian=1 -> is_vegetarian must be set, and so on
+    require = tuple(
+        flag for flag in DIET_FLAGS
+        if request.args.get(flag[3:], "").lower() in ("1", "true", "yes")
+    )
+
+    try:
+        with repository.session() as repo:
+            recipes = repo.search_recipes(text, require, after, limit + 1)
+            recipes, next_cursor = page_of(recipes, limit, lambda recipe: [float(recipe["score"]), recipe["recipe_id"]])
+            ingredients_by_recipe = repo.get_recipe_ingredient_names([recipe["recipe_id"] for recipe in recipes])
+
+        results = []
+        for recipe in recipes:
+            formatted = _format_recipe(recipe, ingredients_by_recipe[recipe["recipe_id"]])
+            formatted["score"] = round(float(recipe["score"]), 4)
+            results.append(formatted)
+
+        return jsonify({"recipes": results, "next_cursor": next_cursor})
+
+    except Exception as e:
+        logger.exception("Error in search_recipes")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+@app.route("/recipe/<int:recipe_id>/also_saved", methods=["GET"])
+@jwt_required()
+def also_saved(recipe_id):
+    """
+    Recipes most often saved by the users who saved this one, from the
+    in-memory co-favorite index. Optional query parameter: ?limit=10
+    """
+    try:
+        limit = parse_limit(request.args.get("limit"), default=10)
+    except InvalidPageRequest as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        with repository.session() as repo:
+            co_favorites.refresh(repo)
+            similar = co_favorites.similar(recipe_id, limit)
+
+            recipe_ids = [other for other, _, _ in similar]
+            recipes = repo.get_recipes(recipe_ids)
+            ingredients_by_recipe = repo.get_recipe_ingredient_names(recipe_ids)
+
+        results = []
+        for other, score, together in similar:
+            if other not in recipes:
+                continue
+            recipe = _format_recipe(recipes[other], ingredients_by_recipe[other])
+            recipe.update({"score": score, "savedTogether": together})
+            results.append(recipe)
+
+        return jsonify({"recipes": results})
+
+    except Exception as e:
+        logger.exception("Error in also_saved")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+@app.route("/recipe/recommended", methods=["GET"])
+@jwt_required()
+def recommended():
+    """
+    Recipes similar to the user's favorites that they have not saved yet,
+    filtered by the user's dietary preferences. Optional query parameter: ?limit=20
+    """
+    try:
+        limit = parse_limit(request.args.get("limit"), default=20)
+    except InvalidPageRequest as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        user_id = current_user_id()
+        with repository.session() as repo:
+            user = repo.find_user(user_id) if user_id is not None else None
+
+            if user is None:
+                return jsonify({"message": "User not found"}), 404
+
+            co_favorites.refresh(repo)
+            saved = repo.get_favorite_ids(user_id, co_favorites.max_user_favorites)
+            # Over-fetch so recipes dropped by the diet filter can be replaced
+            ranked = co_favorites.recommend(saved, limit * 3)
+
+            recipe_ids = [recipe_id for recipe_id, _ in ranked]
+            recipes = repo.get_recipes(recipe_ids)
+            require = tuple(flag for flag in DIET_FLAGS if user[flag])
+            ranked = [
+                (recipe_id, score) for recipe_id, score in ranked
+                if recipe_id in recipes and all(recipes[recipe_id][flag] for flag in require)
+            ][:limit]
+            ingredients_by_recipe = repo.get_recipe_ingredient_names([recipe_id for recipe_id, _ in ranked])
+
+        results = []
+        for recipe_id, score in ranked:
+            recipe = _format_recipe(recipes[recipe_id], ingredients_by_recipe[recipe_id])
+            recipe["score"] = score
+            results.append(recipe)
+
+        return jsonify({"recipes": results})
+
+    except Exception as e:
+        logger.exception("Error in recommended")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+##### Review Endpoints #####
+@app.route("/recipe/<int:recipe_id>/reviews", methods=["GET"])
+@jwt_required()
+def get_reviews(recipe_id):
+    """
+    The recipe's rating summary and one page of its reviews, newest first.
+    Optional query parameters: ?limit=50&cursor=<next_cursor from the previous page>
+    """
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        before = decode_timestamp_cursor(request.args.get("cursor"))
+    except InvalidPageRequest as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        with repository.session() as repo:
+            summary = repo.get_rating_summary(recipe_id)
+            reviews = repo.get_reviews_page(recipe_id, before, limit + 1)
+            reviews, next_cursor = page_of(
+                reviews, limit, lambda review: [review["created_at"].strftime(TIMESTAMP_FORMAT), review["user_id"]]
+            )
+
+        return jsonify({
+            "summary": _format_rating_summary(recipe_id, summary),
+            "reviews": [_format_review(review) for review in reviews],
+            "next_cursor": next_cursor
+        })
+
+    except Exception as e:
+        logger.exception("Error in get_reviews")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+@app.route("/recipe/<int:recipe_id>/reviews", methods=["POST"])
+@jwt_required()
+def create_review(recipe_id):
+    rating, review_text, error = _parse_review(request.json)
+    if error:
+        return jsonify({"message": error}), 400
+
+    try:
+        user_id = current_user_id()
+        if user_id is None:
+            return jsonify({"message": "User not found"}), 404
+
+        try:
+            with repository.session() as repo:
+                if not repo.get_recipes([recipe_id]):
+                    return jsonify({"message": "Recipe not found"}), 404
+                if repo.get_review(recipe_id, user_id) is not None:
+                    return jsonify({"message": "You have already reviewed this recipe"}), 409
+
+                # The review and the recipe's rating summary commit together
+                repo.create_review(recipe_id, user_id, rating, review_text)
+                summary = repo.get_rating_summary(recipe_id)
+        except IntegrityError as e:
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                # Another request from the same user inserted the review first
+                return jsonify({"message": "You have already reviewed this recipe"}), 409
+            if e.errno in (errorcode.ER_NO_REFERENCED_ROW_2, errorcode.ER_NO_REFERENCED_ROW):
+                # The recipe or the user was deleted after the checks above
+                return jsonify({"message": "Recipe or user not found"}), 404
+            raise
+
+        return jsonify({
+            "message": "Review saved successfully",
+            "summary": _format_rating_summary(recipe_id, summary)
+        }), 201
+
+    except Exception as e:
+        logger.exception("Error in create_review")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+@app.route("/recipe/<int:recipe_id>/reviews", methods=["PUT"])
+@jwt_required()
+def update_review(recipe_id):
+    rating, review_text, error = _parse_review(request.json)
+    if error:
+        return jsonify({"message": error}), 400
+
+    try:
+        user_id = current_user_id()
+        if user_id is None:
+            return jsonify({"message": "User not found"}), 404
+
+        with repository.session() as repo:
+            if not repo.update_review(recipe_id, user_id, rating, review_text):
+                return jsonify({"message": "You have not reviewed this recipe"}), 404
+            summary = repo.get_rating_summary(recipe_id)
+
+        return jsonify({
+            "message": "Review updated successfully",
+            "summary": _format_rating_summary(recipe_id, summary)
+        })
+
+    except Exception as e:
+        logger.exception("Error in update_review")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+@app.route("/recipe/top_rated", methods=["GET"])
+@jwt_required()
+def top_rated():
+    """
+    Recipes with the best average rating, read from the rating summary index.
+    Optional query parameters: ?limit=20&min_reviews=3 (recipes with fewer reviews are left out)
+    """
+    try:
+        limit = parse_limit(request.args.get("limit"), default=20)
+    except InvalidPageRequest as e:
+        return jsonify({"message": str(e)}), 400
+    try:
+        min_reviews = max(int(request.args.get("min_reviews", TOP_RATED_MIN_REVIEWS)), 1)
+    except ValueError:
+        return jsonify({"message": "min_reviews must be an integer"}), 400
+
+    try:
+        with repository.session() as repo:
+            recipes = repo.get_top_rated(min_reviews, limit)
+            ingredients_by_recipe = repo.get_recipe_ingredient_names([recipe["recipe_id"] for recipe in recipes])
+
+        results = []
+        for recipe in recipes:
+            formatted = _format_recipe(recipe, ingredients_by_recipe[recipe["recipe_id"]])
+            formatted.update({"averageRating": float(recipe["rating_avg"]), "reviewCount": recipe["review_count"]})
+            results.append(formatted)
+
+        return jsonify({"recipes": results})
+
+    except Exception as e:
+        logger.exception("Error in top_rated")
+        return jsonify({"message": f"Server error: {str(e)}"}), 500
+
+def _parse_review(data):
+    """Return (rating, review_text, error message) from a review request body"""
+    data = data or {}
+    rating = data.get("rating")
+    if not isinstance(rating, int) or isinstance(rating, bool) or not 1 <= rating <= 5:
+        return None, None, "rating must be an integer from 1 to 5"
+    review_text = data.get("reviewText")
+    if review_text is not None and not isinstance(review_text, str):
+        return None, None, "reviewText must be a string"
+    return rating, review_text, None
+
+def _format_review(review):
+    return {
+        "recipeId": review["recipe_id"],
+        "userId": review["user_id"],
+        "rating": review["rating"],
+        "reviewText": review["review_text"],
+        "createdAt": review["created_at"].strftime(TIMESTAMP_FORMAT) if review["created_at"] else None
+    }
+
+def _format_rating_summary(recipe_id, summary):
+    """Shape a recipe_rating_summary row (None when the recipe has no reviews yet)"""
+    if summary is None:
+        return {"recipeId": recipe_id, "reviewCount": 0, "averageRating": None, "histogram": [0, 0, 0, 0, 0]}
+    return {
+        "recipeId": recipe_id,
+        "reviewCount": summary["review_count"],
+        "averageRating": float(summary["rating_avg"]) if summary["rating_avg"] is not None else None,
+        "histogram": [summary[f"rating_{stars}"] for stars in range(1, 6)]
+    }
+
 @app.route("/save_ai_recipe", methods=["POST"])
 @jwt_required()
 def save_ai_recipe():
     try:
         data = request.json
         recipe_data = data.get("recipe")
-        current_user_email = get_jwt_identity()
-        
+
         if not recipe_data:
             return jsonify({"message": "No recipe data provided"}), 400
-        
-        # Get a fresh connection
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
+
         try:
-            # Find the user ID from the email
-            cursor.execute("SELECT user_id FROM users WHERE email = %s", (current_user_email,))
-            user = cursor.fetchone()
-            
-            if not user:
+            # The user ID comes from the JWT, no lookup by email needed
+            user_id = current_user_id()
+            if user_id is None:
                 return jsonify({"message": "User not found"}), 404
-            
-            user_id = user["user_id"]
-            
-            # Check if recipe name already exists for this user
-            recipe_name = recipe_data.get("recipeName") or recipe_data.get("name")
-            
-            cursor.execute(
-                """
-                SELECT r.recipe_id 
-                FROM recipe r 
-                JOIN user_favorite_recipes uf ON r.recipe_id = uf.recipe_id 
-                WHERE uf.user_id = %s AND r.name = %s
-                """, 
-                (user_id, recipe_name)
-            )
-            
-            existing_recipe = cursor.fetchone()
-            
-            if existing_recipe:
-                return jsonify({
-                    "message": "Recipe already saved to favorites",
-                    "recipe_id": existing_recipe["recipe_id"]
-                }), 200
-            
-            # Parse allergy flags
-            allergy_flags = recipe_data.get("allergyFlags", {})
-            is_vegetarian = allergy_flags.get("containsVegetarian", False)
-            contains_gluten = allergy_flags.get("containsGluten", False)
-            contains_nuts = allergy_flags.get("containsNuts", False)
-            
-            # Convert steps to JSON if it's a list
-            steps = recipe_data.get("steps", [])
-            steps_json = json.dumps(steps) if isinstance(steps, list) else steps
-            
-            # Insert the recipe
-            cursor.execute(
-                """
-                INSERT INTO recipe (name, description, steps, is_vegetarian, is_gluten_free, is_nut_free) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (
+
+            with repository.session() as repo:
+                # Check if recipe name already exists for this user
+                recipe_name = recipe_data.get("recipeName") or recipe_data.get("name")
+
+                existing_recipe_id = repo.find_favorite_by_recipe_name(user_id, recipe_name)
+
+                if existing_recipe_id:
+                    return jsonify({
+                        "message": "Recipe already saved to favorites",
+                        "recipe_id": existing_recipe_id
+                    }), 200
+
+                # Parse allergy flags
+                allergy_flags = recipe_data.get("allergyFlags", {})
+                is_vegetarian = allergy_flags.get("containsVegetarian", False)
+                contains_gluten = allergy_flags.get("containsGluten", False)
+                contains_nuts = allergy_flags.get("containsNuts", False)
+
+                # Convert steps to JSON if it's a list
+                steps = recipe_data.get("steps", [])
+                steps_json = json.dumps(steps) if isinstance(steps, list) else steps
+
+                # Resolve the ingredients before inserting anything (known names
+                # come from the cache), creating the ones that do not exist yet
+                ingredients_list = [name.strip() for name in recipe_data.get("ingredients", "").split(", ") if name.strip()]
+                ingredient_ids = repo.get_or_create_ingredients(ingredients_list)
+
+                # The model's diet flags, cleared where an ingredient says otherwise
+                is_vegetarian, is_gluten_free, is_nut_free = recipe_flags(
+                    ingredients_list, is_vegetarian, not contains_gluten, not contains_nuts
+                )
+
+                # Insert the recipe
+                recipe_id = repo.create_recipe(
                     recipe_name,
                     recipe_data.get("description", ""),
                     steps_json,
                     is_vegetarian,
-                    not contains_gluten,
-                    not contains_nuts
+                    is_gluten_free,
+                    is_nut_free,
+                    ingredients_list
                 )
-            )
-            
-            conn.commit()
-            recipe_id = cursor.lastrowid
-            
-            # Process ingredients
-            ingredients_list = recipe_data.get("ingredients", "").split(", ")
-            for ingredient_name in ingredients_list:
-                ingredient_name = ingredient_name.strip()
-                if not ingredient_name:
-                    continue
-                    
-                # Check if ingredient exists
-                cursor.execute("SELECT ingredient_id FROM ingredient WHERE name = %s", (ingredient_name,))
-                ingredient = cursor.fetchone()
-                
-                if not ingredient:
-                    # Create new ingredient
-                    cursor.execute(
-                        """
-                        INSERT INTO ingredient (name, contains_nuts, contains_gluten, contains_meat) 
-                        VALUES (%s, %s, %s, %s)
-                        """,
-                        (
-                            ingredient_name,
-                            False,  # Default values, can be updated later
-                            False,
-                            False
-                        )
-                    )
-                    conn.commit()
-                    ingredient_id = cursor.lastrowid
-                else:
-                    ingredient_id = ingredient["ingredient_id"]
-                
-                # Create recipe ingredient relationship
-                cursor.execute(
-                    """
-                    INSERT INTO recipe_ingredient (recipe_id, ingredient_id, quantity, unit) 
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (
-                        recipe_id,
-                        ingredient_id,
-                        1.0,  # Default values, can be updated later
-                        "unit"
-                    )
+
+                # Create recipe ingredient relationships
+                repo.add_recipe_ingredients(
+                    recipe_id,
+                    ingredient_ids,
+                    1.0,  # Default values, can be updated later
+                    "unit"
                 )
-                conn.commit()
-            
-            # Add to user favorites
-            cursor.execute(
-                "INSERT INTO user_favorite_recipes (user_id, recipe_id) VALUES (%s, %s)",
-                (user_id, recipe_id)
-            )
-            conn.commit()
-            
+
+                # Add to user favorites
+                saved_before = repo.get_favorite_ids(user_id, co_favorites.max_user_favorites)
+                repo.add_favorite(user_id, recipe_id)
+                repo.bump_data_version(user_id)
+
+            cook_now_index.add_recipe(recipe_id, ingredients_list, is_vegetarian, is_gluten_free, is_nut_free)
+            co_favorites.add_favorite(recipe_id, saved_before)
+
             return jsonify({
-                "message": "Recipe saved to favorites successfully", 
+                "message": "Recipe saved to favorites successfully",
                 "recipe_id": recipe_id
             }), 201
-            
+
         except Exception as e:
-            conn.rollback()
-            print(f"Database error: {str(e)}")
+            logger.exception("Database error")
             return jsonify({"message": f"Server error: {str(e)}"}), 500
-        
-        finally:
-            cursor.close()
-            conn.close()
-            
+
     except Exception as e:
-        print(f"Error in save_ai_recipe: {str(e)}")
+        logger.exception("Error in save_ai_recipe")
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
 @app.route("/get_favorites", methods=["GET"])
 @jwt_required()
 def get_favorites():
     try:
-        current_user_email = get_jwt_identity()
-        
-        # Get a fresh connection
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
+        limit = parse_limit(request.args.get("limit"))
+        before_recipe_id = decode_int_cursor(request.args.get("cursor"))
+    except InvalidPageRequest as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
         try:
-            # Find the user ID from the email
-            cursor.execute("SELECT user_id FROM users WHERE email = %s", (current_user_email,))
-            user = cursor.fetchone()
-            
-            if not user:
+            # The user ID comes from the JWT, no lookup by email needed
+            user_id = current_user_id()
+            if user_id is None:
                 return jsonify({"message": "User not found"}), 404
-            
-            user_id = user["user_id"]
-            
-            # Get all favorite recipes for this user with full recipe details
-            query = """
-            SELECT 
-                r.recipe_id,
-                r.name,
-                r.description,
-                r.steps,
-                r.is_vegetarian,
-                r.is_gluten_free,
-                r.is_nut_free
-            FROM 
-                recipe r
-            JOIN 
-                user_favorite_recipes uf ON r.recipe_id = uf.recipe_id
-            WHERE 
-                uf.user_id = %s
-            ORDER BY 
-                r.recipe_id DESC
-            """
-            
-            cursor.execute(query, (user_id,))
-            recipes = cursor.fetchall()
-            
-            # Format the results
-            formatted_recipes = []
-            for recipe in recipes:
-                # Get ingredients for this recipe
-                cursor.execute("""
-                    SELECT i.name 
-                    FROM ingredient i
-                    JOIN recipe_ingredient ri ON i.ingredient_id = ri.ingredient_id
-                    WHERE ri.recipe_id = %s
-                """, (recipe["recipe_id"],))
-                
-                ingredients = cursor.fetchall()
-                ingredients_list = [ingredient["name"] for ingredient in ingredients]
-                
-                # Parse steps from JSON if needed
-                try:
-                    steps = json.loads(recipe["steps"]) if recipe["steps"] else []
-                except (json.JSONDecodeError, TypeError):
-                    steps = [recipe["steps"]] if recipe["steps"] else []
-                
-                # Add to formatted recipes
-                formatted_recipes.append({
-                    "id": recipe["recipe_id"],
-                    "recipeName": recipe["name"],
-                    "name": recipe["name"],
-                    "description": recipe["description"],
-                    "steps": steps,
-                    "ingredients": ", ".join(ingredients_list),
-                    "allergyFlags": {
-                        "containsVegetarian": recipe["is_vegetarian"],
-                        "containsGluten": not recipe["is_gluten_free"],
-                        "containsNuts": not recipe["is_nut_free"],
-                        "containsMeat": not recipe["is_vegetarian"]
-                    }
-                })
-            
-            return jsonify({"favorites": formatted_recipes})
-            
+
+            with repository.session() as repo:
+                # A client that already has this version of the page gets a 304
+                # before the favorites are read
+                etag = _data_etag("favorites", user_id, repo.get_data_version(user_id))
+                matched = matching_etag(etag) if etag is not None else None
+                if matched is not None:
+                    return _not_modified(matched)
+
+                # Get one page of favorite recipes for this user with full recipe details
+                recipes = repo.get_favorites_page(user_id, before_recipe_id, limit + 1)
+                recipes, next_cursor = page_of(recipes, limit, lambda recipe: recipe["recipe_id"])
+
+                # Get the ingredients of every recipe in one batched query
+                # instead of one query per recipe
+                ingredients_by_recipe = repo.get_recipe_ingredient_names([recipe["recipe_id"] for recipe in recipes])
+
+                # Format the results
+                formatted_recipes = [
+                    _format_recipe(recipe, ingredients_by_recipe[recipe["recipe_id"]])
+                    for recipe in recipes
+                ]
+
+            return _with_etag(jsonify({"favorites": formatted_recipes, "next_cursor": next_cursor}), etag)
+
         except Exception as e:
-            print(f"Database error: {str(e)}")
+            logger.exception("Database error")
             return jsonify({"message": f"Server error: {str(e)}"}), 500
-        
-        finally:
-            cursor.close()
-            conn.close()
-            
+
     except Exception as e:
-        print(f"Error in get_favorites: {str(e)}")
+        logger.exception("Error in get_favorites")
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
+def _data_etag(kind, user_id, data_version):
+    """
+    Strong ETag for one page of a user's pantry or favorites: the user's data
+    version plus the query string (limit/cursor pick the page). None when the
+    user does not exist.
+    """
+    if data_version is None:
+        return None
+    page = hashlib.sha1(request.query_string).hexdigest()[:12]
+    return f"{kind}-{user_id}-{data_version}-{page}"
+
+def _not_modified(etag):
+    response = Response(status=304)
+    return _with_etag(response, etag)
+
+def _with_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+        # Cached copies must be revalidated, which costs the client a 304 at most
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def _format_recipe(recipe, ingredients_list):
+    """Shape a recipe row the way the frontend expects it"""
+    # Parse steps from JSON if needed
+    try:
+        steps = json.loads(recipe["steps"]) if recipe["steps"] else []
+    except (json.JSONDecodeError, TypeError):
+        steps = [recipe["steps"]] if recipe["steps"] else []
+
+    return {
+        "id": recipe["recipe_id"],
+        "recipeName": recipe["name"],
+        "name": recipe["name"],
+        "description": recipe["description"],
+        "steps": steps,
+        "ingredients": ", ".join(ingredients_list),
+        "allergyFlags": {
+            "containsVegetarian": recipe["is_vegetarian"],
+            "containsGluten": not recipe["is_gluten_free"],
+            "containsNuts": not recipe["is_nut_free"],
+            "containsMeat": not recipe["is_vegetarian"]
+        }
+    }
+
 @app.route("/remove_favorite/<int:recipe_id>", methods=["DELETE"])
 @jwt_required()
 def remove_favorite(recipe_id):
     try:
-        current_user_email = get_jwt_identity()
-        
-        # Get a fresh connection
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
         try:
-            # Find the user ID from the email
-            cursor.execute("SELECT user_id FROM users WHERE email = %s", (current_user_email,))
-            user = cursor.fetchone()
-            
-            if not user:
+            # The user ID comes from the JWT, no lookup by email needed
+            user_id = current_user_id()
+            if user_id is None:
                 return jsonify({"message": "User not found"}), 404
-            
-            user_id = user["user_id"]
-            
-            # Check if the favorite exists
-            cursor.execute(
-                "SELECT * FROM user_favorite_recipes WHERE user_id = %s AND recipe_id = %s",
-                (user_id, recipe_id)
-            )
-            
-            favorite = cursor.fetchone()
-            if not favorite:
-                return jsonify({"message": "Recipe not found in your favorites"}), 404
-            
-            # Remove the favorite
-            cursor.execute(
-                "DELETE FROM user_favorite_recipes WHERE user_id = %s AND recipe_id = %s",
-                (user_id, recipe_id)
-            )
-            
-            conn.commit()
-            
+
+            with repository.session() as repo:
+                # Check if the favorite exists
+                if not repo.favorite_exists(user_id, recipe_id):
+                    return jsonify({"message": "Recipe not found in your favorites"}), 404
+
+                # Remove the favorite
+                still_saved = repo.get_favorite_ids(user_id, co_favorites.max_user_favorites)
+                repo.remove_favorite(user_id, recipe_id)
+                repo.bump_data_version(user_id)
+
+            co_favorites.remove_favorite(recipe_id, still_saved)
+
             return jsonify({"message": "Recipe removed from favorites successfully"})
-            
+
         except Exception as e:
-            conn.rollback()
-            print(f"Database error: {str(e)}")
+            logger.exception("Database error")
             return jsonify({"message": f"Server error: {str(e)}"}), 500
-        
-        finally:
-            cursor.close()
-            conn.close()
-            
+
     except Exception as e:
-        print(f"Error in remove_favorite: {str(e)}")
+        logger.exception("Error in remove_favorite")
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
+##### Operational Endpoints #####
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "db_pool": pool.stats(),
+        "ingredient_cache": ingredient_cache.stats(),
+        "auth_user_cache": user_cache_stats(),
+        "generation_cache": generation_cache.stats() if generation_cache is not None else None,
+        "recipe_jobs": recipe_jobs.stats(),
+        "openai": chat_client.stats(),
+        "prompts": prompt_stats.stats(),
+        "cook_now_index": cook_now_index.stats(),
+        "co_favorites": co_favorites.stats()
+    })
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 if __name__ == "__main__":
     #with app.app_context():
         #db.create_all()
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,106 @@
+#contains the Prometheus metrics behind GET /metrics and the request hooks that record them
+#
+# With several worker processes (gunicorn -w N), set PROMETHEUS_MULTIPROC_DIR to an
+# empty directory shared by the workers before starting them; every process then
+# writes its samples to files there and /metrics adds them up.
+import os
+import threading
+import time
+from flask import g, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Requests answered, by route and status", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time until the response is ready (first byte for streams)", ["method", "route"]
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being served right now", multiprocess_mode="livesum"
+)
+DB_ACQUIRE = Histogram(
+    "db_connection_acquire_seconds", "Time to check out a pooled database connection",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+DB_STATEMENTS = Counter(
+    "db_statements_total", "SQL statements run, by named statement (adhoc for built queries)", ["statement"]
+)
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    "db_statements_per_request", "SQL statements run while serving one request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+OPENAI_LATENCY = Histogram(
+    "openai_request_duration_seconds", "OpenAI chat completion calls (one per attempt)", ["outcome"],
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 8, 13, 21, 34, 60)
+)
+OPENAI_ERRORS = Counter(
+    "openai_errors_total", "Failed OpenAI calls (each failed attempt, retried or not)"
+)
+RECIPE_GENERATIONS = Counter(
+    "recipe_generations_total", "Recipe generations, streamed or not, by result", ["result"]
+)
+RECIPE_GENERATION_LATENCY = Histogram(
+    "recipe_generation_duration_seconds", "Recipe generation time (whole stream for streamed ones), cache hits included",
+    buckets=(0.005, 0.025, 0.1, 0.5, 1, 2, 3, 5, 8, 13, 21, 34, 60)
+)
+RECIPE_PROMPT_TOKENS = Histogram(
+    "recipe_prompt_tokens", "Prompt size of each recipe generation sent to OpenAI (see PROMPT_TOKEN_BUDGET)",
+    buckets=(100, 250, 500, 750, 1000, 1250, 1500, 1750, 2000, 2500, 3000, 4000, 6000)
+)
+PASSWORD_LATENCY = Histogram(
+    "password_hash_seconds", "bcrypt hash/verify time including the wait for a worker", ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# Statements run by the current thread since its request started
+_request_state = threading.local()
+
+
+def count_statement(name):
+    """Called by the repository for every statement it runs"""
+    DB_STATEMENTS.labels(name).inc()
+    _request_state.statements = getattr(_request_state, "statements", 0) + 1
+
+
+def init_app(app):
+    """Time and count every request by its route template (e.g. /recipe/<int:recipe_id>/reviews)"""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        _request_state.statements = 0
+        HTTP_IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("metrics_started")
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+            DB_STATEMENTS_PER_REQUEST.labels(route).observe(getattr(_request_state, "statements", 0))
+        return response
+
+    @app.teardown_request
+    def end_request(exc):
+        if g.pop("metrics_started", None) is not None:
+            HTTP_IN_FLIGHT.dec()
+
+
+def render():
+    """Return (body, content type) for GET /metrics, summed over every worker process in multiprocess mode"""
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Call from the process manager when a worker exits (gunicorn: child_exit) so its live gauges are dropped"""
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,62 @@
+"""Add recipe rating summary
+
+Revision ID: 139dd71b7809
+Revises: c571da14b563
+Create Date: 2026-10-18 16:41:52.873064
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '139dd71b7809'
+down_revision = 'c571da14b563'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One row per reviewed recipe, kept in step with reviews by the API in the
+    # same transaction as every review write
+    op.create_table('recipe_rating_summary',
+    sa.Column('recipe_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('review_count', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('rating_sum', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('rating_avg', sa.Numeric(precision=5, scale=4), nullable=True),
+    sa.Column('rating_1', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('rating_2', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('rating_3', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('rating_4', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('rating_5', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipe.recipe_id'], name='recipe_rating_summary_ibfk_1', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('recipe_id'),
+    mysql_collate='utf8mb4_0900_ai_ci',
+    mysql_default_charset='utf8mb4',
+    mysql_engine='InnoDB'
+    )
+    with op.batch_alter_table('recipe_rating_summary', schema=None) as batch_op:
+        # Top rated lists read this index backwards and stop after LIMIT rows
+        batch_op.create_index('ix_recipe_rating_summary_avg', ['rating_avg', 'review_count'], unique=False)
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_reviews_recipe_created', ['recipe_id', 'created_at'], unique=False)
+
+    op.execute(
+        """
+        INSERT INTO recipe_rating_summary
+            (recipe_id, review_count, rating_sum, rating_avg, rating_1, rating_2, rating_3, rating_4, rating_5)
+        SELECT recipe_id, COUNT(*), SUM(rating), SUM(rating) / COUNT(*),
+               SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+        FROM reviews
+        WHERE rating IS NOT NULL
+        GROUP BY recipe_id
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_reviews_recipe_created')
+
+    op.drop_table('recipe_rating_summary')
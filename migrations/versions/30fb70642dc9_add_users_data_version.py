@@ -0,0 +1,28 @@
+"""Add users data_version
+
+Revision ID: 30fb70642dc9
+Revises: 139dd71b7809
+Create Date: 2026-10-18 18:07:29.415730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '30fb70642dc9'
+down_revision = '139dd71b7809'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Bumped by every write to a user's pantry or favorites, the ETag of
+    # /get_pantry and /get_favorites is derived from it
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.BigInteger(), server_default=sa.text("'0'"), nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
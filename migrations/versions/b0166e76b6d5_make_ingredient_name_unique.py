@@ -0,0 +1,71 @@
+"""Make ingredient name unique
+
+Revision ID: b0166e76b6d5
+Revises: 30fb70642dc9
+Create Date: 2026-10-18 21:07:14.602391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b0166e76b6d5'
+down_revision = '30fb70642dc9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge ingredients that were created more than once (equal under the
+    # column's collation) into the oldest row before the unique index goes on.
+    # Pantry and recipe rows move to the kept ingredient; where the kept one is
+    # already there the duplicate's row is skipped and goes with the cascade.
+    op.execute(
+        """
+        CREATE TEMPORARY TABLE ingredient_duplicate AS
+        SELECT i.ingredient_id, kept.ingredient_id AS keep_id
+        FROM ingredient i
+        JOIN (
+            SELECT name, MIN(ingredient_id) AS ingredient_id
+            FROM ingredient
+            GROUP BY name
+            HAVING COUNT(*) > 1
+        ) kept ON kept.name = i.name
+        WHERE i.ingredient_id <> kept.ingredient_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE IGNORE pantry_ingredient p
+        JOIN ingredient_duplicate d ON d.ingredient_id = p.ingredient_id
+        SET p.ingredient_id = d.keep_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE IGNORE recipe_ingredient ri
+        JOIN ingredient_duplicate d ON d.ingredient_id = ri.ingredient_id
+        SET ri.ingredient_id = d.keep_id
+        """
+    )
+    op.execute(
+        """
+        DELETE i FROM ingredient i
+        JOIN ingredient_duplicate d ON d.ingredient_id = i.ingredient_id
+        """
+    )
+    op.execute("DROP TEMPORARY TABLE ingredient_duplicate")
+
+    # Concurrent creates of the same name now collide on this index instead of
+    # inserting a second row (see Repository.create_ingredients)
+    with op.batch_alter_table('ingredient', schema=None) as batch_op:
+        batch_op.drop_index('ix_ingredient_name')
+        batch_op.create_index('ix_ingredient_name', ['name'], unique=True)
+
+
+def downgrade():
+    # Merged duplicates are not split up again
+    with op.batch_alter_table('ingredient', schema=None) as batch_op:
+        batch_op.drop_index('ix_ingredient_name')
+        batch_op.create_index('ix_ingredient_name', ['name'], unique=False)
@@ -0,0 +1,51 @@
+"""Add recipe full-text search
+
+Revision ID: c571da14b563
+Revises: f97b97e39dfe
+Create Date: 2026-10-18 14:03:17.204611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c571da14b563'
+down_revision = 'f97b97e39dfe'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Ingredient names are copied onto the recipe row so one FULLTEXT index
+    # covers everything /recipe/search matches on
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ingredient_names', sa.Text(), nullable=True))
+
+    op.execute("SET SESSION group_concat_max_len = 65535")
+    op.execute(
+        """
+        UPDATE recipe r
+        JOIN (
+            SELECT ri.recipe_id, GROUP_CONCAT(i.name ORDER BY i.name SEPARATOR ', ') AS names
+            FROM recipe_ingredient ri
+            JOIN ingredient i ON i.ingredient_id = ri.ingredient_id
+            GROUP BY ri.recipe_id
+        ) n ON n.recipe_id = r.recipe_id
+        SET r.ingredient_names = n.names
+        """
+    )
+
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.create_index(
+            'ft_recipe_search',
+            ['name', 'description', 'steps', 'ingredient_names'],
+            unique=False,
+            mysql_prefix='FULLTEXT'
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.drop_index('ft_recipe_search')
+        batch_op.drop_column('ingredient_names')
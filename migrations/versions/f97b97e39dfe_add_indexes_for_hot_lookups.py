@@ -0,0 +1,48 @@
+"""Add indexes for hot lookup paths
+
+Revision ID: f97b97e39dfe
+Revises: e4ab9cb169ec
+Create Date: 2026-10-18 09:12:41.520318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f97b97e39dfe'
+down_revision = 'e4ab9cb169ec'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # e4ab9cb169ec dropped the name/email indexes together with their unique
+    # constraints. They come back as plain indexes because existing rows may
+    # already contain duplicates.
+    # user_favorite_recipes(recipe_id) needs nothing here: the foreign key on
+    # recipe_id already has its index (KEY recipe_id in the schema dump). Nor
+    # does pantry_ingredient: its user_id foreign key index already ends in the
+    # (ingredient_id, user_id) primary key, so it covers (user_id, ingredient_id).
+    # idx_dietary_flags (dropped by e4ab9cb169ec) stays gone: three booleans
+    # split the table into at most eight groups, and the diet filters run next
+    # to a full-text match or on rows already narrowed down by id.
+    with op.batch_alter_table('ingredient', schema=None) as batch_op:
+        batch_op.create_index('ix_ingredient_name', ['name'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_email', ['email'], unique=False)
+
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.create_index('ix_recipe_name', ['name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipe_name')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_email')
+
+    with op.batch_alter_table('ingredient', schema=None) as batch_op:
+        batch_op.drop_index('ix_ingredient_name')
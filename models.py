@@ -5,6 +5,7 @@ import datetime
 # Users Table
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (db.Index('ix_users_email', 'email'),)
 
     user_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     first_name = db.Column(db.String(255))
@@ -14,6 +15,8 @@ class User(db.Model):
     is_vegetarian = db.Column(db.Boolean)
     is_nut_free = db.Column(db.Boolean)
     is_gluten_free = db.Column(db.Boolean)
+    # Bumped whenever the user's pantry or favorites change (ETags)
+    data_version = db.Column(db.BigInteger, nullable=False, server_default='0')
 
     user_favorite_recipes = db.relationship(
         'UserFavoriteRecipe',
@@ -44,6 +47,7 @@ class User(db.Model):
 # Ingredients Table
 class Ingredient(db.Model):
     __tablename__ = 'ingredient'
+    __table_args__ = (db.Index('ix_ingredient_name', 'name', unique=True),)
 
     ingredient_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(255))
@@ -83,6 +87,10 @@ class PantryIngredient(db.Model):
 # Recipes Table
 class Recipe(db.Model):
     __tablename__ = 'recipe'
+    __table_args__ = (
+        db.Index('ix_recipe_name', 'name'),
+        db.Index('ft_recipe_search', 'name', 'description', 'steps', 'ingredient_names', mysql_prefix='FULLTEXT'),
+    )
 
     recipe_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(255))
@@ -91,6 +99,8 @@ class Recipe(db.Model):
     is_vegetarian = db.Column(db.Boolean)
     is_gluten_free = db.Column(db.Boolean)
     is_nut_free = db.Column(db.Boolean)
+    # Copy of the recipe's ingredient names for the full-text index
+    ingredient_names = db.Column(db.Text)
     
     user_favorite_recipes = db.relationship(
         'UserFavoriteRecipe',
@@ -139,6 +149,7 @@ class RecipeIngredient(db.Model):
 # Reviews Table (Many-to-Many between Users & Recipes)
 class Review(db.Model):
     __tablename__ = 'reviews'
+    __table_args__ = (db.Index('ix_reviews_recipe_created', 'recipe_id', 'created_at'),)
 
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.recipe_id'), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
@@ -159,6 +170,33 @@ class Review(db.Model):
         }
 
 
+# Recipe Rating Summary Table (review count, sum, average and histogram per recipe,
+# updated in the same transaction as every review write)
+class RecipeRatingSummary(db.Model):
+    __tablename__ = 'recipe_rating_summary'
+    __table_args__ = (db.Index('ix_recipe_rating_summary_avg', 'rating_avg', 'review_count'),)
+
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.recipe_id'), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, server_default='0')
+    rating_avg = db.Column(db.Numeric(5, 4))
+    rating_1 = db.Column(db.Integer, nullable=False, server_default='0')
+    rating_2 = db.Column(db.Integer, nullable=False, server_default='0')
+    rating_3 = db.Column(db.Integer, nullable=False, server_default='0')
+    rating_4 = db.Column(db.Integer, nullable=False, server_default='0')
+    rating_5 = db.Column(db.Integer, nullable=False, server_default='0')
+
+    recipe = db.relationship('Recipe', backref=db.backref('rating_summary', uselist=False, lazy=True))
+
+    def to_json(self):
+        return {
+            "recipeId": self.recipe_id,
+            "reviewCount": self.review_count,
+            "averageRating": float(self.rating_avg) if self.rating_avg is not None else None,
+            "histogram": [self.rating_1, self.rating_2, self.rating_3, self.rating_4, self.rating_5]
+        }
+
+
 # User Favorite Recipes Table (Many-to-Many between Users & Recipes)
 class UserFavoriteRecipe(db.Model):
     __tablename__ = 'user_favorite_recipes'
@@ -0,0 +1,211 @@
+#contains the process-wide OpenAI client: pooled connections, timeouts, retries and a cap on concurrent calls
+import os
+import random
+import threading
+import time
+from collections import deque
+import httpx
+import openai
+from openai import OpenAI
+import metrics
+
+
+class UpstreamBusy(Exception):
+    """Raised when OPENAI_MAX_CONCURRENCY calls are already in flight and none finished within OPENAI_QUEUE_WAIT"""
+
+
+# Worth another attempt: the request may well succeed a moment later
+_RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class ChatClient:
+    """
+    Wraps one OpenAI client for the whole process so HTTP keep-alive and TLS
+    sessions are reused across requests. Every call is bounded: it waits at most
+    queue_wait for a concurrency slot, each attempt is limited by the connect and
+    read timeouts, and transient errors are retried max_retries times with
+    exponential backoff and full jitter.
+    Args:
+        api_key (str): OpenAI API key
+        base_url (str): API base URL, None for the OpenAI default
+        connect_timeout (float): Seconds to establish a connection
+        read_timeout (float): Seconds to wait for each chunk of the response
+        max_connections (int): HTTP connections kept in the pool
+        max_concurrency (int): Upstream calls allowed in flight at once
+        max_retries (int): Extra attempts after a transient error
+        backoff_base (float): Backoff before the first retry, doubled for each further one
+        backoff_max (float): Upper bound for a single backoff
+        queue_wait (float): Seconds a caller may wait for a concurrency slot
+    """
+
+    def __init__(self, api_key=None, base_url=None, connect_timeout=5.0, read_timeout=60.0, max_connections=20,
+                 max_concurrency=8, max_retries=2, backoff_base=0.5, backoff_max=8.0, queue_wait=10.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_wait = queue_wait
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._client = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def chat_completion(self, **kwargs):
+        """client.chat.completions.create(**kwargs) with the limits described above"""
+        attempt = 0
+        while True:
+            self._acquire()
+            started = time.perf_counter()
+            try:
+                response = self._get_client().chat.completions.create(**kwargs)
+                self._record(started)
+                return response
+            except _RETRYABLE_ERRORS as e:
+                self._record(started, failed=True)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+            except Exception:
+                self._record(started, failed=True)
+                raise
+            finally:
+                self._release()
+
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def stream_chat_completion(self, **kwargs):
+        """
+        Streaming variant, yields the chunks. Opening the stream is retried like
+        chat_completion; once chunks have been yielded an error is raised as is.
+        The concurrency slot is held until the stream is exhausted or closed.
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            started = time.perf_counter()
+            try:
+                stream = self._get_client().chat.completions.create(stream=True, **kwargs)
+                break
+            except _RETRYABLE_ERRORS as e:
+                self._record(started, failed=True)
+                self._release()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+            except Exception:
+                self._record(started, failed=True)
+                self._release()
+                raise
+
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+        failed = True
+        try:
+            yield from stream
+            failed = False
+        finally:
+            stream.close()
+            self._record(started, failed=failed)
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "rejected": self.rejected
+            }
+        if latencies:
+            stats["latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 1),
+                "p95": round(latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1)
+            }
+        return stats
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.queue_wait):
+            with self._lock:
+                self.rejected += 1
+            raise UpstreamBusy("Too many recipe generations in progress")
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _record(self, started, failed=False):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+            self._latencies.append(elapsed)
+        metrics.OPENAI_LATENCY.labels("error" if failed else "ok").observe(elapsed)
+        if failed:
+            metrics.OPENAI_ERRORS.inc()
+
+    def _backoff(self, attempt, error):
+        # Honour Retry-After on rate limits, otherwise full jitter so retries from
+        # many workers do not arrive in lockstep
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return min(float(retry_after), self.backoff_max)
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _get_client(self):
+        # Created lazily so the environment (.env) is loaded by the time it is read
+        with self._lock:
+            if self._client is None:
+                self._client = OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    # Retries are done here, with jitter and outside the concurrency slot
+                    max_retries=0,
+                    http_client=httpx.Client(
+                        timeout=self.timeout,
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections
+                        )
+                    )
+                )
+            return self._client
+
+
+# The API key defaults to OPENAI_API_KEY. Point OPENAI_BASE_URL at fake_openai.py for load tests.
+chat_client = ChatClient(
+    base_url=os.environ.get("OPENAI_BASE_URL") or None,
+    connect_timeout=float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(os.environ.get("OPENAI_READ_TIMEOUT", 60)),
+    max_connections=int(os.environ.get("OPENAI_MAX_CONNECTIONS", 20)),
+    max_concurrency=int(os.environ.get("OPENAI_MAX_CONCURRENCY", 8)),
+    max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", 2)),
+    backoff_base=float(os.environ.get("OPENAI_BACKOFF_BASE", 0.5)),
+    backoff_max=float(os.environ.get("OPENAI_BACKOFF_MAX", 8)),
+    queue_wait=float(os.environ.get("OPENAI_QUEUE_WAIT", 10))
+)
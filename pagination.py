@@ -0,0 +1,91 @@
+#contains helpers for the opaque keyset cursors used by the listing endpoints
+import base64
+import datetime
+import json
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for a bad limit or cursor query parameter"""
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """Turn the ?limit= query parameter into a page size between 1 and maximum"""
+    if value is None or value == "":
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise InvalidPageRequest("limit must be an integer")
+    if limit < 1:
+        raise InvalidPageRequest("limit must be at least 1")
+    return min(limit, maximum)
+
+
+def encode_cursor(key):
+    """
+    Wrap the last key of a page in an opaque, URL safe token.
+    Clients must treat it as a black box and send it back as ?cursor=
+    """
+    raw = json.dumps({"k": key}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the key stored in a cursor, or None when no cursor was sent"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["k"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidPageRequest("cursor is not valid")
+
+
+def decode_int_cursor(cursor):
+    """decode_cursor() for listings keyed by an integer primary key"""
+    key = decode_cursor(cursor)
+    if key is not None and (not isinstance(key, int) or isinstance(key, bool)):
+        raise InvalidPageRequest("cursor is not valid")
+    return key
+
+
+def decode_ranked_cursor(cursor):
+    """decode_cursor() for listings ordered by (score, id), returns (score, id) or None"""
+    key = decode_cursor(cursor)
+    if key is None:
+        return None
+    if (not isinstance(key, list) or len(key) != 2
+            or not isinstance(key[0], (int, float)) or not isinstance(key[1], int)
+            or isinstance(key[0], bool) or isinstance(key[1], bool)):
+        raise InvalidPageRequest("cursor is not valid")
+    return float(key[0]), key[1]
+
+
+def decode_timestamp_cursor(cursor):
+    """decode_cursor() for listings ordered by (timestamp, id), returns ("YYYY-MM-DD HH:MM:SS", id) or None"""
+    key = decode_cursor(cursor)
+    if key is None:
+        return None
+    if (not isinstance(key, list) or len(key) != 2 or not isinstance(key[0], str)
+            or not isinstance(key[1], int) or isinstance(key[1], bool)):
+        raise InvalidPageRequest("cursor is not valid")
+    try:
+        datetime.datetime.strptime(key[0], TIMESTAMP_FORMAT)
+    except ValueError:
+        raise InvalidPageRequest("cursor is not valid")
+    return key[0], key[1]
+
+
+def page_of(rows, limit, key):
+    """
+    Split a result fetched with LIMIT limit + 1 into (page rows, next_cursor).
+    key picks the keyset column out of a row.
+    """
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(key(rows[-1]))
+    return rows, None
@@ -0,0 +1,136 @@
+#contains password hashing and verification, run in a process pool so bcrypt never blocks request threads
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when more password jobs are queued than BCRYPT_MAX_QUEUE allows"""
+
+
+class PasswordHasherUnavailable(PasswordHasherBusy):
+    """Raised when a job timed out or a worker process died; callers answer it like PasswordHasherBusy"""
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check_password(password, hashed):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:
+        # Not a bcrypt hash at all
+        return False
+
+
+def hash_rounds(hashed):
+    """Return the cost factor stored in a bcrypt hash ("$2b$12$..." -> 12), or None if it is not one"""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in worker processes. Request threads only wait on a future,
+    so a burst of logins costs CPU in the workers instead of holding the GIL.
+    Args:
+        rounds (int): bcrypt cost factor for new hashes
+        workers (int): Worker processes
+        max_queue (int): Jobs allowed in flight or waiting before callers get PasswordHasherBusy
+        queue_wait (float): Seconds a caller may wait for a queue slot
+        timeout (float): Seconds to wait for a single hash/verify result
+    """
+
+    def __init__(self, rounds=12, workers=None, max_queue=None, queue_wait=0.5, timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue or self.workers * 4
+        self.queue_wait = queue_wait
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run("hash", _hash_password, password, self.rounds)
+
+    def verify(self, password, hashed):
+        return self._run("verify", _check_password, password, hashed)
+
+    def needs_rehash(self, hashed):
+        """True when the stored hash was made with a lower cost factor than the current one"""
+        rounds = hash_rounds(hashed)
+        return rounds is not None and rounds < self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, operation, fn, *args):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_wait):
+            raise PasswordHasherBusy("Too many password checks in progress")
+        executor = None
+        try:
+            executor = self._get_executor()
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool as e:
+            self._slots.release()
+            self._reset_executor(executor)
+            raise PasswordHasherUnavailable("Password workers restarting") from e
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool as e:
+            self._reset_executor(executor)
+            raise PasswordHasherUnavailable("Password workers restarting") from e
+        except FutureTimeout as e:
+            raise PasswordHasherUnavailable(f"Password check took longer than {self.timeout} seconds") from e
+        finally:
+            metrics.PASSWORD_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+    def _reset_executor(self, broken):
+        # A worker that dies (e.g. killed for memory) breaks the whole pool; drop it
+        # so the next call starts a fresh one instead of failing until a restart
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+        logger.warning("Password worker pool broke, starting a new one")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self):
+        # Created lazily so importing this module never starts processes.
+        # "spawn" keeps the workers clear of locks held by request threads at fork time.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+
+hasher = PasswordHasher(
+    rounds=int(os.environ.get("BCRYPT_LOG_ROUNDS", 12)),
+    workers=int(os.environ.get("BCRYPT_WORKERS", 0)) or None,
+    max_queue=int(os.environ.get("BCRYPT_MAX_QUEUE", 0)) or None,
+    queue_wait=float(os.environ.get("BCRYPT_QUEUE_WAIT", 0.5)),
+    timeout=float(os.environ.get("BCRYPT_TIMEOUT", 10))
+)
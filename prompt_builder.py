@@ -0,0 +1,165 @@
+#contains the token-budgeted prompt for recipe generation
+import os
+import threading
+from ingredient_matching import normalize_name, tokens
+
+try:
+    import tiktoken
+except ImportError:  # optional, token counts are estimated without it
+    tiktoken = None
+
+SYSTEM_PROMPT = "You are a helpful cooking assistant. You suggest recipes based on available ingredients in the user's pantry and return your response in JSON format. Assume salt and pepper are generally available. Always include a 'recipes' key in your response containing an array of recipe objects. Be extremely accurate about which ingredients are missing versus available in the pantry."
+
+USER_PROMPT = """
+    I have the following ingredients in my pantry:
+    {ingredients}
+    {omitted}
+    My recipe request: {user_query}
+
+    Please provide three recipes that maximize the use of my pantry ingredients. Pay careful attention to the following:
+
+    1. ONLY list ingredients as "missing" if they are truly not in my pantry list above.
+    2. Be precise - if I have "steak" in my pantry, don't list "steak" as missing.
+
+    For each recipe include:
+    1. The name of each recipe (recipeName)
+    2. A brief description (description)
+    3. Step-by-step cooking instructions (steps as an array)
+    4. Which of my pantry ingredients will be used (ingredients as a comma-separated string)
+    5. Any essential ingredients I might be missing (missingIngredients as a comma-separated string) - ONLY include ingredients NOT in my pantry
+    6. An estimated preparation time (prepTime as a string like "20 min" or "1 hour 15 min")
+    7. Allergy and dietary flags in an allergyFlags object with these properties:
+       - containsVegetarian: true ONLY if the dish is truly vegetarian (no meat, poultry, or fish)
+       - containsGluten: true if the dish contains gluten (wheat, barley, rye, etc.)
+       - containsNuts: true if the dish contains nuts of any kind
+       - containsMeat: true if the dish contains any meat, poultry, or fish
+
+    Be very accurate with the dietary flags. For example, a steak recipe should have containsVegetarian: false and containsMeat: true.
+
+    Format your response as a JSON object with a 'recipes' key containing an array of recipe objects with the structure shown above.
+    """
+
+OMITTED_NOTE = "(Only the pantry items most relevant to my request are listed.)\n"
+
+# Tokens a chat message costs on top of its content
+_MESSAGE_OVERHEAD = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """Exact count with tiktoken when it is installed, otherwise ~4 characters per token"""
+    global _encoding
+    if tiktoken is not None:
+        with _encoding_lock:
+            if _encoding is None:
+                # The encoding used by the gpt-4o / gpt-4.1 family
+                _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def select_ingredients(items, user_query, budget):
+    """
+    Pick the pantry items to list. Duplicates (by normalized name) are dropped,
+    items sharing words with the query come first, the rest keep pantry order,
+    and items are added until their tokens would exceed budget.
+    Args:
+        items (list): Pantry items as formatted for the prompt, e.g. "eggs (2.0 unit)"
+        user_query (str): The user's request
+        budget (int): Tokens available for the ingredient list
+    Returns:
+        list: The selected items, in pantry order
+    """
+    query_words = set(tokens(user_query))
+    seen = set()
+    candidates = []
+    for position, item in enumerate(items):
+        name = normalize_name(item)
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        overlap = len(query_words.intersection(name.split()))
+        candidates.append((-overlap, position, item))
+
+    selected = []
+    used = 0
+    for _, position, item in sorted(candidates):
+        # ", " separator is about one token
+        cost = count_tokens(item) + 1
+        if used + cost > budget:
+            continue
+        used += cost
+        selected.append((position, item))
+    return [item for _, item in sorted(selected)]
+
+
+class PromptStats:
+    """Running totals of prompt sizes, shown in /stats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.truncated = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+
+    def record(self, prompt_tokens, truncated):
+        with self._lock:
+            self.prompts += 1
+            self.truncated += int(truncated)
+            self.total_tokens += prompt_tokens
+            self.max_tokens = max(self.max_tokens, prompt_tokens)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "truncated": self.truncated,
+                "avg_tokens": round(self.total_tokens / self.prompts, 1) if self.prompts else None,
+                "max_tokens": self.max_tokens,
+                "budget": PROMPT_TOKEN_BUDGET,
+                "exact_counts": tiktoken is not None
+            }
+
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 2000))
+prompt_stats = PromptStats()
+
+
+def build_messages(user_query, ingredients, budget=None):
+    """
+    Build the chat messages for a recipe generation, keeping the prompt within budget tokens.
+    Args:
+        user_query (str): User's query or preferences for recipes
+        ingredients (str): Comma-separated string of food ingredients from the user's pantry
+        budget (int): Prompt token budget, PROMPT_TOKEN_BUDGET if not given
+    Returns:
+        tuple: (messages, info) - info has prompt_tokens, ingredients_listed and ingredients_total
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    items = [item.strip() for item in (ingredients or "").split(",") if item.strip()]
+
+    # Everything except the ingredient list is fixed, it gets the budget first
+    fixed_tokens = (
+        count_tokens(SYSTEM_PROMPT)
+        + count_tokens(USER_PROMPT.format(ingredients="", omitted=OMITTED_NOTE, user_query=user_query))
+        + 2 * _MESSAGE_OVERHEAD
+    )
+    selected = select_ingredients(items, user_query, max(budget - fixed_tokens, 0))
+    truncated = len(selected) < len({normalize_name(item) for item in items} - {""})
+
+    prompt = USER_PROMPT.format(
+        ingredients=", ".join(selected),
+        omitted=OMITTED_NOTE if truncated else "",
+        user_query=user_query
+    )
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+    prompt_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(prompt) + 2 * _MESSAGE_OVERHEAD
+    prompt_stats.record(prompt_tokens, truncated)
+    return messages, {"prompt_tokens": prompt_tokens, "ingredients_listed": len(selected), "ingredients_total": len(items)}
@@ -0,0 +1,103 @@
+#contains the query count regression check: list endpoints must run the same number of statements for 1 row as for many
+#
+# Usage (no database needed, the repository talks to a recording connection):
+#   python query_count_check.py
+# Calls the endpoints through Flask's test client with 1 and with MANY_ROWS rows
+# behind them and exits with status 1 if the statement counts differ (an N+1 query).
+import json
+import sys
+from flask_jwt_extended import create_access_token
+import repository
+import main
+from auth import USER_ID_CLAIM
+from pagination import encode_cursor
+
+MANY_ROWS = 50
+USER_ID = 1
+
+
+class _CannedCursor:
+    """Records each statement and answers it with the rows _CannedConnection was given for it"""
+
+    rowcount = 0
+    lastrowid = 0
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        self._conn.log.append(sql)
+        self._rows = self._conn.respond(sql, tuple(params))
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class _CannedConnection:
+    def __init__(self, favorites):
+        self.log = []
+        self.statement_cache = {}
+        self.favorites = favorites
+
+    def cursor(self, **kwargs):
+        return _CannedCursor(self)
+
+    def respond(self, sql, params):
+        if sql == repository.STATEMENTS["user_data_version"]:
+            return [{"data_version": 1}]
+        if sql in (repository.STATEMENTS["favorites_first_page"], repository.STATEMENTS["favorites_page_before"]):
+            limit = params[-1]
+            return [_recipe_row(recipe_id) for recipe_id in range(self.favorites, 0, -1)][:limit]
+        if "FROM recipe_ingredient ri" in sql:
+            return [{"recipe_id": recipe_id, "name": f"ingredient {recipe_id}"} for recipe_id in params]
+        return []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _recipe_row(recipe_id):
+    return {
+        "recipe_id": recipe_id, "name": f"Recipe {recipe_id}", "description": "", "steps": json.dumps(["Cook"]),
+        "is_vegetarian": True, "is_gluten_free": True, "is_nut_free": True
+    }
+
+
+def count_statements(client, token, path, favorites):
+    """Return (status code, rows returned, statements run) for one GET of path"""
+    conn = _CannedConnection(favorites)
+    repository.get_db_connection = lambda: conn
+    response = client.get(path, headers={"Authorization": f"Bearer {token}"})
+    return response.status_code, len(response.get_json().get("favorites", [])), len(conn.log)
+
+
+def check():
+    app = main.app
+    app.config["JWT_SECRET_KEY"] = app.config.get("JWT_SECRET_KEY") or "query-count-check-signing-key-not-a-secret"
+    with app.app_context():
+        token = create_access_token(identity="check@example.com", additional_claims={USER_ID_CLAIM: USER_ID})
+    client = app.test_client()
+
+    ok = True
+    for path in (f"/get_favorites?limit={MANY_ROWS}", f"/get_favorites?limit={MANY_ROWS}&cursor={encode_cursor(MANY_ROWS + 1)}"):
+        one = count_statements(client, token, path, 1)
+        many = count_statements(client, token, path, MANY_ROWS)
+        same = one[0] == many[0] == 200 and one[2] == many[2]
+        ok &= same
+        print(f"{'ok  ' if same else 'FAIL'} GET {path}: {one[2]} statements for {one[1]} row(s), "
+              f"{many[2]} for {many[1]} rows (status {one[0]}/{many[0]})")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check() else 1)
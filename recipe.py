@@ -1,75 +1,185 @@
-import os
+import re
+import copy
 import json
-from openai import OpenAI
+import logging
+import time
 import mysql.connector
+import metrics
+import repository
+from openai_client import chat_client
+from generation_cache import generation_cache, make_key
+from prompt_builder import build_messages
+
+MODEL = "gpt-4.1-nano"
+
+logger = logging.getLogger(__name__)
 
 def generate_recipes_from_ingredients(user_query, ingredients):
     """
     Connect to OpenAI API and generate recipe suggestions based on the provided ingredients.
+    Identical requests (same pantry, query and model) are answered from the generation cache.
     Args:
         user_query (str): User's query or preferences for recipes
         ingredients (str): Comma-separated string of food ingredients from the user's pantry
     Returns:
         dict: The recipe suggestions with proper structure
     """
-    # Initialize the OpenAI client
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    
-    # Parse and normalize the ingredients list for better matching
-    pantry_items = []
-    if ingredients:
-        # Split the ingredients string and clean up each item
-        for item in ingredients.split(','):
-            # Extract just the ingredient name (without quantity/unit in parentheses)
-            clean_item = item.strip()
-            if '(' in clean_item:
-                clean_item = clean_item.split('(')[0].strip()
-            pantry_items.append(clean_item.lower())
-    
-    # Create the prompt with emphasis on accurate pantry ingredient usage
-    prompt = f"""
-    I have the following ingredients in my pantry:
-    {ingredients}
-    
-    My recipe request: {user_query}
-    
-    Please provide three recipes that maximize the use of my pantry ingredients. Pay careful attention to the following:
-    
-    1. ONLY list ingredients as "missing" if they are truly not in my pantry list above.
-    2. Be precise - if I have "steak" in my pantry, don't list "steak" as missing.
-    3. Normalized pantry ingredients (for your reference): {', '.join(pantry_items)}
-    
-    For each recipe include:
-    1. The name of each recipe (recipeName)
-    2. A brief description (description)
-    3. Step-by-step cooking instructions (steps as an array)
-    4. Which of my pantry ingredients will be used (ingredients as a comma-separated string)
-    5. Any essential ingredients I might be missing (missingIngredients as a comma-separated string) - ONLY include ingredients NOT in my pantry
-    6. An estimated preparation time (prepTime as a string like "20 min" or "1 hour 15 min")
-    7. Allergy and dietary flags in an allergyFlags object with these properties:
-       - containsVegetarian: true ONLY if the dish is truly vegetarian (no meat, poultry, or fish)
-       - containsGluten: true if the dish contains gluten (wheat, barley, rye, etc.)
-       - containsNuts: true if the dish contains nuts of any kind
-       - containsMeat: true if the dish contains any meat, poultry, or fish
-    
-    Be very accurate with the dietary flags. For example, a steak recipe should have containsVegetarian: false and containsMeat: true.
-    
-    Format your response as a JSON object with a 'recipes' key containing an array of recipe objects with the structure shown above.
+    started = time.perf_counter()
+    outcome = "failed"
+    try:
+        key = make_key(user_query, ingredients, MODEL) if generation_cache is not None else None
+        cached = generation_cache.get(key) if key is not None else None
+        if cached is not None:
+            outcome = "cache_hit"
+            return cached
+
+        result = _request_recipes(user_query, ingredients)
+        outcome = "parse_error" if "error" in result else "generated"
+        # Failed parses are not cached so the next request gets a fresh attempt
+        if key is not None and "error" not in result and result.get("recipes"):
+            generation_cache.put(key, result)
+        return result
+    finally:
+        metrics.RECIPE_GENERATIONS.labels(outcome).inc()
+        metrics.RECIPE_GENERATION_LATENCY.observe(time.perf_counter() - started)
+
+def stream_recipes_from_ingredients(user_query, ingredients):
+    """
+    Same as generate_recipes_from_ingredients, but uses the OpenAI streaming API and
+    yields each recipe dict as soon as its JSON object is complete.
+    Args:
+        user_query (str): User's query or preferences for recipes
+        ingredients (str): Comma-separated string of food ingredients from the user's pantry
+    Yields:
+        dict: One recipe at a time
+    """
+    started = time.perf_counter()
+    # A client that disconnects mid-stream closes the generator, that counts as failed
+    outcome = "failed"
+    try:
+        key = make_key(user_query, ingredients, MODEL) if generation_cache is not None else None
+        if key is not None:
+            cached = generation_cache.get(key)
+            if cached is not None:
+                outcome = "cache_hit"
+                yield from cached.get("recipes", [])
+                return
+
+        stream = chat_client.stream_chat_completion(
+            model=MODEL,
+            response_format={"type": "json_object"},
+            messages=_build_messages(user_query, ingredients)
+        )
+
+        parser = RecipeStreamParser()
+        recipes = []
+        for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            for recipe in parser.feed(chunk.choices[0].delta.content):
+                # Keep a pristine copy for the cache, callers may edit what they are given
+                recipes.append(copy.deepcopy(recipe))
+                yield recipe
+
+        # The model did not use a 'recipes' array, fall back to parsing the whole response
+        if not recipes:
+            result = _parse_recipes(parser.text)
+            if "error" in result:
+                outcome = "parse_error"
+                raise ValueError(result["error"])
+            recipes = result["recipes"]
+            yield from recipes
+
+        if key is not None and recipes:
+            generation_cache.put(key, {"recipes": recipes})
+        outcome = "generated"
+    finally:
+        metrics.RECIPE_GENERATIONS.labels(outcome).inc()
+        metrics.RECIPE_GENERATION_LATENCY.observe(time.perf_counter() - started)
+
+class RecipeStreamParser:
+    """
+    Incrementally scans streamed JSON text for the 'recipes' array and returns each
+    element once its closing brace arrives. Tracks string/escape state so braces
+    inside strings are ignored; everything else is left to json.loads.
     """
-    
-    # Make the API call
-    response = client.chat.completions.create(
-        model="gpt-4.1-nano",
+
+    _ARRAY_START = re.compile(r'"recipes"\s*:\s*\[')
+
+    def __init__(self):
+        self.text = ""
+        self._pos = None  # scan position, None until the 'recipes' array is found
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self._done = False
+
+    def feed(self, chunk):
+        """Add streamed text, return the recipes completed by it"""
+        self.text += chunk
+        if self._done:
+            return []
+        if self._pos is None:
+            match = self._ARRAY_START.search(self.text)
+            if match is None:
+                return []
+            self._pos = match.end()
+
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._object_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        completed.append(json.loads(text[self._object_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._object_start = None
+                elif self._depth < 0:
+                    # End of the recipes array
+                    self._done = True
+                    break
+        self._pos = len(text)
+        return completed
+
+def _build_messages(user_query, ingredients):
+    messages, info = build_messages(user_query, ingredients)
+    metrics.RECIPE_PROMPT_TOKENS.observe(info["prompt_tokens"])
+    logger.debug("Built recipe prompt", extra={
+        "prompt_tokens": info["prompt_tokens"],
+        "ingredients_listed": info["ingredients_listed"],
+        "ingredients_total": info["ingredients_total"]
+    })
+    return messages
+
+def _request_recipes(user_query, ingredients):
+    response = chat_client.chat_completion(
+        model=MODEL,
         response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful cooking assistant. You suggest recipes based on available ingredients in the user's pantry and return your response in JSON format. Assume salt and pepper are generally available. Always include a 'recipes' key in your response containing an array of recipe objects. Be extremely accurate about which ingredients are missing versus available in the pantry."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=_build_messages(user_query, ingredients)
     )
-    
+    return _parse_recipes(response.choices[0].message.content)
+
+def _parse_recipes(content):
     # Parse the response
     try:
-        recipes_json = json.loads(response.choices[0].message.content)
+        recipes_json = json.loads(content)
         
         # Ensure the response has the expected structure
         if 'recipes' not in recipes_json:
@@ -91,35 +201,14 @@ def generate_recipes_from_ingredients(user_query, ingredients):
         return recipes_json
         
     except json.JSONDecodeError:
-        return {"recipes": [], "error": "Failed to parse the response as JSON", "raw_content": response.choices[0].message.content}
+        return {"recipes": [], "error": "Failed to parse the response as JSON", "raw_content": content}
 
 def getListOfIngredients(username):
     #connect to database, select query to get ingredients for particular user
     try:
-        db = mysql.connector.connect(
-            host=os.environ.get("DB_HOST"),
-            user=os.environ.get("DB_USER"),
-            password=os.environ.get("DB_PASS"),
-            database=os.environ.get("DB_NAME")
-        )
-        cursor = db.cursor()
-        query = """select i.name from pantry_ingredient p 
-        inner join users u on u.user_id	= p.user_id
-        inner join ingredient i on p.ingredient_id = i.ingredient_id
-        where u.email = %s
-"""
-        parameters = (username, )
-        cursor.execute(query, parameters)
-        rows = cursor.fetchall()
-        ingredients = [row[0] for row in rows]
-        return ingredients
+        with repository.session() as repo:
+            return repo.get_pantry_names_for_email(username)
 
     except mysql.connector.Error as e:
-        print(f"Error connecting to database: {e}")
+        logger.exception("Error connecting to database")
         return []
-
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'db' in locals() and db.is_connected():
-            db.close()
@@ -0,0 +1,321 @@
+#contains the item-item co-favorite index behind /recipe/<id>/also_saved and /recipe/recommended
+import logging
+import os
+import threading
+import time
+import numpy as np
+import repository
+
+logger = logging.getLogger(__name__)
+
+
+class CoFavoriteIndex:
+    """
+    "Users who saved this also saved": for every recipe, the recipes most often
+    saved by the same users, scored by cosine similarity
+    (together / sqrt(savers of a * savers of b)).
+    The bulk build reads user_favorite_recipes in primary key pages and counts
+    co-occurring pairs with numpy, a batch of users at a time; each recipe then
+    keeps only its best `neighbors` pairs (CSR arrays). Favorites added or
+    removed afterwards are applied as exact count changes on top, and the next
+    periodic rebuild folds them in.
+    Args:
+        neighbors (int): Similar recipes kept per recipe by the bulk build
+        max_user_favorites (int): Only a user's newest favorites are paired, so
+            one user with thousands of saves cannot dominate the build
+        rebuild_interval (int): Seconds between background rebuilds
+        page_size (int): Favorite rows read per query while building
+        batch_pairs (int): Pairs counted per numpy batch, bounds build memory
+    """
+
+    def __init__(self, neighbors=50, max_user_favorites=200, rebuild_interval=3600, page_size=10000,
+                 batch_pairs=20_000_000):
+        self.neighbors = neighbors
+        self.max_user_favorites = max_user_favorites
+        self.rebuild_interval = rebuild_interval
+        self.page_size = page_size
+        self.batch_pairs = batch_pairs
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        # Bulk built part: item number -> recipe_id (sorted), savers per item and
+        # the pruned neighbor lists of item i in _neighbors/_together[_indptr[i]:_indptr[i + 1]]
+        self._recipe_ids = np.zeros(0, dtype=np.int64)
+        self._savers = np.zeros(0, dtype=np.int64)
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._neighbors = np.zeros(0, dtype=np.int64)
+        self._together = np.zeros(0, dtype=np.int64)
+        # Changes since the bulk build: recipe_id -> {other recipe_id: +-count}, recipe_id -> +-savers
+        self._pair_changes = {}
+        self._saver_changes = {}
+        # Changes made while a rebuild is reading the table, replayed onto its result
+        self._pending = None
+        self._built_at = None
+        self._build_seconds = None
+        self._favorites = 0
+
+    ##### Incremental updates #####
+
+    def add_favorite(self, recipe_id, other_recipe_ids):
+        """Record that a user who already saved other_recipe_ids saved recipe_id"""
+        self._change(recipe_id, other_recipe_ids, 1)
+
+    def remove_favorite(self, recipe_id, other_recipe_ids):
+        """Record that a user removed recipe_id and still has other_recipe_ids saved"""
+        self._change(recipe_id, other_recipe_ids, -1)
+
+    def _change(self, recipe_id, other_recipe_ids, sign):
+        # Same cap as the bulk build: only the user's newest favorites are paired
+        others = sorted({other for other in other_recipe_ids if other != recipe_id}, reverse=True)
+        others = others[:self.max_user_favorites - 1]
+        with self._lock:
+            self._apply(recipe_id, others, sign)
+            if self._pending is not None:
+                self._pending.append((recipe_id, others, sign))
+
+    def _apply(self, recipe_id, others, sign):
+        self._saver_changes[recipe_id] = self._saver_changes.get(recipe_id, 0) + sign
+        self._favorites += sign
+        changes = self._pair_changes.setdefault(recipe_id, {})
+        for other in others:
+            changes[other] = changes.get(other, 0) + sign
+            other_changes = self._pair_changes.setdefault(other, {})
+            other_changes[recipe_id] = other_changes.get(recipe_id, 0) + sign
+
+    ##### Queries #####
+
+    def similar(self, recipe_id, k=10):
+        """
+        Recipes most often saved together with recipe_id.
+        Returns:
+            list: (recipe_id, score, saved together) tuples, best first
+        """
+        with self._lock:
+            scores = self._scores(recipe_id)
+        best = sorted(scores.items(), key=lambda item: (-item[1][0], -item[0]))[:k]
+        return [(other, round(score, 4), together) for other, (score, together) in best]
+
+    def recommend(self, saved_recipe_ids, k=20):
+        """
+        Recipes similar to the ones a user saved, summing the similarity to each
+        saved recipe; saved recipes themselves are never returned.
+        Returns:
+            list: (recipe_id, score) tuples, best first
+        """
+        saved = set(saved_recipe_ids)
+        totals = {}
+        with self._lock:
+            for recipe_id in saved:
+                for other, (score, _) in self._scores(recipe_id).items():
+                    if other not in saved:
+                        totals[other] = totals.get(other, 0.0) + score
+        best = sorted(totals.items(), key=lambda item: (-item[1], -item[0]))[:k]
+        return [(other, round(score, 4)) for other, score in best]
+
+    def _scores(self, recipe_id):
+        """{other recipe_id: (cosine score, saved together)} for one recipe, caller holds _lock"""
+        together, base_savers = {}, {}
+        item = self._item(recipe_id)
+        if item is not None:
+            start, end = self._indptr[item], self._indptr[item + 1]
+            neighbors = self._neighbors[start:end]
+            together = dict(zip(self._recipe_ids[neighbors].tolist(), self._together[start:end].tolist()))
+            base_savers = dict(zip(together, self._savers[neighbors].tolist()))
+        for other, change in self._pair_changes.get(recipe_id, {}).items():
+            together[other] = together.get(other, 0) + change
+
+        savers = self._savers_of(recipe_id, item)
+        if savers <= 0:
+            return {}
+        scores = {}
+        for other, count in together.items():
+            if count <= 0:
+                continue
+            if other in base_savers:
+                other_savers = base_savers[other] + self._saver_changes.get(other, 0)
+            else:
+                other_savers = self._savers_of(other, self._item(other))
+            if other_savers > 0:
+                scores[other] = (count / (savers * other_savers) ** 0.5, count)
+        return scores
+
+    def _item(self, recipe_id):
+        position = int(np.searchsorted(self._recipe_ids, recipe_id))
+        if position < len(self._recipe_ids) and self._recipe_ids[position] == recipe_id:
+            return position
+        return None
+
+    def _savers_of(self, recipe_id, item):
+        base = int(self._savers[item]) if item is not None else 0
+        return base + self._saver_changes.get(recipe_id, 0)
+
+    ##### Bulk build #####
+
+    def refresh(self, repo):
+        """
+        Build the index on first use (the first request waits for it), then
+        rebuild in a background thread at most every rebuild_interval seconds
+        """
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self.rebuild(repo)
+            return
+        if time.monotonic() - self._built_at < self.rebuild_interval:
+            return
+        if self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            with repository.session() as repo:
+                self.rebuild(repo)
+        except Exception as e:
+            logger.exception("Error rebuilding co-favorite index")
+            # Try again after another interval instead of on every request
+            self._built_at = time.monotonic()
+        finally:
+            self._build_lock.release()
+
+    def rebuild(self, repo):
+        """Read every favorite in primary key order and rebuild from scratch"""
+        with self._lock:
+            self._pending = []
+        try:
+            users, recipes = [], []
+            after = (0, 0)
+            while True:
+                rows = repo.get_favorites_after(after[0], after[1], self.page_size)
+                if not rows:
+                    break
+                users.append(np.fromiter((row["user_id"] for row in rows), dtype=np.int64, count=len(rows)))
+                recipes.append(np.fromiter((row["recipe_id"] for row in rows), dtype=np.int64, count=len(rows)))
+                after = (rows[-1]["user_id"], rows[-1]["recipe_id"])
+                if len(rows) < self.page_size:
+                    break
+            users = np.concatenate(users) if users else np.zeros(0, dtype=np.int64)
+            recipes = np.concatenate(recipes) if recipes else np.zeros(0, dtype=np.int64)
+            self.build(users, recipes)
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def build(self, users, recipes):
+        """
+        Replace the index with one built from favorite rows.
+        Args:
+            users (np.ndarray): user_id per favorite, sorted
+            recipes (np.ndarray): recipe_id per favorite, sorted within each user
+        """
+        started = time.monotonic()
+        recipe_ids, items = np.unique(recipes, return_inverse=True)
+        items = items.astype(np.int64)
+        n = len(recipe_ids)
+
+        # Keep each user's newest max_user_favorites favorites (the last ones of the group)
+        starts = _group_starts(users)
+        sizes = np.diff(np.append(starts, len(users)))
+        position = np.arange(len(users)) - np.repeat(starts, sizes)
+        keep = position >= np.repeat(sizes - self.max_user_favorites, sizes)
+        users, items = users[keep], items[keep]
+        savers = np.bincount(items, minlength=n)
+
+        keys, counts = self._count_pairs(users, items, n)
+        first, second = keys // max(n, 1), keys % max(n, 1)
+        rows = np.concatenate((first, second))
+        columns = np.concatenate((second, first))
+        together = np.concatenate((counts, counts))
+        scores = together / np.sqrt(savers[rows].astype(np.float64) * savers[columns])
+
+        # Best `neighbors` per row: sort by row, then score descending
+        order = np.lexsort((-scores, rows))
+        rows, columns, together = rows[order], columns[order], together[order]
+        row_starts = np.searchsorted(rows, np.arange(n))
+        rank = np.arange(len(rows)) - row_starts[rows] if len(rows) else rows
+        keep = rank < self.neighbors
+        rows, columns, together = rows[keep], columns[keep], together[keep]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+
+        with self._lock:
+            self._recipe_ids, self._savers = recipe_ids, savers
+            self._indptr, self._neighbors, self._together = indptr, columns, together
+            self._pair_changes, self._saver_changes = {}, {}
+            self._favorites = len(users)
+            # Changes made while the table was read may or may not be in it;
+            # counting them twice only nudges a score until the next rebuild
+            for recipe_id, others, sign in self._pending or ():
+                self._apply(recipe_id, others, sign)
+            self._built_at = time.monotonic()
+            self._build_seconds = round(self._built_at - started, 3)
+
+    def _count_pairs(self, users, items, n):
+        """Unique (a, b) item pairs with a < b saved by the same user, encoded a * n + b, and their counts"""
+        starts = _group_starts(users)
+        sizes = np.diff(np.append(starts, len(users)))
+        pairs_per_user = sizes * (sizes - 1) // 2
+        batches = []
+        keys = np.zeros(0, dtype=np.int64)
+        counts = np.zeros(0, dtype=np.int64)
+
+        # Users are split into batches of about batch_pairs pairs each
+        cumulative = np.cumsum(pairs_per_user)
+        first_user = 0
+        while first_user < len(starts):
+            limit = (cumulative[first_user - 1] if first_user else 0) + self.batch_pairs
+            last_user = max(int(np.searchsorted(cumulative, limit, side="right")), first_user + 1)
+            batch_keys = _user_pairs(items, starts[first_user:last_user], sizes[first_user:last_user], n)
+            batches.append(np.unique(batch_keys, return_counts=True))
+            first_user = last_user
+            if sum(len(batch[0]) for batch in batches) > self.batch_pairs:
+                keys, counts = _merge_counts([(keys, counts)] + batches)
+                batches = []
+        if batches:
+            keys, counts = _merge_counts([(keys, counts)] + batches)
+        return keys, counts
+
+    def stats(self):
+        with self._lock:
+            return {
+                "recipes": len(self._recipe_ids),
+                "favorites": self._favorites,
+                "neighbor_pairs": len(self._neighbors),
+                "recipes_changed_since_build": len(self._pair_changes),
+                "build_seconds": self._build_seconds,
+                "rebuilding": self._pending is not None,
+                "rebuild_interval": self.rebuild_interval
+            }
+
+
+def _group_starts(sorted_values):
+    """Index of the first element of every run of equal values"""
+    if not len(sorted_values):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate(([True], sorted_values[1:] != sorted_values[:-1])))
+
+
+def _user_pairs(items, starts, sizes, n):
+    """Every item pair within each group items[start:start + size], encoded a * n + b"""
+    # Element p of a group pairs with the size - 1 - p elements after it
+    element = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+    group_end = np.repeat(starts + sizes, sizes)
+    partners = group_end - element - 1
+    left = np.repeat(element, partners)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(partners) - partners, partners)
+    right = left + 1 + offsets
+    a, b = items[left], items[right]
+    return np.minimum(a, b) * n + np.maximum(a, b)
+
+
+def _merge_counts(parts):
+    keys = np.concatenate([keys for keys, _ in parts])
+    counts = np.concatenate([counts for _, counts in parts])
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+
+
+co_favorites = CoFavoriteIndex(
+    neighbors=int(os.environ.get("RECOMMEND_NEIGHBORS", 50)),
+    max_user_favorites=int(os.environ.get("RECOMMEND_MAX_USER_FAVORITES", 200)),
+    rebuild_interval=int(os.environ.get("RECOMMEND_REBUILD_INTERVAL", 3600)),
+    page_size=int(os.environ.get("RECOMMEND_PAGE_SIZE", 10000))
+)
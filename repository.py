@@ -0,0 +1,730 @@
+#contains every SQL statement the API runs, grouped by table
+from contextlib import contextmanager
+from db_pool import get_db_connection
+from ingredient_cache import ingredient_cache
+from allergens import classify_many
+import metrics
+
+# Recipe diet flag columns search_recipes() can filter on
+DIET_FLAG_COLUMNS = ("is_vegetarian", "is_gluten_free", "is_nut_free")
+
+# Named statements. Each one is prepared on the server the first time a pooled
+# connection runs it, and the prepared handle is kept on that connection so
+# later calls only send the parameters.
+STATEMENTS = {
+    # users
+    "user_by_email": "SELECT user_id, email, password FROM users WHERE email = %s",
+    "user_by_id": """
+        SELECT user_id, first_name, last_name, email, is_vegetarian, is_nut_free, is_gluten_free
+        FROM users WHERE user_id = %s
+    """,
+    "insert_user": "INSERT INTO users (first_name, last_name, email, password) VALUES (%s, %s, %s, %s)",
+    "update_user_preferences": """
+        UPDATE users SET is_vegetarian = %s, is_nut_free = %s, is_gluten_free = %s
+        WHERE user_id = %s
+    """,
+    "update_user_password": "UPDATE users SET password = %s WHERE user_id = %s",
+    "delete_user": "DELETE FROM users WHERE user_id = %s",
+    # Version of the user's pantry and favorites, for conditional GETs
+    "user_data_version": "SELECT data_version FROM users WHERE user_id = %s",
+    "bump_user_data_version": "UPDATE users SET data_version = data_version + 1 WHERE user_id = %s",
+
+    # pantry
+    "pantry_for_user": """
+        SELECT p.ingredient_id, p.user_id, p.quantity, p.unit, i.name
+        FROM pantry_ingredient p
+        JOIN ingredient i ON p.ingredient_id = i.ingredient_id
+        WHERE p.user_id = %s
+    """,
+    # Pantry pages follow the ingredient_id order of the user_id index
+    "pantry_page_after": """
+        SELECT p.ingredient_id, p.user_id, p.quantity, p.unit, i.name
+        FROM pantry_ingredient p
+        JOIN ingredient i ON p.ingredient_id = i.ingredient_id
+        WHERE p.user_id = %s AND p.ingredient_id > %s
+        ORDER BY p.ingredient_id
+        LIMIT %s
+    """,
+    "pantry_names_for_email": """
+        SELECT i.name FROM pantry_ingredient p
+        INNER JOIN users u ON u.user_id = p.user_id
+        INNER JOIN ingredient i ON p.ingredient_id = i.ingredient_id
+        WHERE u.email = %s
+    """,
+    "pantry_item": "SELECT ingredient_id FROM pantry_ingredient WHERE user_id = %s AND ingredient_id = %s",
+    "insert_pantry_item": "INSERT INTO pantry_ingredient (user_id, ingredient_id, quantity, unit) VALUES (%s, %s, %s, %s)",
+    "update_pantry_item": "UPDATE pantry_ingredient SET quantity = %s, unit = %s WHERE user_id = %s AND ingredient_id = %s",
+    "delete_pantry_item": "DELETE FROM pantry_ingredient WHERE user_id = %s AND ingredient_id = %s",
+    "delete_pantry_for_user": "DELETE FROM pantry_ingredient WHERE user_id = %s",
+    "delete_favorites_for_user": "DELETE FROM user_favorite_recipes WHERE user_id = %s",
+
+    # ingredients
+    # Walks the primary key, used by classify_ingredients.py
+    "ingredients_page_after": """
+        SELECT ingredient_id, name, contains_nuts, contains_gluten, contains_meat
+        FROM ingredient
+        WHERE ingredient_id > %s
+        ORDER BY ingredient_id
+        LIMIT %s
+    """,
+
+    # recipes
+    "insert_recipe": """
+        INSERT INTO recipe (name, description, steps, is_vegetarian, is_gluten_free, is_nut_free, ingredient_names)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """,
+    "recipe_id_range": "SELECT MIN(recipe_id) AS first_id, MAX(recipe_id) AS last_id FROM recipe",
+    # Clears the diet flags of recipes (in a recipe_id range) that use an ingredient
+    # with the matching allergen. Flags are only ever cleared: recipe_ingredient
+    # does not list ingredients the user was missing, so it cannot prove a recipe free of one.
+    "derive_recipe_diet_flags": """
+        UPDATE recipe r
+        JOIN (
+            SELECT ri.recipe_id,
+                   MAX(i.contains_meat) AS has_meat,
+                   MAX(i.contains_gluten) AS has_gluten,
+                   MAX(i.contains_nuts) AS has_nuts
+            FROM recipe_ingredient ri
+            JOIN ingredient i ON i.ingredient_id = ri.ingredient_id
+            WHERE ri.recipe_id BETWEEN %s AND %s
+            GROUP BY ri.recipe_id
+        ) f ON f.recipe_id = r.recipe_id
+        SET r.is_vegetarian = r.is_vegetarian AND NOT f.has_meat,
+            r.is_gluten_free = r.is_gluten_free AND NOT f.has_gluten,
+            r.is_nut_free = r.is_nut_free AND NOT f.has_nuts
+    """,
+    # Walks the primary key, used to load the cook-now index in pages
+    "recipes_page_after": """
+        SELECT recipe_id, is_vegetarian, is_gluten_free, is_nut_free
+        FROM recipe
+        WHERE recipe_id > %s
+        ORDER BY recipe_id
+        LIMIT %s
+    """,
+
+    # favorites
+    # Favorites are listed newest first and paged on the (user_id, recipe_id)
+    # primary key, so every page is an index range scan
+    "favorites_first_page": """
+        SELECT r.recipe_id, r.name, r.description, r.steps, r.is_vegetarian, r.is_gluten_free, r.is_nut_free
+        FROM user_favorite_recipes uf
+        JOIN recipe r ON r.recipe_id = uf.recipe_id
+        WHERE uf.user_id = %s
+        ORDER BY uf.recipe_id DESC
+        LIMIT %s
+    """,
+    "favorites_page_before": """
+        SELECT r.recipe_id, r.name, r.description, r.steps, r.is_vegetarian, r.is_gluten_free, r.is_nut_free
+        FROM user_favorite_recipes uf
+        JOIN recipe r ON r.recipe_id = uf.recipe_id
+        WHERE uf.user_id = %s AND uf.recipe_id < %s
+        ORDER BY uf.recipe_id DESC
+        LIMIT %s
+    """,
+    "favorite_by_recipe_name": """
+        SELECT r.recipe_id
+        FROM recipe r
+        JOIN user_favorite_recipes uf ON r.recipe_id = uf.recipe_id
+        WHERE uf.user_id = %s AND r.name = %s
+    """,
+    # Newest favorite ids of one user, and the whole table in primary key order
+    # for the co-favorite index build
+    "favorite_ids_for_user": """
+        SELECT recipe_id FROM user_favorite_recipes
+        WHERE user_id = %s
+        ORDER BY recipe_id DESC
+        LIMIT %s
+    """,
+    "favorites_after": """
+        SELECT user_id, recipe_id FROM user_favorite_recipes
+        WHERE user_id > %s OR (user_id = %s AND recipe_id > %s)
+        ORDER BY user_id, recipe_id
+        LIMIT %s
+    """,
+    "favorite": "SELECT user_id, recipe_id FROM user_favorite_recipes WHERE user_id = %s AND recipe_id = %s",
+    "insert_favorite": "INSERT INTO user_favorite_recipes (user_id, recipe_id) VALUES (%s, %s)",
+    "delete_favorite": "DELETE FROM user_favorite_recipes WHERE user_id = %s AND recipe_id = %s",
+
+    # reviews
+    "review": """
+        SELECT recipe_id, user_id, rating, review_text, created_at
+        FROM reviews WHERE recipe_id = %s AND user_id = %s
+    """,
+    "review_for_update": """
+        SELECT recipe_id, user_id, rating, review_text, created_at
+        FROM reviews WHERE recipe_id = %s AND user_id = %s
+        FOR UPDATE
+    """,
+    "ratings_by_user": "SELECT recipe_id, rating FROM reviews WHERE user_id = %s AND rating IS NOT NULL",
+    "delete_reviews_for_user": "DELETE FROM reviews WHERE user_id = %s",
+    "insert_review": "INSERT INTO reviews (recipe_id, user_id, rating, review_text) VALUES (%s, %s, %s, %s)",
+    "update_review": "UPDATE reviews SET rating = %s, review_text = %s WHERE recipe_id = %s AND user_id = %s",
+    # Reviews of a recipe newest first, paged on ix_reviews_recipe_created
+    # (which ends in the user_id primary key column)
+    "reviews_first_page": """
+        SELECT recipe_id, user_id, rating, review_text, created_at
+        FROM reviews
+        WHERE recipe_id = %s
+        ORDER BY created_at DESC, user_id DESC
+        LIMIT %s
+    """,
+    "reviews_page_before": """
+        SELECT recipe_id, user_id, rating, review_text, created_at
+        FROM reviews
+        WHERE recipe_id = %s AND (created_at < %s OR (created_at = %s AND user_id < %s))
+        ORDER BY created_at DESC, user_id DESC
+        LIMIT %s
+    """,
+
+    # rating summary
+    # The summary row changes in the same transaction as the review, and the
+    # row lock taken here serializes concurrent reviews of one recipe.
+    # Assignments run left to right, so rating_avg sees the updated sum and count.
+    "add_rating_to_summary": """
+        INSERT INTO recipe_rating_summary
+            (recipe_id, review_count, rating_sum, rating_avg, rating_1, rating_2, rating_3, rating_4, rating_5)
+        VALUES (%s, 1, %s, %s, %s, %s, %s, %s, %s) AS new
+        ON DUPLICATE KEY UPDATE
+            review_count = recipe_rating_summary.review_count + 1,
+            rating_sum = recipe_rating_summary.rating_sum + new.rating_sum,
+            rating_avg = recipe_rating_summary.rating_sum / recipe_rating_summary.review_count,
+            rating_1 = recipe_rating_summary.rating_1 + new.rating_1,
+            rating_2 = recipe_rating_summary.rating_2 + new.rating_2,
+            rating_3 = recipe_rating_summary.rating_3 + new.rating_3,
+            rating_4 = recipe_rating_summary.rating_4 + new.rating_4,
+            rating_5 = recipe_rating_summary.rating_5 + new.rating_5
+    """,
+    "change_rating_in_summary": """
+        UPDATE recipe_rating_summary
+        SET review_count = review_count + %s,
+            rating_sum = rating_sum + %s,
+            rating_avg = rating_sum / NULLIF(review_count, 0),
+            rating_1 = rating_1 + %s,
+            rating_2 = rating_2 + %s,
+            rating_3 = rating_3 + %s,
+            rating_4 = rating_4 + %s,
+            rating_5 = rating_5 + %s
+        WHERE recipe_id = %s
+    """,
+    "rating_summary": """
+        SELECT recipe_id, review_count, rating_sum, rating_avg, rating_1, rating_2, rating_3, rating_4, rating_5
+        FROM recipe_rating_summary WHERE recipe_id = %s
+    """,
+    # Reads ix_recipe_rating_summary_avg backwards and stops after LIMIT rows,
+    # however many reviews there are
+    "top_rated": """
+        SELECT r.recipe_id, r.name, r.description, r.steps, r.is_vegetarian, r.is_gluten_free, r.is_nut_free,
+               s.review_count, s.rating_avg
+        FROM recipe_rating_summary s
+        JOIN recipe r ON r.recipe_id = s.recipe_id
+        WHERE s.review_count >= %s
+        ORDER BY s.rating_avg DESC, s.review_count DESC, s.recipe_id DESC
+        LIMIT %s
+    """,
+}
+
+
+class Repository:
+    """
+    Data access for one request. Wraps a single pooled connection, so an
+    instance must never be shared between threads - call session() instead.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    ##### Statement helpers #####
+
+    def _prepared(self, name):
+        cache = self.conn.statement_cache
+        cursor = cache.get(name)
+        if cursor is None:
+            cursor = self.conn.cursor(prepared=True, dictionary=True)
+            cache[name] = cursor
+        return cursor
+
+    def fetch_all(self, name, params=()):
+        metrics.count_statement(name)
+        cursor = self._prepared(name)
+        cursor.execute(STATEMENTS[name], params)
+        return cursor.fetchall()
+
+    def fetch_one(self, name, params=()):
+        # Always drain the result so the cached cursor is ready for the next call
+        rows = self.fetch_all(name, params)
+        return rows[0] if rows else None
+
+    def write(self, name, params=()):
+        """Run an INSERT/UPDATE/DELETE statement and return the cursor for rowcount/lastrowid"""
+        metrics.count_statement(name)
+        cursor = self._prepared(name)
+        cursor.execute(STATEMENTS[name], params)
+        return cursor
+
+    def query(self, sql, params=()):
+        """Run an ad hoc SELECT (e.g. one with a variable length IN list) and return every row"""
+        metrics.count_statement("adhoc")
+        cursor = self.conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def execute(self, sql, params=()):
+        """Run an ad hoc INSERT/UPDATE/DELETE and return (rowcount, lastrowid)"""
+        metrics.count_statement("adhoc")
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.rowcount, cursor.lastrowid
+        finally:
+            cursor.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    ##### Users #####
+
+    def find_user_by_email(self, email):
+        return self.fetch_one("user_by_email", (email,))
+
+    def find_user(self, user_id):
+        return self.fetch_one("user_by_id", (user_id,))
+
+    def create_user(self, first_name, last_name, email, hashed_password):
+        return self.write("insert_user", (first_name, last_name, email, hashed_password)).lastrowid
+
+    def update_preferences(self, user_id, is_vegetarian, is_nut_free, is_gluten_free):
+        self.write("update_user_preferences", (is_vegetarian, is_nut_free, is_gluten_free, user_id))
+
+    def update_password(self, user_id, hashed_password):
+        self.write("update_user_password", (hashed_password, user_id))
+
+    def delete_user(self, user_id):
+        # Everything that references the user is deleted explicitly: the foreign
+        # keys only cascade on schemas built from the initial dump, migration
+        # e4ab9cb169ec recreated them without ON DELETE CASCADE. The user's
+        # ratings leave the recipe summaries before their reviews go.
+        for row in self.fetch_all("ratings_by_user", (user_id,)):
+            self._change_rating(row["recipe_id"], row["rating"], None)
+        self.write("delete_reviews_for_user", (user_id,))
+        self.write("delete_favorites_for_user", (user_id,))
+        self.write("delete_pantry_for_user", (user_id,))
+        self.write("delete_user", (user_id,))
+
+    def get_data_version(self, user_id):
+        """Version of the user's pantry and favorites, None if the user does not exist"""
+        row = self.fetch_one("user_data_version", (user_id,))
+        return row["data_version"] if row else None
+
+    def bump_data_version(self, user_id):
+        """Call in the transaction that changes the user's pantry or favorites"""
+        self.write("bump_user_data_version", (user_id,))
+
+    ##### Pantry #####
+
+    def get_pantry(self, user_id):
+        return self.fetch_all("pantry_for_user", (user_id,))
+
+    def get_pantry_page(self, user_id, after_ingredient_id, limit):
+        """Up to limit pantry rows with ingredient_id greater than after_ingredient_id (None for the first page)"""
+        return self.fetch_all("pantry_page_after", (user_id, after_ingredient_id or 0, limit))
+
+    def get_pantry_names_for_email(self, email):
+        return [row["name"] for row in self.fetch_all("pantry_names_for_email", (email,))]
+
+    def pantry_item_exists(self, user_id, ingredient_id):
+        return self.fetch_one("pantry_item", (user_id, ingredient_id)) is not None
+
+    def add_pantry_item(self, user_id, ingredient_id, quantity, unit):
+        self.write("insert_pantry_item", (user_id, ingredient_id, quantity, unit))
+
+    def update_pantry_item(self, user_id, ingredient_id, quantity, unit):
+        return self.write("update_pantry_item", (quantity, unit, user_id, ingredient_id)).rowcount
+
+    def remove_pantry_item(self, user_id, ingredient_id):
+        return self.write("delete_pantry_item", (user_id, ingredient_id)).rowcount
+
+    def get_pantry_items_by_name(self, user_id, names):
+        """
+        Return {ingredient_id: name} for the user's pantry rows whose ingredient matches one of names,
+        name being the one from names that matched (not necessarily spelled like the stored row)
+        """
+        if not names:
+            return {}
+        # One probe per name so each row carries the name that was asked for, see _select_ingredient_ids
+        rows = self.query(
+            " UNION ALL ".join([
+                """
+                SELECT %s AS requested_name, p.ingredient_id
+                FROM pantry_ingredient p
+                JOIN ingredient i ON p.ingredient_id = i.ingredient_id
+                WHERE p.user_id = %s AND i.name = %s
+                """
+            ] * len(names)),
+            [value for name in names for value in (name, user_id, name)]
+        )
+        return {row["ingredient_id"]: row["requested_name"] for row in rows}
+
+    def upsert_pantry_items(self, user_id, items):
+        """Insert or overwrite many pantry rows at once, items is a list of (ingredient_id, quantity, unit)"""
+        if not items:
+            return 0
+        params = []
+        for ingredient_id, quantity, unit in items:
+            params.extend((user_id, ingredient_id, quantity, unit))
+        rowcount, _ = self.execute(
+            f"""
+            INSERT INTO pantry_ingredient (user_id, ingredient_id, quantity, unit)
+            VALUES {", ".join(["(%s, %s, %s, %s)"] * len(items))} AS new
+            ON DUPLICATE KEY UPDATE quantity = new.quantity, unit = new.unit
+            """,
+            params
+        )
+        return rowcount
+
+    def remove_pantry_items(self, user_id, ingredient_ids):
+        if not ingredient_ids:
+            return 0
+        rowcount, _ = self.execute(
+            f"DELETE FROM pantry_ingredient WHERE user_id = %s AND ingredient_id IN ({_placeholders(len(ingredient_ids))})",
+            (user_id, *ingredient_ids)
+        )
+        return rowcount
+
+    ##### Ingredients #####
+    # Lookups go through ingredient_cache first, so names we have already seen
+    # cost no round trip at all
+
+    def find_ingredient_ids(self, names):
+        """
+        Look up many ingredient names, querying the database once for the ones not in the cache.
+        Returns {ingredient_key(name): ingredient_id}; names that do not exist are left out.
+        """
+        names_by_key = _names_by_key(names)
+        found, missing = ingredient_cache.get_many(list(names_by_key))
+        if missing:
+            loaded = self._select_ingredient_ids([names_by_key[key] for key in missing])
+            ingredient_cache.put_many(loaded)
+            found.update(loaded)
+        return found
+
+    def create_ingredients(self, names):
+        """
+        Insert the given ingredients (skipping any that exist by now) and return
+        {ingredient_key(name): ingredient_id} for all of them.
+
+        The rows are written in the caller's transaction. ix_ingredient_name is
+        unique, so a name another request created in the meantime collides on
+        it and is read back rather than inserted twice.
+        """
+        names = _unique_names(names)
+        if not names:
+            return {}
+
+        # New ingredients are classified on the way in, see classify_ingredients.py for the rest
+        params = []
+        for name, flags in zip(names, classify_many(names)):
+            params.extend((name, flags["contains_nuts"], flags["contains_gluten"], flags["contains_meat"]))
+        self.execute(
+            f"""
+            INSERT INTO ingredient (name, contains_nuts, contains_gluten, contains_meat)
+            VALUES {", ".join(["(%s, %s, %s, %s)"] * len(names))}
+            ON DUPLICATE KEY UPDATE ingredient_id = ingredient_id
+            """,
+            params
+        )
+        # A locking read sees rows committed after this transaction's snapshot
+        # was taken. Nothing is cached here: the new ids only exist once the
+        # caller commits, find_ingredient_ids picks them up after that.
+        return self._select_ingredient_ids(names, lock=True)
+
+    def get_ingredients_page(self, after_ingredient_id, limit):
+        """Up to limit ingredients with ingredient_id above after_ingredient_id, in id order"""
+        return self.fetch_all("ingredients_page_after", (after_ingredient_id, limit))
+
+    def set_ingredient_flags(self, updates):
+        """
+        Write allergen flags for many ingredients.
+        updates is a list of (ingredient_id, contains_nuts, contains_gluten, contains_meat);
+        it is grouped by flag combination, so at most eight UPDATE statements run.
+        """
+        groups = {}
+        for ingredient_id, *flags in updates:
+            groups.setdefault(tuple(bool(flag) for flag in flags), []).append(ingredient_id)
+        for (contains_nuts, contains_gluten, contains_meat), ingredient_ids in groups.items():
+            self.execute(
+                f"""
+                UPDATE ingredient
+                SET contains_nuts = %s, contains_gluten = %s, contains_meat = %s
+                WHERE ingredient_id IN ({_placeholders(len(ingredient_ids))})
+                """,
+                [contains_nuts, contains_gluten, contains_meat] + ingredient_ids
+            )
+
+    def get_or_create_ingredients(self, names):
+        """
+        Resolve every name to an ingredient_id, creating the ones that do not exist.
+        Returns the ids in the order of names; raises LookupError if a name could not be resolved.
+        """
+        ingredient_ids = self.find_ingredient_ids(names)
+        new_names = [name for name in _unique_names(names) if ingredient_key(name) not in ingredient_ids]
+        ingredient_ids.update(self.create_ingredients(new_names))
+        resolved = [ingredient_ids.get(ingredient_key(name)) for name in names]
+        unresolved = [name for name, ingredient_id in zip(names, resolved) if ingredient_id is None]
+        if unresolved:
+            raise LookupError(f"Could not resolve ingredients: {', '.join(unresolved)}")
+        return resolved
+
+    def _select_ingredient_ids(self, names, lock=False):
+        if not names:
+            return {}
+        # The ingredient table's collation ignores accents as well as case, so
+        # "jalapeno" can match a row stored as "jalapeño". Keying rows by the stored
+        # name would lose that match; one `name = %s` probe per requested name
+        # instead returns the name that was asked for next to the id MySQL matched.
+        rows = self.query(
+            " UNION ALL ".join([
+                f"""
+                (SELECT %s AS requested_name, ingredient_id FROM ingredient WHERE name = %s{" FOR SHARE" if lock else ""})
+                """
+            ] * len(names)),
+            [value for name in names for value in (name, name)]
+        )
+        return {ingredient_key(row["requested_name"]): row["ingredient_id"] for row in rows}
+
+    ##### Recipes #####
+
+    def create_recipe(self, name, description, steps_json, is_vegetarian, is_gluten_free, is_nut_free, ingredient_names=()):
+        """Insert a recipe; ingredient_names are stored on the row for full-text search"""
+        return self.write(
+            "insert_recipe",
+            (name, description, steps_json, is_vegetarian, is_gluten_free, is_nut_free, ", ".join(ingredient_names))
+        ).lastrowid
+
+    def search_recipes(self, text, require=(), after=None, limit=20):
+        """
+        Full-text search over recipe name, description, steps and ingredient names,
+        best match first.
+        Args:
+            text (str): Search words (natural language mode, no operators)
+            require (tuple): Diet flag columns that must be set, e.g. ("is_vegetarian",)
+            after (tuple): (score, recipe_id) of the last row of the previous page, None for the first
+            limit (int): Rows to return
+        """
+        # Column names are only ever taken from DIET_FLAG_COLUMNS, never from the caller
+        filters = "".join(f" AND {flag} = TRUE" for flag in require if flag in DIET_FLAG_COLUMNS)
+        params = [text, text]
+        having = ""
+        if after is not None:
+            having = "HAVING score < %s OR (score = %s AND recipe_id < %s)"
+            params.extend((after[0], after[0], after[1]))
+        params.append(limit)
+        return self.query(
+            f"""
+            SELECT recipe_id, name, description, steps, is_vegetarian, is_gluten_free, is_nut_free,
+                   MATCH(name, description, steps, ingredient_names) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score
+            FROM recipe
+            WHERE MATCH(name, description, steps, ingredient_names) AGAINST (%s IN NATURAL LANGUAGE MODE){filters}
+            {having}
+            ORDER BY score DESC, recipe_id DESC
+            LIMIT %s
+            """,
+            params
+        )
+
+    def add_recipe_ingredients(self, recipe_id, ingredient_ids, quantity, unit):
+        """Link many ingredients to a recipe with one multi-row INSERT"""
+        ingredient_ids = list(dict.fromkeys(ingredient_ids))
+        if not ingredient_ids:
+            return
+        params = []
+        for ingredient_id in ingredient_ids:
+            params.extend((recipe_id, ingredient_id, quantity, unit))
+        self.execute(
+            f"""
+            INSERT INTO recipe_ingredient (recipe_id, ingredient_id, quantity, unit)
+            VALUES {", ".join(["(%s, %s, %s, %s)"] * len(ingredient_ids))}
+            """,
+            params
+        )
+
+    def get_recipe_id_range(self):
+        """Return (lowest, highest) recipe_id, (None, None) when there are no recipes"""
+        row = self.fetch_one("recipe_id_range")
+        return (row["first_id"], row["last_id"]) if row else (None, None)
+
+    def derive_recipe_diet_flags(self, first_recipe_id, last_recipe_id):
+        """Clear recipe diet flags contradicted by their ingredients, for a recipe_id range; returns rows changed"""
+        return self.write("derive_recipe_diet_flags", (first_recipe_id, last_recipe_id)).rowcount
+
+    def get_recipes_page(self, after_recipe_id, limit):
+        """Up to limit recipes (id and diet flags) with recipe_id above after_recipe_id, in id order"""
+        return self.fetch_all("recipes_page_after", (after_recipe_id, limit))
+
+    def get_recipes(self, recipe_ids):
+        """Return {recipe_id: recipe row} for many recipes with a single query"""
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        if not recipe_ids:
+            return {}
+        rows = self.query(
+            f"""
+            SELECT recipe_id, name, description, steps, is_vegetarian, is_gluten_free, is_nut_free
+            FROM recipe
+            WHERE recipe_id IN ({_placeholders(len(recipe_ids))})
+            """,
+            recipe_ids
+        )
+        return {row["recipe_id"]: row for row in rows}
+
+    def get_recipe_ingredient_names(self, recipe_ids):
+        """Return {recipe_id: [ingredient names]} for many recipes with a single query"""
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        names = {recipe_id: [] for recipe_id in recipe_ids}
+        if not recipe_ids:
+            return names
+        rows = self.query(
+            f"""
+            SELECT ri.recipe_id, i.name
+            FROM recipe_ingredient ri
+            JOIN ingredient i ON i.ingredient_id = ri.ingredient_id
+            WHERE ri.recipe_id IN ({_placeholders(len(recipe_ids))})
+            """,
+            recipe_ids
+        )
+        for row in rows:
+            names[row["recipe_id"]].append(row["name"])
+        return names
+
+    ##### Favorites #####
+
+    def get_favorites_page(self, user_id, before_recipe_id, limit):
+        """Up to limit favorites with recipe_id below before_recipe_id (None for the first page), newest first"""
+        if before_recipe_id is None:
+            return self.fetch_all("favorites_first_page", (user_id, limit))
+        return self.fetch_all("favorites_page_before", (user_id, before_recipe_id, limit))
+
+    def find_favorite_by_recipe_name(self, user_id, recipe_name):
+        row = self.fetch_one("favorite_by_recipe_name", (user_id, recipe_name))
+        return row["recipe_id"] if row else None
+
+    def get_favorite_ids(self, user_id, limit):
+        """The user's newest limit favorite recipe ids"""
+        return [row["recipe_id"] for row in self.fetch_all("favorite_ids_for_user", (user_id, limit))]
+
+    def get_favorites_after(self, after_user_id, after_recipe_id, limit):
+        """Up to limit (user_id, recipe_id) favorite rows after the given key, in primary key order"""
+        return self.fetch_all("favorites_after", (after_user_id, after_user_id, after_recipe_id, limit))
+
+    def favorite_exists(self, user_id, recipe_id):
+        return self.fetch_one("favorite", (user_id, recipe_id)) is not None
+
+    def add_favorite(self, user_id, recipe_id):
+        self.write("insert_favorite", (user_id, recipe_id))
+
+    def remove_favorite(self, user_id, recipe_id):
+        return self.write("delete_favorite", (user_id, recipe_id)).rowcount
+
+    ##### Reviews #####
+
+    def get_review(self, recipe_id, user_id):
+        return self.fetch_one("review", (recipe_id, user_id))
+
+    def create_review(self, recipe_id, user_id, rating, review_text):
+        """Insert a review and add its rating to the recipe's summary"""
+        self.write("insert_review", (recipe_id, user_id, rating, review_text))
+        self._change_rating(recipe_id, None, rating)
+
+    def update_review(self, recipe_id, user_id, rating, review_text):
+        """
+        Change a review and move its rating in the recipe's summary.
+        Returns:
+            bool: False when the user has not reviewed the recipe
+        """
+        # Lock the review so two updates cannot both subtract the same old rating
+        old = self.fetch_one("review_for_update", (recipe_id, user_id))
+        if old is None:
+            return False
+        self.write("update_review", (rating, review_text, recipe_id, user_id))
+        self._change_rating(recipe_id, old["rating"], rating)
+        return True
+
+    def get_reviews_page(self, recipe_id, before, limit):
+        """Up to limit reviews older than before ((created_at, user_id), None for the first page), newest first"""
+        if before is None:
+            return self.fetch_all("reviews_first_page", (recipe_id, limit))
+        created_at, user_id = before
+        return self.fetch_all("reviews_page_before", (recipe_id, created_at, created_at, user_id, limit))
+
+    def get_rating_summary(self, recipe_id):
+        return self.fetch_one("rating_summary", (recipe_id,))
+
+    def get_top_rated(self, min_reviews, limit):
+        """Recipes with at least min_reviews reviews, best average first"""
+        return self.fetch_all("top_rated", (min_reviews, limit))
+
+    def _change_rating(self, recipe_id, old_rating, new_rating):
+        """Move a recipe's rating summary from old_rating to new_rating (None = no rating)"""
+        if old_rating == new_rating:
+            return
+        if old_rating is None:
+            self.write("add_rating_to_summary", (recipe_id, new_rating, new_rating) + _rating_histogram(new_rating, 1))
+            return
+        histogram = tuple(
+            removed + added
+            for removed, added in zip(_rating_histogram(old_rating, -1), _rating_histogram(new_rating, 1))
+        )
+        self.write(
+            "change_rating_in_summary",
+            (0 if new_rating is not None else -1, (new_rating or 0) - old_rating) + histogram + (recipe_id,)
+        )
+
+
+def ingredient_key(name):
+    """
+    Key for the names of one request: lookups return {ingredient_key(requested name): ingredient_id}.
+    MySQL's accent-insensitive comparison is left to MySQL, see _select_ingredient_ids
+    """
+    return name.lower()
+
+
+def _names_by_key(names):
+    unique = {}
+    for name in names:
+        unique.setdefault(ingredient_key(name), name)
+    return unique
+
+
+def _unique_names(names):
+    return list(_names_by_key(names).values())
+
+
+def _placeholders(count):
+    return ", ".join(["%s"] * count)
+
+
+def _rating_histogram(rating, sign):
+    """sign in the histogram bucket of rating (1-5), zeros elsewhere"""
+    return tuple(sign if rating == stars else 0 for stars in range(1, 6))
+
+
+@contextmanager
+def session():
+    """
+    Check out a pooled connection and wrap it in a Repository.
+    Commits when the block finishes, rolls back if it raises, and always
+    returns the connection to the pool.
+    """
+    conn = get_db_connection()
+    try:
+        yield Repository(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
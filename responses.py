@@ -0,0 +1,119 @@
+#contains the orjson backed JSON provider and the gzip/brotli compression of large responses
+import gzip
+import os
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, only gzip is offered without it
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 5))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 4))
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain", "text/html", "text/csv"}
+# Suffix added to a strong ETag per content coding, the compressed body is a different representation
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider with orjson doing the encoding and decoding.
+    Output matches DefaultJSONProvider: sorted keys, compact separators
+    (indented in debug mode), Decimal as a string and dates as HTTP dates.
+    Anything orjson cannot encode (e.g. integers above 64 bits) falls back
+    to the stdlib encoder.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.keys() - {"separators"}:
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._orjson_dumps(obj).decode("utf-8")
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = self._orjson_dumps(obj) + b"\n"
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+    def _orjson_dumps(self, obj):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
+
+
+def compress_response(response):
+    """
+    after_request hook: gzip or brotli compress bodies of at least
+    COMPRESS_MIN_SIZE bytes when the client accepts it. Streamed responses
+    (e.g. Server-Sent Events) are left alone so events are not held back.
+    """
+    response.vary.add("Accept-Encoding")
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    coding = _negotiate_coding()
+    if coding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    if coding == "br":
+        compressed = brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = coding
+
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag + ETAG_SUFFIXES[coding], weak)
+    return response
+
+
+def matching_etag(etag):
+    """
+    Return the variant of etag that If-None-Match holds, or None: etag as is or with the
+    content coding suffix compress_response() adds. A 304 must repeat that variant, the
+    validator the client's cached representation came with; if several match, the one
+    for the coding negotiated from Accept-Encoding wins.
+    """
+    coding = _negotiate_coding()
+    preferred = ETAG_SUFFIXES[coding] if coding is not None else ""
+    for suffix in (preferred, "") + tuple(ETAG_SUFFIXES.values()):
+        if request.if_none_match.contains(etag + suffix):
+            return etag + suffix
+    return None
+
+
+def _negotiate_coding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"] > 0:
+        return "br"
+    if accepted["gzip"] > 0:
+        return "gzip"
+    return None